@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'game.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -130,3 +132,77 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Same output as DRF's JSONRenderer, encoded with orjson when it is installed.
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'game.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+
+# Cache
+# The ETag version counters and the crop catalog version (game.versions,
+# game.catalog) must be seen by every worker and management command, so the
+# default cache has to be shared; a per-process LocMemCache fails the
+# game.E001 system check. Set REDIS_URL to use Redis (needs the redis
+# package), as production should: otherwise the database cache is used, which
+# needs no extra service but costs a query per lookup, so each request pays one
+# per counter it reads (farm id, farm version, catalog and market versions),
+# and a miss or bump costs several. Migration game 0021 creates its table.
+# It keeps one entry per farm and per user, so the default limit of 300
+# entries would keep culling live counters.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'game_cache',
+            'OPTIONS': {'MAX_ENTRIES': 1_000_000},
+        }
+    }
+
+
+# Game
+
+# Set to True while `manage.py rotate_contracts` is running. The home page and
+# /api/contracts/ then only read contracts instead of rotating them per request.
+GAME_CONTRACT_SCHEDULER = False
+
+# Record per-view latency and SQL metrics, add Server-Timing headers and serve
+# them in Prometheus format at /api/metrics/.
+GAME_REQUEST_METRICS = False
+
+# Bearer token a Prometheus scraper sends to read /api/metrics/; staff users
+# can read it when logged in. None lets only staff in.
+GAME_METRICS_TOKEN = None
+
+# Serve the polled read endpoints (farm, plots, inventory, contracts, crop
+# types, market board) with the async views in game.async_views. Turn on when
+# running under an ASGI server; under WSGI the sync views are cheaper.
+GAME_ASYNC_READS = False
+
+# Harvests append inventory deltas instead of updating InventoryItem rows;
+# run `manage.py flush_inventory` to fold them in (see game.inventory).
+GAME_INVENTORY_WRITE_BEHIND = False
+
+# NPCs pay less for crops players have been selling them in bulk, and no more
+# than the market price (see game.pricing). With it off they pay base_price.
+GAME_DYNAMIC_NPC_PRICES = False
+
+# Seconds until a new market listing expires and its unsold stock returns to
+# the seller, or None to keep listings open until sold. Expired and sold
+# listings are closed and archived by `manage.py compact_listings`.
+GAME_LISTING_TTL = 24 * 60 * 60
+
+# Seconds ledger balance snapshots are kept for. Older ones are deleted by
+# `manage.py snapshot_balances` once a later snapshot supersedes them.
+GAME_SNAPSHOT_RETENTION = 7 * 24 * 60 * 60
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from .grid import rebuild_grid
 from .models import Contract, Farm, CropType, InventoryItem, Plot
 
 # Register your models here.
@@ -15,6 +16,21 @@ class PlotAdmin(admin.ModelAdmin):
     list_display = ['id', 'farm', 'x', 'y', 'crop_type', 'planted_at', 'harvest_ready_at']
     list_filter = ['farm']
 
+    # keep the packed grids in step with plots edited here
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        rebuild_grid(obj.farm_id)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        rebuild_grid(obj.farm_id)
+
+    def delete_queryset(self, request, queryset):
+        farm_ids = set(queryset.values_list('farm_id', flat=True))
+        super().delete_queryset(request, queryset)
+        for farm_id in farm_ids:
+            rebuild_grid(farm_id)
+
 @admin.register(InventoryItem)
 class InventoryItemAdmin(admin.ModelAdmin):
     list_display = ['id', 'farm', 'crop_type', 'quantity']
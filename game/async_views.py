@@ -0,0 +1,226 @@
+"""
+Async versions of the polled read endpoints, for ASGI deployments.
+
+Under ``GAME_ASYNC_READS`` the URLs of ``farm_me``, ``plot_list``,
+``inventory_list``, ``contract_list``, ``crop_type_list`` and the market board
+GET are served by the views here instead of the DRF ones in ``game.views``.
+They read through the async ORM, the async cache API and the async variants
+of the grid, board, catalog and pagination helpers, so a worker waiting on
+the database for one poller is free to serve the next instead of holding a
+thread per request. Responses are byte for byte what the sync views return,
+ETags and ``304 Not Modified`` included.
+
+Writes stay sync: ``POST /api/market/listings/`` is handed to the DRF view in
+a thread, as are contract rotation and ledger and inventory settlement when
+there is anything to do. Requests are authenticated by DRF's configured
+authenticators, as the sync views are: a session is read asynchronously, and
+other credentials are checked in a thread.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.views.decorators.cache import cache_control
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.authentication import BasicAuthentication, SessionAuthentication, TokenAuthentication
+from rest_framework.exceptions import APIException, AuthenticationFailed, MethodNotAllowed, NotAuthenticated
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from . import views
+from .board import aboard_listings
+from .catalog import aget_catalog
+from .grid import agrid_plots
+from .inventory import settle_inventory
+from .ledger import settle_pending
+from .models import (
+    Contract, Farm, InventoryDelta, InventoryItem, LedgerEntry, acurrent_contracts_for_farm, ensure_contracts_for_farm,
+)
+from .pagination import apaginate
+from .renderers import FastJSONRenderer
+from .serializers import ContractRows, FarmSerializer, InventoryItemRows, MarketListingRows, PlotRows
+from .versions import afarm_id_for_user, afarm_version, amarket_version, etag
+
+
+# DRF's own authenticators that only look at the Authorization header
+HEADER_AUTHENTICATORS = (BasicAuthentication, TokenAuthentication)
+
+
+def _json(data, status=status.HTTP_200_OK):
+    return HttpResponse(FastJSONRenderer().render(data), content_type='application/json', status=status)
+
+
+def _error(exc):
+    return _json({'detail': exc.detail}, exc.status_code)
+
+
+async def _authenticate(request, authenticators):
+    """The user DRF's ``authenticators`` find for ``request``, or AnonymousUser."""
+    if authenticators and isinstance(authenticators[0], SessionAuthentication):
+        # DRF tries the session first; request.user would load it synchronously
+        user = await request.auser()
+        if user.is_authenticated or 'Authorization' not in request.headers and all(
+            isinstance(authenticator, HEADER_AUTHENTICATORS) for authenticator in authenticators[1:]
+        ):
+            return user
+    drf_request = Request(request, authenticators=authenticators)
+    return await sync_to_async(lambda: drf_request.user)()
+
+
+def _auth_error(request, authenticators, exc):
+    # as APIView.handle_exception: 401 with a challenge when the first authenticator offers one, else 403
+    header = authenticators[0].authenticate_header(Request(request)) if authenticators else None
+    response = _error(exc)
+    if header:
+        response.status_code = status.HTTP_401_UNAUTHORIZED
+        response['WWW-Authenticate'] = header
+    else:
+        response.status_code = status.HTTP_403_FORBIDDEN
+    return response
+
+
+def read_view(etag_func=None, login_required=True):
+    """
+    The parts of ``@api_view(['GET'])``, ``IsAuthenticated`` and
+    ``@condition`` these views need: other methods get a 405, anonymous
+    users DRF's 401 or 403 (when ``login_required``), and API errors such as
+    a bad ``?fields=`` their usual JSON body. ``etag_func`` is awaited with the
+    request and the signed-in user; a client that already has that ETag gets
+    a 304 without the view running. The view is called with the user.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return _error(MethodNotAllowed(request.method))
+            authenticators = [auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+            try:
+                user = await _authenticate(request, authenticators)
+                if login_required and not user.is_authenticated:
+                    raise NotAuthenticated
+            except (AuthenticationFailed, NotAuthenticated) as exc:
+                return _auth_error(request, authenticators, exc)
+            tag = None
+            try:
+                tag = await etag_func(request, user) if etag_func else None
+                response = get_conditional_response(request, etag=tag) if tag else None
+                if response is None:
+                    response = await view(request, user, *args, **kwargs)
+            except APIException as exc:
+                response = _error(exc)
+            if tag:
+                response.headers.setdefault('ETag', tag)
+            return response
+        return wrapper
+    return decorator
+
+
+async def _farm_id(user):
+    farm_id = await afarm_id_for_user(user)
+    if farm_id is None:
+        raise Farm.DoesNotExist('Farm matching query does not exist.')
+    return farm_id
+
+
+async def _farm_etag(request, user):
+    farm_id = await afarm_id_for_user(user)
+    if farm_id is None:
+        return None
+    return etag(request, farm_id, await afarm_version(farm_id))
+
+
+async def _contract_crop_ids(farm_id):
+    return sorted({
+        crop_type_id async for crop_type_id in
+        Contract.objects.filter(farm_id=farm_id, completed_at__isnull=True).values_list('crop_type_id', flat=True)
+    })
+
+
+async def _market_etag(request, user):
+    farm_id = await afarm_id_for_user(user)
+    if farm_id is None:
+        return None
+    version = await amarket_version()
+    return etag(request, farm_id, version, *await _contract_crop_ids(farm_id))
+
+
+# Polled endpoints, revalidated against the same version counters as the sync views.
+@cache_control(private=True, no_cache=True)
+@read_view(_farm_etag)
+async def farm_me(request, user):
+    farm_id = await _farm_id(user)
+    if await LedgerEntry.objects.filter(farm_id=farm_id, settled=False).aexists():
+        await sync_to_async(settle_pending)([farm_id])
+    farm = await Farm.objects.aget(id=farm_id)
+    return _json(FarmSerializer(farm).data)
+
+
+async def _catalog_etag(request, user):
+    return views.crop_types_payload(await aget_catalog(), request.GET)[0]
+
+
+@read_view(_catalog_etag, login_required=False)
+async def crop_type_list(request, user):
+    return HttpResponse(views.crop_types_payload(await aget_catalog(), request.GET)[1],
+                        content_type='application/json')
+
+
+@cache_control(private=True, no_cache=True)
+@read_view(_farm_etag)
+async def plot_list(request, user):
+    farm = await Farm.objects.select_related('grid').aget(id=await _farm_id(user))
+    try:
+        region = views._parse_region(request.GET, farm.grid_size)
+    except ValueError:
+        return _json({'detail': 'x0, y0, x1 and y1 must be integers with x0 <= x1 and y0 <= y1.'},
+                     status.HTTP_400_BAD_REQUEST)
+    catalog = await aget_catalog()
+    page = await apaginate(await agrid_plots(farm, region=region, catalog=catalog), request.GET, ('y', 'x'))
+    return _json(page.body(PlotRows(request, catalog).data_from_objects(page.rows)))
+
+
+@cache_control(private=True, no_cache=True)
+@read_view(_farm_etag)
+async def inventory_list(request, user):
+    farm_id = await _farm_id(user)
+    if settings.GAME_INVENTORY_WRITE_BEHIND and await InventoryDelta.objects.filter(farm_id=farm_id).aexists():
+        await sync_to_async(settle_inventory)([farm_id], skip_locked=False)
+    rows = InventoryItemRows(request, await aget_catalog())
+    items = rows.values(InventoryItem.objects.filter(farm_id=farm_id), 'crop_type_id')
+    page = await apaginate(items, request.GET, ('crop_type_id',))
+    return _json(page.body(rows.data(page.rows)))
+
+
+@read_view()
+async def contract_list(request, user):
+    farm = await Farm.objects.aget(id=await _farm_id(user))
+    catalog = await aget_catalog()
+    if settings.GAME_CONTRACT_SCHEDULER:
+        contracts = await acurrent_contracts_for_farm(farm, catalog)
+    else:
+        # rotating expired contracts writes, so it stays sync
+        contracts = await sync_to_async(ensure_contracts_for_farm)(farm)
+    return _json(ContractRows(request, catalog).data_from_objects(contracts))
+
+
+@read_view(_market_etag)
+async def _market_board(request, user):
+    farm_id = await _farm_id(user)
+    listings = await aboard_listings(await _contract_crop_ids(farm_id), exclude_seller=farm_id)
+    page = await apaginate(listings, request.GET, ('unit_price', 'id'))
+    return _json(page.body(MarketListingRows(request, await aget_catalog()).data(page.rows)))
+
+
+_create_listing = sync_to_async(views.market_create_listing)
+
+
+# the DRF view checks CSRF itself for session-authenticated POSTs
+@csrf_exempt
+@cache_control(private=True, no_cache=True)
+async def market_create_listing(request):
+    if request.method in ('GET', 'HEAD'):
+        return await _market_board(request)
+    return await _create_listing(request)
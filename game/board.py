@@ -0,0 +1,164 @@
+"""
+Shared in-memory cache of the market board.
+
+Every player's board shows the open listings for the crops of their open
+contracts, minus their own, cheapest first. Most players share the same few
+crops, so instead of one listing query per player and poll, each process keeps
+a ``CropBoard`` per crop type holding that crop's open listings as sorted
+``values()`` rows, and boards are merged and filtered per player in memory.
+
+Listings created, bought or traded through this process update the boards
+incrementally once their transaction commits. Changes made by other processes
+are picked up when a board is reloaded, which happens once it is older than
+``GAME_MARKET_BOARD_MAX_AGE`` seconds, or at once when the market epoch moves
+(listings expired by a background command).
+"""
+import heapq
+import threading
+import time
+from bisect import insort
+
+from django.conf import settings
+
+from .models import MarketListing
+from .versions import amarket_epoch, market_epoch
+
+# the columns MarketListingRows reads, plus the seller id for filtering
+COLUMNS = ('id', 'seller_id', 'seller__name', 'crop_type_id', 'quantity', 'unit_price', 'active', 'created_at')
+
+
+def _key(row):
+    return row['unit_price'], row['id']
+
+
+class CropBoard:
+    def __init__(self, crop_type_id):
+        self.crop_type_id = crop_type_id
+        self.lock = threading.Lock()
+        self.loaded_at = 0.0
+        self.epoch = None
+        # replaced on every change, never mutated, so readers need no lock
+        self.rows = []
+
+    def stale(self, epoch):
+        return (
+            epoch != self.epoch
+            or time.monotonic() - self.loaded_at > getattr(settings, 'GAME_MARKET_BOARD_MAX_AGE', 5)
+        )
+
+    def query(self):
+        return (
+            MarketListing.objects.filter(crop_type_id=self.crop_type_id, active=True, quantity__gt=0)
+            .order_by('unit_price', 'id').values(*COLUMNS)
+        )
+
+    def load(self, epoch):
+        self._loaded(list(self.query()), epoch)
+
+    async def aload(self, epoch):
+        self._loaded([row async for row in self.query()], epoch)
+
+    def _loaded(self, rows, epoch):
+        with self.lock:
+            self.rows = rows
+            self.loaded_at = time.monotonic()
+            self.epoch = epoch
+
+    def add(self, row):
+        with self.lock:
+            # a reload that ran after the listing committed already has it
+            if any(existing['id'] == row['id'] for existing in self.rows):
+                return
+            rows = list(self.rows)
+            insort(rows, row, key=_key)
+            self.rows = rows
+
+    def sold(self, listing_id, quantity):
+        with self.lock:
+            rows = []
+            for row in self.rows:
+                if row['id'] == listing_id:
+                    if row['quantity'] <= quantity:
+                        continue
+                    row = dict(row, quantity=row['quantity'] - quantity)
+                rows.append(row)
+            self.rows = rows
+
+
+_boards = {}
+_boards_lock = threading.Lock()
+
+
+def _board(crop_type_id):
+    with _boards_lock:
+        board = _boards.get(crop_type_id)
+        if board is None:
+            board = _boards[crop_type_id] = CropBoard(crop_type_id)
+    return board
+
+
+def get_board(crop_type_id, epoch=None):
+    """
+    Return the process-wide board for ``crop_type_id``, (re)loading it when it
+    is missing or stale. ``epoch`` is the current market epoch, if already read.
+    """
+    if epoch is None:
+        epoch = market_epoch()
+    board = _board(crop_type_id)
+    if board.stale(epoch):
+        board.load(epoch)
+    return board
+
+
+async def aget_board(crop_type_id, epoch=None):
+    """``get_board`` for async views."""
+    if epoch is None:
+        epoch = await amarket_epoch()
+    board = _board(crop_type_id)
+    if board.stale(epoch):
+        await board.aload(epoch)
+    return board
+
+
+def board_listings(crop_type_ids, exclude_seller=None):
+    """Open listings for ``crop_type_ids`` in ``(unit_price, id)`` order, leaving out ``exclude_seller``'s."""
+    epoch = market_epoch()
+    return _merge([get_board(crop_type_id, epoch).rows for crop_type_id in crop_type_ids], exclude_seller)
+
+
+async def aboard_listings(crop_type_ids, exclude_seller=None):
+    """``board_listings`` for async views."""
+    epoch = await amarket_epoch()
+    return _merge([(await aget_board(crop_type_id, epoch)).rows for crop_type_id in crop_type_ids], exclude_seller)
+
+
+def _merge(boards, exclude_seller):
+    return [row for row in heapq.merge(*boards, key=_key) if row['seller_id'] != exclude_seller]
+
+
+def board_add(listing):
+    """Add a newly created listing (with its seller loaded) to its crop's board if that board is loaded."""
+    board = _boards.get(listing.crop_type_id)
+    if board is not None:
+        board.add({
+            'id': listing.id,
+            'seller_id': listing.seller_id,
+            'seller__name': listing.seller.name,
+            'crop_type_id': listing.crop_type_id,
+            'quantity': listing.quantity,
+            'unit_price': listing.unit_price,
+            'active': listing.active,
+            'created_at': listing.created_at,
+        })
+
+
+def board_sold(crop_type_id, listing_id, quantity):
+    """Take ``quantity`` off a listing on its crop's board, dropping it once nothing is left."""
+    board = _boards.get(crop_type_id)
+    if board is not None:
+        board.sold(listing_id, quantity)
+
+
+def reset_boards():
+    with _boards_lock:
+        _boards.clear()
@@ -0,0 +1,98 @@
+"""
+Process-local cache of the CropType catalog.
+
+Crop types are reference data that changes only through the admin, so each
+process keeps one ``CropCatalog`` built from a single query together with the
+serialized form of every crop type. Saving or deleting a CropType replaces the
+version token stored in the shared default cache (see ``game.signals`` and
+``game.checks``); every process compares its catalog against that token and
+rebuilds only when it has changed, so an unknown id is simply not found.
+
+Each ``get_catalog`` call reads the token from the cache, so code serializing
+many rows gets the catalog once and passes it on.
+"""
+import hashlib
+import threading
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.http import Http404
+from rest_framework.renderers import JSONRenderer
+
+from .models import CropType
+
+CATALOG_VERSION_KEY = 'game:crop-catalog-version'
+
+
+class CropCatalog:
+    def __init__(self, version, crop_types):
+        from .serializers import CropTypeSerializer
+
+        self.version = version
+        self.crop_types = crop_types
+        self.by_id = {crop.id: crop for crop in crop_types}
+        self.by_name = {crop.name: crop for crop in crop_types}
+        self.serialized = {crop.id: dict(CropTypeSerializer(crop).data) for crop in crop_types}
+        self.payload = JSONRenderer().render([self.serialized[crop.id] for crop in crop_types])
+        self.etag = '"crop-types-%s"' % hashlib.md5(self.payload).hexdigest()
+
+
+_catalog = None
+_lock = threading.Lock()
+
+
+def get_catalog():
+    """Return the current catalog, rebuilding it if another process changed it."""
+    global _catalog
+    version = cache.get_or_set(CATALOG_VERSION_KEY, _new_version, None)
+    catalog = _catalog
+    if catalog is None or catalog.version != version:
+        with _lock:
+            catalog = CropCatalog(version, list(CropType.objects.order_by('id')))
+            _catalog = catalog
+    return catalog
+
+
+async def aget_catalog():
+    """``get_catalog`` for async views; a rebuild queries the database, so it runs in a thread."""
+    version = await cache.aget_or_set(CATALOG_VERSION_KEY, _new_version, None)
+    catalog = _catalog
+    if catalog is None or catalog.version != version:
+        catalog = await sync_to_async(get_catalog)()
+    return catalog
+
+
+def get_crop_type(crop_type_id, catalog=None):
+    """Return the cached CropType with ``crop_type_id``, or ``None``."""
+    try:
+        crop_type_id = int(crop_type_id)
+    except (TypeError, ValueError):
+        return None
+    return (catalog or get_catalog()).by_id.get(crop_type_id)
+
+
+def get_crop_type_or_404(crop_type_id):
+    crop = get_crop_type(crop_type_id)
+    if crop is None:
+        raise Http404('No CropType matches the given query.')
+    return crop
+
+
+def serialized_crop_type(crop_type_id, catalog=None):
+    """Return the serialized form of a crop type, as CropTypeSerializer would produce it, or ``None``."""
+    catalog = catalog or get_catalog()
+    crop = get_crop_type(crop_type_id, catalog)
+    if crop is None:
+        return None
+    return dict(catalog.serialized[crop.id])
+
+
+def invalidate_catalog():
+    global _catalog
+    _catalog = None
+    cache.set(CATALOG_VERSION_KEY, _new_version(), None)
+
+
+def _new_version():
+    return uuid.uuid4().hex
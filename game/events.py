@@ -0,0 +1,112 @@
+"""
+Publish/subscribe for the live update stream.
+
+Views publish events on named channels (one per farm plus a shared market
+channel) and each open ``/api/events/`` stream holds a subscription. The
+default ``InProcessBroker`` only reaches streams served by the same process;
+point ``GAME_EVENT_BROKER`` at another class with the same ``subscribe`` and
+``publish`` methods to fan out across processes.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import Farm
+
+MARKET_CHANNEL = 'market'
+
+
+def farm_channel(farm_id):
+    return f'farm:{farm_id}'
+
+
+class Subscription:
+    """Queue of ``(event, data)`` messages for one stream, bound to its event loop."""
+
+    def __init__(self, broker, channels, maxsize=100):
+        self.broker = broker
+        self.channels = tuple(channels)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def deliver(self, message):
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # the stream's loop has gone away
+            self.close()
+
+    def _put(self, message):
+        if self.queue.full():
+            # a stalled client loses its oldest updates rather than growing the queue
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self, timeout):
+        """Return the next message, or ``None`` if none arrives within ``timeout`` seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), max(timeout, 0))
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = defaultdict(set)
+
+    def subscribe(self, channels):
+        subscription = Subscription(self, channels)
+        with self._lock:
+            for channel in subscription.channels:
+                self._channels[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._channels.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._channels[channel]
+
+    def publish(self, channel, event, data):
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver((event, data))
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(getattr(settings, 'GAME_EVENT_BROKER', 'game.events.InProcessBroker'))()
+
+
+def publish(channel, event, data):
+    """Publish ``event`` once the current transaction (if any) commits."""
+    transaction.on_commit(lambda: get_broker().publish(channel, event, data))
+
+
+def publish_balances(farm_ids):
+    """Publish the committed balance of each farm in ``farm_ids``."""
+    def send():
+        broker = get_broker()
+        for farm_id, balance in Farm.objects.filter(id__in=farm_ids).values_list('id', 'balance'):
+            broker.publish(farm_channel(farm_id), 'balance', {'balance': balance})
+
+    transaction.on_commit(send)
+
+
+def format_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, cls=JSONEncoder)}\n\n'
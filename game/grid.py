@@ -0,0 +1,142 @@
+"""
+Packed per-farm grid state.
+
+Each farm has one ``FarmGrid`` row whose ``cells`` hold every plot as a fixed
+size record: ``(x, y, plot_id, crop_type_id, planted_at, harvest_ready_at)``,
+with both times in epoch microseconds and 0 for an empty plot. Reading a whole
+grid is a single row fetch (or none, when joined onto the farm with
+``select_related('grid')``). The ready time is the one stored on the Plot when
+it was planted, the same one harvesting checks, so a later change to a crop's
+grow time does not make the two disagree.
+
+Records are sorted by row, so a viewport of a large farm only decodes the
+rows it covers. Cells that were never planted have no Plot row and no record.
+
+``Plot`` rows stay the source of truth; views that change plots patch the
+grid in the same transaction with ``update_grid``.
+"""
+import struct
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .catalog import get_catalog
+from .models import FarmGrid, Plot
+
+CELL = struct.Struct('<HHqiqq')
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _micros(value):
+    return (value - EPOCH) // timedelta(microseconds=1) if value is not None else 0
+
+
+def pack_cells(cells):
+    """Pack ``(x, y, plot_id, crop_type_id, planted_us, ready_us)`` tuples in row order."""
+    return b''.join(CELL.pack(*cell) for cell in sorted(cells, key=lambda cell: (cell[1], cell[0])))
+
+
+def plot_cell(plot):
+    if not plot.crop_type_id:
+        return plot.x, plot.y, plot.id, 0, 0, 0
+    return plot.x, plot.y, plot.id, plot.crop_type_id, _micros(plot.planted_at), _micros(plot.harvest_ready_at)
+
+
+def build_grid(farm_id):
+    """Return a FarmGrid (unsaved) packed from the farm's Plot rows."""
+    plots = Plot.objects.filter(farm_id=farm_id).only('id', 'x', 'y', 'crop_type_id', 'planted_at', 'harvest_ready_at')
+    return FarmGrid(farm_id=farm_id, cells=pack_cells(plot_cell(plot) for plot in plots))
+
+
+def _row_offset(cells, y):
+    """Byte offset of the first record in row ``y`` or later."""
+    lo, hi = 0, len(cells) // CELL.size
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if struct.unpack_from('<H', cells, mid * CELL.size + 2)[0] < y:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo * CELL.size
+
+
+def decode_grid(farm, cells, now=None, region=None, catalog=None):
+    """
+    Turn packed cells back into unsaved Plot instances in row order, with crop
+    types from the catalog and ``ready`` set against a single ``now``.
+    ``region`` limits them to an inclusive ``(x0, y0, x1, y1)`` rectangle.
+    """
+    now = now or timezone.now()
+    by_id = (catalog or get_catalog()).by_id
+    if region is not None:
+        x0, y0, x1, y1 = region
+        cells = memoryview(cells)[_row_offset(cells, y0):_row_offset(cells, y1 + 1)]
+    plots = []
+    for x, y, plot_id, crop_type_id, planted_us, ready_us in CELL.iter_unpack(cells):
+        if region is not None and not x0 <= x <= x1:
+            continue
+        plot = Plot(id=plot_id, farm=farm, x=x, y=y)
+        crop = by_id.get(crop_type_id) if crop_type_id else None
+        plot.ready = False
+        if crop is not None:
+            plot.crop_type = crop
+            plot.planted_at = EPOCH + timedelta(microseconds=planted_us)
+            plot.harvest_ready_at = EPOCH + timedelta(microseconds=ready_us)
+            plot.ready = plot.harvest_ready_at <= now
+        plots.append(plot)
+    return plots
+
+
+def grid_plots(farm, now=None, region=None, catalog=None):
+    """
+    Return the farm's plots in row order from its packed grid, optionally
+    only those in ``region``, with crop types from ``catalog`` (by default the
+    current one). Uses the grid joined onto ``farm`` if it was loaded with
+    ``select_related('grid')``.
+    """
+    try:
+        grid = farm.grid
+    except FarmGrid.DoesNotExist:
+        # not built yet; the next plot change builds it
+        grid = build_grid(farm.id)
+    return decode_grid(farm, bytes(grid.cells), now, region, catalog)
+
+
+async def agrid_plots(farm, now=None, region=None, catalog=None):
+    """``grid_plots`` for async views, with crop types from ``catalog``."""
+    try:
+        cells = farm.grid.cells
+    except FarmGrid.DoesNotExist:
+        cells = (await sync_to_async(build_grid)(farm.id)).cells
+    return decode_grid(farm, bytes(cells), now, region, catalog)
+
+
+def rebuild_grid(farm_id):
+    """Repack the farm's grid from its Plot rows, for plots changed without ``update_grid``."""
+    FarmGrid.objects.update_or_create(farm_id=farm_id, defaults={'cells': build_grid(farm_id).cells})
+
+
+def update_grid(farm_id, plots):
+    """
+    Write the current state of ``plots`` into the farm's packed grid. Call
+    inside the transaction that changed them; the grid row stays locked until
+    it commits so concurrent updates for the same farm apply one at a time.
+    """
+    with transaction.atomic():
+        cells = FarmGrid.objects.select_for_update().filter(farm_id=farm_id).values_list('cells', flat=True).first()
+        if cells is None:
+            # built from Plot rows, which already include this transaction's changes
+            try:
+                with transaction.atomic():
+                    build_grid(farm_id).save(force_insert=True)
+                return
+            except IntegrityError:
+                # another request built it first; patch that one instead
+                cells = FarmGrid.objects.select_for_update().values_list('cells', flat=True).get(farm_id=farm_id)
+
+        by_cell = {(cell[0], cell[1]): cell for cell in CELL.iter_unpack(cells)}
+        for plot in plots:
+            by_cell[plot.x, plot.y] = plot_cell(plot)
+        FarmGrid.objects.filter(farm_id=farm_id).update(cells=pack_cells(by_cell.values()))
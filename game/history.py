@@ -0,0 +1,106 @@
+"""
+Market trade history and OHLC candles.
+
+Every market purchase appends its fills as ``Trade`` rows in the purchase's
+transaction (``log_trades``). ``rollup_trades``, run in the background by the
+``rollup_trades`` command, folds new trades into per-crop ``Candle`` rows for
+every ``Candle.Interval``: each pass reads the trades not yet ``rolled_up``,
+aggregates them in memory, writes every candle they touch with one upsert and
+flags the trades in the same transaction. Charts then read a range of candles
+off one index, however many trades the table holds.
+
+Trades are flagged rather than tracked by an id cursor because ids are handed
+out before their transactions commit: a trade that commits after one with a
+higher id is simply picked up by the next pass.
+"""
+from datetime import timezone as dt_timezone
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Candle, Trade, TradeRollup
+
+
+def log_trades(trades):
+    """Append ``orderbook.Execution`` tuples as Trade rows. Call inside the purchase's transaction."""
+    executed_at = timezone.now()
+    Trade.objects.bulk_create(
+        Trade(crop_type_id=trade.crop_type_id, listing_id=trade.listing_id, buyer_id=trade.buyer_id,
+              seller_id=trade.seller_id, quantity=trade.quantity, unit_price=trade.unit_price,
+              executed_at=executed_at)
+        for trade in trades
+    )
+
+
+def interval_start(when, interval):
+    """Start of the ``Candle.Interval`` containing ``when``, in UTC."""
+    when = when.astimezone(dt_timezone.utc).replace(second=0, microsecond=0)
+    if interval == Candle.Interval.MINUTE:
+        return when
+    when = when.replace(minute=0)
+    if interval == Candle.Interval.HOUR:
+        return when
+    return when.replace(hour=0)
+
+
+def rollup_trades(limit=10000):
+    """
+    Fold up to ``limit`` trades not yet rolled up into their candles, in one
+    transaction. Returns the number of trades folded in.
+    """
+    with transaction.atomic():
+        # one pass at a time, so concurrent passes neither fold the same trades twice
+        # nor overwrite each other's additions to a candle
+        TradeRollup.objects.select_for_update().get_or_create(id=1)
+        rows = list(
+            Trade.objects.filter(rolled_up=False)
+            .order_by('id')
+            .values_list('id', 'crop_type_id', 'quantity', 'unit_price', 'executed_at')[:limit]
+        )
+        if not rows:
+            return 0
+
+        candles = {}
+        for _, crop_type_id, quantity, unit_price, executed_at in rows:
+            for interval in Candle.Interval.values:
+                key = crop_type_id, interval, interval_start(executed_at, interval)
+                candle = candles.get(key)
+                if candle is None:
+                    candles[key] = Candle(
+                        crop_type_id=crop_type_id, interval=interval, starts_at=key[2],
+                        open=unit_price, high=unit_price, low=unit_price, close=unit_price,
+                        volume=quantity, value=quantity * unit_price, trades=1,
+                    )
+                    continue
+                candle.high = max(candle.high, unit_price)
+                candle.low = min(candle.low, unit_price)
+                candle.close = unit_price
+                candle.volume += quantity
+                candle.value += quantity * unit_price
+                candle.trades += 1
+
+        # candles that already have earlier trades keep their open
+        existing = Candle.objects.filter(
+            crop_type_id__in={key[0] for key in candles},
+            interval__in={key[1] for key in candles},
+            starts_at__in={key[2] for key in candles},
+        )
+        for old in existing:
+            candle = candles.get((old.crop_type_id, old.interval, old.starts_at))
+            if candle is None:
+                continue
+            candle.open = old.open
+            candle.high = max(candle.high, old.high)
+            candle.low = min(candle.low, old.low)
+            candle.volume += old.volume
+            candle.value += old.value
+            candle.trades += old.trades
+
+        Candle.objects.bulk_create(
+            candles.values(),
+            update_conflicts=True,
+            unique_fields=['crop_type', 'interval', 'starts_at'],
+            update_fields=['open', 'high', 'low', 'close', 'volume', 'value', 'trades'],
+        )
+        Trade.objects.filter(id__in=[row[0] for row in rows]).update(rolled_up=True)
+    return len(rows)
@@ -0,0 +1,151 @@
+"""
+Write-behind inventory for harvests.
+
+Each harvest normally upserts the farm's InventoryItem row for the crop, so a
+player clicking through a field writes the same few rows over and over. With
+``GAME_INVENTORY_WRITE_BEHIND`` on, harvests append an ``InventoryDelta``
+instead, in the same transaction that clears the plot, and
+``settle_inventory`` later folds all pending deltas into their items with one
+multi-row upsert. The ``flush_inventory`` command runs it every few hundred
+milliseconds.
+
+Deltas are rows rather than process memory, so a crash loses nothing: a
+harvest either committed its delta or did not happen, and a flush either
+applied and deleted its deltas or left them for the next one. The acting farm
+reads its own writes: harvest responses include its pending deltas, and its
+inventory is settled before it is listed or spent.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .models import InventoryDelta, InventoryItem
+from .mutations import add_inventory
+
+
+def add_harvest(farm, quantities):
+    """
+    Add harvested ``{crop_type_id: quantity}`` to the farm's inventory, and
+    return its InventoryItems for those crops with their new quantities. Call
+    inside the transaction that clears the plots.
+
+    With write-behind on this writes only the deltas, plus one read for the
+    quantities; an item no flush has created yet is returned without an id.
+    """
+    if not settings.GAME_INVENTORY_WRITE_BEHIND:
+        items = []
+        for crop_type_id, quantity in quantities.items():
+            item_id, quantity = add_inventory(farm.id, crop_type_id, quantity)
+            items.append(InventoryItem(id=item_id, farm=farm, crop_type_id=crop_type_id, quantity=quantity))
+        return items
+
+    InventoryDelta.objects.bulk_create(
+        InventoryDelta(farm=farm, crop_type_id=crop_type_id, quantity=quantity)
+        for crop_type_id, quantity in quantities.items()
+    )
+    # these deltas are not committed yet, so no flush can have folded them: every crop has a pending row,
+    # and one statement sees each item and its pending deltas either side of any concurrent flush
+    item = InventoryItem.objects.filter(farm=farm, crop_type_id=OuterRef('crop_type_id'))
+    rows = (
+        InventoryDelta.objects.filter(farm=farm, crop_type_id__in=list(quantities))
+        .values('crop_type_id')
+        .annotate(
+            pending=Sum('quantity'),
+            item_id=Subquery(item.values('id')),
+            settled=Coalesce(Subquery(item.values('quantity')), 0),
+        )
+        .values_list('crop_type_id', 'item_id', 'settled', 'pending')
+    )
+    items = {
+        crop_type_id: InventoryItem(id=item_id, farm=farm, crop_type_id=crop_type_id, quantity=settled + pending)
+        for crop_type_id, item_id, settled, pending in rows
+    }
+    return [items[crop_type_id] for crop_type_id in quantities]
+
+
+def settle_inventory(farm_ids=None, limit=10000, skip_locked=True):
+    """
+    Fold pending deltas into their InventoryItems, for ``farm_ids`` or for
+    every farm, in one transaction. Returns the ids of the farms settled.
+
+    By default deltas another flush is already applying are skipped, which
+    suits the background flush. A farm about to read or spend its inventory
+    passes ``skip_locked=False`` to wait for them instead.
+    """
+    pending = InventoryDelta.objects.all()
+    if farm_ids is not None:
+        pending = pending.filter(farm_id__in=farm_ids)
+    if not pending.exists():
+        return []
+
+    totals = defaultdict(int)
+    with transaction.atomic():
+        rows = list(
+            pending.select_for_update(skip_locked=skip_locked)
+            .order_by('id')
+            .values_list('id', 'farm_id', 'crop_type_id', 'quantity')[:limit]
+        )
+        for _, farm_id, crop_type_id, quantity in rows:
+            totals[farm_id, crop_type_id] += quantity
+        if not totals:
+            return []
+
+        add_items(totals)
+        InventoryDelta.objects.filter(id__in=[row[0] for row in rows]).delete()
+    return sorted({farm_id for farm_id, _ in totals})
+
+
+def add_items(totals):
+    """
+    Add ``{(farm_id, crop_type_id): quantity}`` to InventoryItems with one
+    multi-row upsert, locking the items first. Call inside a transaction.
+    """
+    items = _items(totals, lock=True)
+    InventoryItem.objects.bulk_create(
+        [
+            InventoryItem(farm_id=farm_id, crop_type_id=crop_type_id,
+                          quantity=items[farm_id, crop_type_id].quantity + quantity)
+            for (farm_id, crop_type_id), quantity in totals.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['farm', 'crop_type'],
+        update_fields=['quantity'],
+    )
+
+
+def settle_farm_inventory(farm_id):
+    """Settle the farm's pending deltas before its inventory is read or spent, when write-behind is on."""
+    if settings.GAME_INVENTORY_WRITE_BEHIND:
+        settle_inventory([farm_id], skip_locked=False)
+
+
+def _items(keys, lock=False):
+    """
+    The InventoryItems for ``(farm_id, crop_type_id)`` ``keys``, creating
+    empty ones that are missing so that every one of them can be locked.
+    """
+    keys = set(keys)
+    # exactly these pairs, not every crop of every farm, so a lock covers no one else's items
+    pairs = Q()
+    for farm_id, crop_type_id in keys:
+        pairs |= Q(farm_id=farm_id, crop_type_id=crop_type_id)
+
+    def fetch():
+        items = InventoryItem.objects.filter(pairs)
+        if lock:
+            items = items.select_for_update().order_by('farm_id', 'crop_type_id')
+        return {(item.farm_id, item.crop_type_id): item for item in items}
+
+    items = fetch()
+    missing = keys - items.keys()
+    if missing:
+        # a concurrent harvest or purchase may create some of them first
+        InventoryItem.objects.bulk_create(
+            [InventoryItem(farm_id=farm_id, crop_type_id=crop_type_id) for farm_id, crop_type_id in missing],
+            ignore_conflicts=True,
+        )
+        items = fetch()
+    return items
@@ -0,0 +1,160 @@
+"""
+Append-only coin ledger.
+
+Every change to ``Farm.balance`` is also written as a ``LedgerEntry`` in the
+same transaction, so the ledger is the audit trail and ``Farm.balance`` is a
+running total of it. ``take_snapshots`` periodically stores the ledger
+balance of each farm with new entries, so ``balance_at`` only has to sum the
+entries written since the latest snapshot. ``prune_snapshots`` deletes the
+snapshots older than ``GAME_SNAPSHOT_RETENTION`` that a later one supersedes.
+
+Market sale proceeds are the exception: they are appended unsettled instead
+of being added to the seller's balance, so a trade never waits on (or locks)
+a popular seller's Farm row. ``settle_pending`` applies them, either from the
+``snapshot_balances`` job or when the seller next looks at or spends their
+balance.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DateTimeField, Exists, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .events import publish_balances
+from .models import BalanceSnapshot, Farm, LedgerEntry
+from .mutations import credit_balance, debit_balance
+
+# Snapshots are taken this far in the past so that entries created by
+# transactions still in flight are not missed.
+SNAPSHOT_LAG = timedelta(minutes=1)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def record(entries):
+    """Append ``entries``, skipping any that move no coins."""
+    entries = [entry for entry in entries if entry.amount]
+    if entries:
+        LedgerEntry.objects.bulk_create(entries)
+
+
+def settle_pending(farm_ids=None, limit=10000):
+    """
+    Add unsettled entries to their farms' balances, for ``farm_ids`` or for
+    every farm. Returns the ids of the farms whose balance changed.
+    """
+    pending = LedgerEntry.objects.filter(settled=False)
+    if farm_ids is not None:
+        pending = pending.filter(farm_id__in=farm_ids)
+    if not pending.exists():
+        return []
+
+    totals = defaultdict(int)
+    with transaction.atomic():
+        # skip entries another settler is already applying
+        rows = list(
+            pending.select_for_update(skip_locked=True)
+            .order_by('id')
+            .values_list('id', 'farm_id', 'amount')[:limit]
+        )
+        for _, farm_id, amount in rows:
+            totals[farm_id] += amount
+        for farm_id in sorted(totals):
+            credit_balance(farm_id, totals[farm_id])
+        LedgerEntry.objects.filter(id__in=[row[0] for row in rows]).update(settled=True)
+
+    publish_balances(list(totals))
+    return sorted(totals)
+
+
+def debit(farm_id, amount):
+    """
+    Like ``debit_balance``, but if the farm comes up short its pending
+    credits are settled and the debit is tried again.
+    """
+    balance = debit_balance(farm_id, amount)
+    if balance is None and settle_pending([farm_id]):
+        balance = debit_balance(farm_id, amount)
+    return balance
+
+
+def balance_at(farm, when):
+    """Return the farm's ledger balance as of ``when``, settled or not."""
+    farm_id = getattr(farm, 'pk', farm)
+    entries = LedgerEntry.objects.filter(farm_id=farm_id, created_at__lte=when)
+    snapshot = (
+        BalanceSnapshot.objects.filter(farm_id=farm_id, taken_at__lte=when)
+        .order_by('-taken_at')
+        .values_list('balance', 'taken_at')
+        .first()
+    )
+    balance = 0
+    if snapshot is not None:
+        balance, taken_at = snapshot
+        entries = entries.filter(created_at__gt=taken_at)
+    return balance + (entries.aggregate(total=Sum('amount'))['total'] or 0)
+
+
+def take_snapshots(taken_at=None, batch_size=1000):
+    """
+    Snapshot the ledger balance as of ``taken_at`` (by default
+    ``SNAPSHOT_LAG`` ago) of every farm with entries since its latest
+    snapshot. Each batch of farms costs one aggregate query and one insert.
+    Returns the number of snapshots written.
+    """
+    if taken_at is None:
+        taken_at = timezone.now() - SNAPSHOT_LAG
+
+    latest = BalanceSnapshot.objects.filter(farm=OuterRef('pk'), taken_at__lte=taken_at).order_by('-taken_at')
+    since = LedgerEntry.objects.filter(
+        farm=OuterRef('pk'),
+        created_at__gt=OuterRef('snapshot_at'),
+        created_at__lte=taken_at,
+    ).values('farm').annotate(total=Sum('amount')).values('total')
+    farms = Farm.objects.annotate(
+        snapshot_balance=Coalesce(Subquery(latest.values('balance')[:1]), Value(0)),
+        snapshot_at=Coalesce(
+            Subquery(latest.values('taken_at')[:1]),
+            Value(EPOCH, output_field=DateTimeField()),
+        ),
+        since_total=Subquery(since, output_field=IntegerField()),
+    ).filter(since_total__isnull=False).order_by('id')
+
+    written = 0
+    last_id = 0
+    while True:
+        rows = list(
+            farms.filter(id__gt=last_id).values_list('id', 'snapshot_balance', 'since_total')[:batch_size]
+        )
+        if not rows:
+            return written
+        BalanceSnapshot.objects.bulk_create(
+            BalanceSnapshot(farm_id=farm_id, balance=balance + total, taken_at=taken_at)
+            for farm_id, balance, total in rows
+        )
+        written += len(rows)
+        last_id = rows[-1][0]
+
+
+def prune_snapshots(now=None, batch_size=1000):
+    """
+    Delete snapshots older than ``GAME_SNAPSHOT_RETENTION`` seconds that a
+    later snapshot, also older, supersedes, a batch at a time. Each farm keeps
+    its latest snapshot before the cutoff, so ``balance_at`` stays cheap for
+    every time since. Returns the number of snapshots deleted.
+    """
+    cutoff = (now or timezone.now()) - timedelta(seconds=settings.GAME_SNAPSHOT_RETENTION)
+    superseded = BalanceSnapshot.objects.filter(taken_at__lt=cutoff).filter(Exists(
+        BalanceSnapshot.objects.filter(
+            farm=OuterRef('farm'), taken_at__gt=OuterRef('taken_at'), taken_at__lte=cutoff,
+        )
+    ))
+    deleted = 0
+    while True:
+        ids = list(superseded.order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += BalanceSnapshot.objects.filter(id__in=ids).delete()[0]
@@ -0,0 +1,90 @@
+"""
+Listing expiry and compaction.
+
+New listings expire ``GAME_LISTING_TTL`` seconds after they are created.
+``expire_listings`` closes open listings past their ``expires_at`` a batch at
+a time and returns their unsold stock to the sellers' inventories with one
+multi-row upsert per batch. It runs in a background command, so it signals
+the web processes through shared state: the sellers' farm versions and the
+market epoch, which makes every process reload its boards and order books.
+
+Sold, expired and cancelled listings are never shown again, so
+``compact_listings`` moves them to ``ArchivedListing`` and deletes them from
+``MarketListing``, leaving only open listings in the table every market query
+reads. Each batch is its own short transaction and skips rows another
+transaction has locked, so neither job holds locks for long or waits on a
+purchase in flight. The ``compact_listings`` command runs both.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .events import MARKET_CHANNEL, publish
+from .inventory import add_items
+from .models import OPEN_LISTING, ArchivedListing, MarketListing
+from .versions import changed
+
+
+def listing_expiry(now=None):
+    """When a listing created ``now`` expires, or ``None`` if listings do not."""
+    ttl = settings.GAME_LISTING_TTL
+    return (now or timezone.now()) + timedelta(seconds=ttl) if ttl else None
+
+
+def expire_listings(now=None, limit=1000):
+    """
+    Close up to ``limit`` open listings that have expired and give their
+    stock back to the sellers. Returns the number of listings closed.
+    """
+    with transaction.atomic():
+        # a purchase holding a listing's lock either sells it first or finds it closed
+        rows = list(
+            MarketListing.objects.filter(OPEN_LISTING, expires_at__lte=now or timezone.now())
+            .select_for_update(skip_locked=True)
+            .order_by('id')
+            .values_list('id', 'seller_id', 'crop_type_id', 'quantity')[:limit]
+        )
+        if not rows:
+            return 0
+        returned = defaultdict(int)
+        for _, seller_id, crop_type_id, quantity in rows:
+            returned[seller_id, crop_type_id] += quantity
+        add_items(returned)
+        MarketListing.objects.filter(id__in=[row[0] for row in rows]).update(active=False)
+        changed({seller_id for _, seller_id, _, _ in rows}, reload_market=True)
+        # reaches other processes' streams only through a shared GAME_EVENT_BROKER
+        for crop_type_id in sorted({row[2] for row in rows}):
+            publish(MARKET_CHANNEL, 'market', {'crop_type_id': crop_type_id})
+    return len(rows)
+
+
+def compact_listings(limit=1000):
+    """
+    Move up to ``limit`` closed listings to ArchivedListing in one
+    transaction. Returns the number of listings moved.
+    """
+    with transaction.atomic():
+        listings = list(
+            MarketListing.objects.filter(~OPEN_LISTING)
+            .select_for_update(skip_locked=True)
+            .order_by('id')[:limit]
+        )
+        if not listings:
+            return 0
+        # ids are kept, so a retried batch finds its rows already archived
+        ArchivedListing.objects.bulk_create(
+            [
+                ArchivedListing(
+                    id=listing.id, seller_id=listing.seller_id, crop_type_id=listing.crop_type_id,
+                    quantity=listing.quantity, unit_price=listing.unit_price, active=listing.active,
+                    created_at=listing.created_at, expires_at=listing.expires_at,
+                )
+                for listing in listings
+            ],
+            ignore_conflicts=True,
+        )
+        MarketListing.objects.filter(id__in=[listing.id for listing in listings]).delete()
+    return len(listings)
@@ -0,0 +1,223 @@
+import asyncio
+import importlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from asgiref.sync import ThreadSensitiveContext
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client
+from django.urls import clear_url_caches, reverse
+from django.utils import timezone
+
+from game import urls as game_urls
+from game.board import reset_boards
+from game.catalog import get_catalog
+from game.models import Contract, CropType, InventoryItem, MarketListing, create_farms_for_users
+
+from ._benchmark import benchmark_database, percentile, write_results
+
+User = get_user_model()
+
+# what a polling client fetches each round, revalidating with its last ETag
+ENDPOINTS = ('farm-me', 'plot-list', 'inventory-list', 'contract-list', 'market-create-listing')
+
+
+class Command(BaseCommand):
+    help = (
+        'Poll the read endpoints with many concurrent clients, once through the sync views on a '
+        'WSGI-style thread pool and once through the async views on a single event loop, and '
+        'compare throughput, latency, threads and memory. Each deployment runs in its own process.'
+    )
+    # URLs are rerouted before the first request; checks would import them earlier
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pollers', type=int, default=200, help='Concurrent polling clients.')
+        parser.add_argument('--rounds', type=int, default=5, help='Polls of every endpoint per client.')
+        parser.add_argument('--threads', type=int, default=8, help='Request threads of the WSGI worker.')
+        parser.add_argument('--db-latency-ms', type=float, default=0,
+                            help='Delay added to every query, to stand in for a database over the network.')
+        parser.add_argument('--output', help='Write the JSON results to this file.')
+        parser.add_argument('--mode', choices=('wsgi', 'asgi'), help='Run only this deployment (used internally).')
+
+    def handle(self, *args, **options):
+        if options['mode']:
+            with benchmark_database():
+                results = self.run(
+                    options['mode'], options['pollers'], options['rounds'], options['threads'],
+                    options['db_latency_ms'] / 1000,
+                )
+            self.stdout.write(json.dumps(results))
+            return
+
+        results = {
+            'pollers': options['pollers'], 'rounds': options['rounds'], 'endpoints': list(ENDPOINTS),
+            'db_latency_ms': options['db_latency_ms'],
+        }
+        for mode in ('wsgi', 'asgi'):
+            results[mode] = self.run_in_process(mode, options)
+        results['asgi_vs_wsgi'] = {
+            'throughput': round(results['asgi']['requests_per_sec'] / results['wsgi']['requests_per_sec'], 2),
+            'p95_latency': round(results['asgi']['latency_ms']['p95'] / results['wsgi']['latency_ms']['p95'], 2),
+            'rss_growth': round(
+                results['asgi']['rss_growth_kb'] / results['wsgi']['rss_growth_kb'], 2,
+            ) if results['wsgi']['rss_growth_kb'] else None,
+        }
+        write_results(results, options['output'], self.stdout)
+
+    def run_in_process(self, mode, options):
+        command = [
+            sys.executable, '-m', 'django', 'bench_async', '--mode', mode,
+            '--pollers', str(options['pollers']), '--rounds', str(options['rounds']),
+            '--threads', str(options['threads']), '--db-latency-ms', str(options['db_latency_ms']),
+        ]
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        process = subprocess.run(command, env=env, capture_output=True, text=True)
+        if process.returncode:
+            raise CommandError(f'{mode} run failed:\n{process.stderr}')
+        return json.loads(process.stdout)
+
+    def run(self, mode, pollers, rounds, threads, db_latency):
+        # contracts are only read, as with the scheduler running
+        settings.GAME_CONTRACT_SCHEDULER = True
+        self.route_reads(async_reads=mode == 'asgi')
+        clients = self.seed(pollers, AsyncClient if mode == 'asgi' else Client)
+        if db_latency:
+            delay_queries(db_latency)
+
+        sampler = Sampler()
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        sampler.start()
+        start = time.perf_counter()
+        if mode == 'asgi':
+            latencies, statuses = asyncio.run(self.poll_async(clients, rounds))
+        else:
+            latencies, statuses = self.poll_threads(clients, rounds, threads)
+        elapsed = time.perf_counter() - start
+        sampler.stop()
+
+        latencies.sort()
+        return {
+            'requests': len(latencies),
+            'requests_per_sec': round(len(latencies) / elapsed, 1),
+            'latency_ms': {
+                'p50': round(percentile(latencies, 50) * 1000, 2),
+                'p95': round(percentile(latencies, 95) * 1000, 2),
+                'max': round(latencies[-1] * 1000, 2),
+            },
+            'statuses': {str(code): statuses.count(code) for code in sorted(set(statuses))},
+            'peak_threads': sampler.peak_threads,
+            'rss_growth_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before,
+            'server_threads': 1 if mode == 'asgi' else threads,
+        }
+
+    def route_reads(self, async_reads):
+        """Point the read URLs at the sync or async views, as ``GAME_ASYNC_READS`` would."""
+        settings.GAME_ASYNC_READS = async_reads
+        importlib.reload(game_urls)
+        importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+        clear_url_caches()
+
+    def seed(self, pollers, client_class):
+        crops = [
+            CropType.objects.create(name=name, grow_time_seconds=60, base_price=2, seed_price=1, emoji=emoji)
+            for name, emoji in (('Wheat', '🌾'), ('Corn', '🌽'), ('Carrot', '🥕'))
+        ]
+        get_catalog()
+        reset_boards()
+        users = User.objects.bulk_create(User(username=f'poller{i}') for i in range(pollers + 1))
+        seller, *farms = create_farms_for_users(users)
+        expires_at = timezone.now() + timezone.timedelta(days=1)
+        InventoryItem.objects.bulk_create(
+            InventoryItem(farm=farm, crop_type=crop, quantity=5) for farm in farms for crop in crops
+        )
+        Contract.objects.bulk_create(
+            Contract(farm=farm, crop_type=crop, quantity_required=3, reward_coins=10, expires_at=expires_at)
+            for farm in farms for crop in crops
+        )
+        MarketListing.objects.bulk_create(
+            MarketListing(seller=seller, crop_type=crops[i % 3], quantity=5, unit_price=1 + i % 20) for i in range(60)
+        )
+
+        clients = []
+        for user in users[1:]:
+            client = client_class()
+            client.force_login(user)
+            clients.append(client)
+        return clients
+
+    def poll_threads(self, clients, rounds, threads):
+        etags = [{} for _ in clients]
+        latencies, statuses = [], []
+
+        def poll(submitted, i, name):
+            response = clients[i].get(reverse(name), HTTP_IF_NONE_MATCH=etags[i].get(name, ''))
+            latencies.append(time.perf_counter() - submitted)
+            statuses.append(response.status_code)
+            if response.has_header('ETag'):
+                etags[i][name] = response['ETag']
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            for _ in range(rounds):
+                submitted = time.perf_counter()
+                wait([pool.submit(poll, submitted, i, name) for i in range(len(clients)) for name in ENDPOINTS])
+        return latencies, statuses
+
+    async def poll_async(self, clients, rounds):
+        etags = [{} for _ in clients]
+        latencies, statuses = [], []
+
+        async def poll(submitted, i, name):
+            # ASGIHandler gives each request its own thread for sync calls; the test client does not
+            async with ThreadSensitiveContext():
+                response = await clients[i].get(reverse(name), headers={'If-None-Match': etags[i].get(name, '')})
+            latencies.append(time.perf_counter() - submitted)
+            statuses.append(response.status_code)
+            if response.has_header('ETag'):
+                etags[i][name] = response['ETag']
+
+        for _ in range(rounds):
+            submitted = time.perf_counter()
+            await asyncio.gather(*(poll(submitted, i, name) for i in range(len(clients)) for name in ENDPOINTS))
+        return latencies, statuses
+
+
+def delay_queries(seconds):
+    """Sleep ``seconds`` before every query, on every connection opened from now on."""
+    def delayed(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    def install(connection, **kwargs):
+        connection.execute_wrappers.append(delayed)
+
+    connection_created.connect(install, weak=False)
+    for connection in connections.all():
+        connection.execute_wrappers.append(delayed)
+
+
+class Sampler(threading.Thread):
+    """Records the most threads alive at once while the pollers run."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak_threads = 0
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.wait(0.005):
+            self.peak_threads = max(self.peak_threads, threading.active_count() - 1)
+
+    def stop(self):
+        self.done.set()
+        self.join()
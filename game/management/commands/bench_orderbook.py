@@ -0,0 +1,88 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+
+from game.models import CropType, Farm, MarketListing
+from game.orderbook import Execution, OrderBook, persist_trades, reset_order_books
+
+from ._benchmark import benchmark_database, throughput, write_results
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Compare market order throughput of the in-memory order book with the row-locking buy path.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=2000)
+        parser.add_argument('--units', type=int, default=5, help='Units bought per order.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Orders per persisted trade batch.')
+        parser.add_argument('--output', help='Write the JSON results to this file.')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            results = self.run(options['orders'], options['units'], options['batch_size'])
+        write_results(results, options['output'], self.stdout)
+
+    def seed(self, orders, units):
+        crop = CropType.objects.create(name='Bench', grow_time_seconds=1, base_price=1, seed_price=1)
+        seller = Farm.objects.create(user=User.objects.create_user('bench-seller'), name='Seller')
+        buyer_user = User.objects.create_user('bench-buyer')
+        buyer = Farm.objects.create(user=buyer_user, name='Buyer', balance=10 ** 12)
+        self.seed_listings(crop, seller, orders, units)
+        return crop, seller, buyer, buyer_user
+
+    def run(self, orders, units, batch_size):
+        results = {'orders': orders, 'units_per_order': units}
+
+        # current path: one row-locking transaction per whole-listing buy
+        crop, seller, buyer, buyer_user = self.seed(orders, units)
+        client = Client()
+        client.force_login(buyer_user)
+        listing_ids = list(MarketListing.objects.values_list('id', flat=True))
+        results['row_lock_orders_per_sec'] = throughput(orders, lambda: [
+            client.post(reverse('market-buy', args=[listing_id])) for listing_id in listing_ids
+        ])
+
+        # same orders through the order book endpoint
+        MarketListing.objects.all().delete()
+        self.seed_listings(crop, seller, orders, units)
+        reset_order_books()
+        results['order_endpoint_orders_per_sec'] = throughput(orders, lambda: [
+            client.post(reverse('market-order'), {'crop_type_id': crop.id, 'quantity': units})
+            for _ in range(orders)
+        ])
+
+        # engine only: matching in memory, no database
+        MarketListing.objects.all().delete()
+        self.seed_listings(crop, seller, orders, units)
+        book = OrderBook(crop.id)
+        book.load()
+        results['match_only_orders_per_sec'] = throughput(orders, lambda: [
+            book.match(units, budget=buyer.balance, exclude_seller=buyer.id) for _ in range(orders)
+        ])
+
+        # engine with trades written in batches
+        book.load()
+
+        def match_and_persist():
+            pending = []
+            for _ in range(orders):
+                fills = book.match(units, budget=buyer.balance, exclude_seller=buyer.id)
+                pending.extend(Execution(buyer.id, crop.id, *fill) for fill in fills)
+                if len(pending) >= batch_size:
+                    persist_trades(pending)
+                    pending = []
+            if pending:
+                persist_trades(pending)
+
+        results['batched_orders_per_sec'] = throughput(orders, match_and_persist)
+        results['batch_size'] = batch_size
+        return results
+
+    def seed_listings(self, crop, seller, orders, units):
+        MarketListing.objects.bulk_create([
+            MarketListing(seller=seller, crop_type=crop, quantity=units, unit_price=1 + i % 50)
+            for i in range(orders)
+        ])
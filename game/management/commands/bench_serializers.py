@@ -0,0 +1,115 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from game.catalog import get_catalog
+from game.models import Contract, CropType, Farm, InventoryItem, MarketListing, Plot
+from game.renderers import FastJSONRenderer
+from game.serializers import (
+    ContractRows, ContractSerializer, InventoryItemRows, InventoryItemSerializer, MarketListingRows,
+    MarketListingSerializer, PlotRows, PlotSerializer,
+)
+
+from ._benchmark import benchmark_database, write_results
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the list endpoints\' ModelSerializer + JSONRenderer path against the row serializers + '
+        'FastJSONRenderer on large lists, checking both produce the same bytes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=10000, help='Items per list.')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per path; the best is reported.')
+        parser.add_argument('--output', help='Write the JSON results to this file.')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            results = self.run(options['items'], options['repeat'])
+        write_results(results, options['output'], self.stdout)
+
+    def run(self, count, repeat):
+        crops = [
+            CropType.objects.create(name=name, grow_time_seconds=60, base_price=2, seed_price=1, emoji=emoji)
+            for name, emoji in (('Wheat', '🌾'), ('Corn', '🌽'), ('Carrot', '🥕'))
+        ]
+        users = User.objects.bulk_create(User(username=f'bench{i}') for i in range(count))
+        farms = Farm.objects.bulk_create(Farm(user=user, name=f'{user.username} farm') for user in users)
+        InventoryItem.objects.bulk_create(
+            InventoryItem(farm=farm, crop_type=crops[i % 3], quantity=i) for i, farm in enumerate(farms)
+        )
+        MarketListing.objects.bulk_create(
+            MarketListing(seller=farm, crop_type=crops[i % 3], quantity=1 + i % 9, unit_price=1 + i % 50)
+            for i, farm in enumerate(farms)
+        )
+        get_catalog()
+
+        # plots and contracts reach their serializers as instances, not querysets
+        now = timezone.now()
+        plots = [
+            Plot(id=i + 1, farm=farms[0], x=i % 100, y=i // 100, crop_type=crops[i % 3] if i % 2 else None,
+                 planted_at=now if i % 2 else None, harvest_ready_at=now if i % 2 else None)
+            for i in range(count)
+        ]
+        contracts = [
+            Contract(id=i + 1, farm=farms[0], crop_type=crops[i % 3], unlocks_crop=crops[2] if i % 5 == 0 else None,
+                     quantity_required=5, reward_coins=10, created_at=now, expires_at=now)
+            for i in range(count)
+        ]
+        inventory = InventoryItem.objects.order_by('crop_type_id', 'id')
+        listings = MarketListing.objects.order_by('unit_price', 'id')
+
+        def inventory_rows():
+            rows = InventoryItemRows()
+            return rows.data(rows.values(inventory.all()))
+
+        def listing_rows():
+            rows = MarketListingRows()
+            return rows.data(rows.values(listings.all()))
+
+        cases = {
+            'plots': (
+                lambda: PlotSerializer(plots, many=True).data,
+                lambda: PlotRows().data_from_objects(plots),
+            ),
+            'inventory': (
+                lambda: InventoryItemSerializer(inventory.all(), many=True).data,
+                inventory_rows,
+            ),
+            'contracts': (
+                lambda: ContractSerializer(contracts, many=True).data,
+                lambda: ContractRows().data_from_objects(contracts),
+            ),
+            'market_listings': (
+                lambda: MarketListingSerializer(listings.select_related('seller'), many=True).data,
+                listing_rows,
+            ),
+        }
+
+        results = {'items': count, 'repeat': repeat}
+        for name, (slow, fast) in cases.items():
+            slow_ms, slow_body = self.best(repeat, lambda: JSONRenderer().render(slow()))
+            fast_ms, fast_body = self.best(repeat, lambda: FastJSONRenderer().render(fast()))
+            results[name] = {
+                'model_serializer_ms': round(slow_ms, 2),
+                'row_serializer_ms': round(fast_ms, 2),
+                'speedup': round(slow_ms / fast_ms, 2),
+                'identical': slow_body == fast_body,
+                'bytes': len(fast_body),
+            }
+        return results
+
+    def best(self, repeat, func):
+        """Return the fastest of ``repeat`` calls in milliseconds, and the last result."""
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            body = func()
+            timings.append((time.perf_counter() - start) * 1000)
+        return min(timings), body
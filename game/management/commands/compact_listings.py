@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from game.listings import compact_listings, expire_listings
+
+
+class Command(BaseCommand):
+    help = (
+        'Close expired market listings, returning their stock to the sellers, and move closed '
+        'listings to the archive table in small batches.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run a single pass and exit.')
+        parser.add_argument('--interval', type=float, default=60, help='Seconds between passes.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Listings per transaction.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        while True:
+            started = time.monotonic()
+            expired = archived = 0
+            while True:
+                count = expire_listings(limit=batch_size)
+                expired += count
+                if count < batch_size:
+                    break
+            while True:
+                count = compact_listings(limit=batch_size)
+                archived += count
+                if count < batch_size:
+                    break
+            elapsed = time.monotonic() - started
+            self.stdout.write(f'Expired {expired} listings, archived {archived} in {elapsed:.2f}s')
+            if options['once']:
+                break
+            time.sleep(max(0, options['interval'] - elapsed))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from game.inventory import settle_inventory
+
+
+class Command(BaseCommand):
+    help = (
+        'Fold buffered harvest deltas into inventory items, one multi-row upsert per pass. '
+        'Run with GAME_INVENTORY_WRITE_BEHIND = True.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Flush everything pending and exit.')
+        parser.add_argument('--interval-ms', type=int, default=200, help='Milliseconds between flushes.')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Deltas per flush transaction.')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            farms = settle_inventory(limit=options['batch_size'])
+            elapsed = time.monotonic() - started
+            if farms and options['verbosity'] > 1:
+                self.stdout.write(f'Flushed inventory of {len(farms)} farms in {elapsed * 1000:.1f}ms')
+            if options['once']:
+                # a full batch may have left more behind
+                if farms:
+                    continue
+                break
+            time.sleep(max(0, options['interval_ms'] / 1000 - elapsed))
@@ -0,0 +1,236 @@
+import json
+import logging
+import random
+import subprocess
+import time
+from collections import Counter, defaultdict
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, reset_queries
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from game import urls as game_urls
+from game.models import (
+    GRID_SIZE, Contract, CropType, Farm, InventoryItem, MarketListing, Plot, create_farms_for_users,
+    ensure_contracts_for_farms,
+)
+
+from ._benchmark import benchmark_database, percentile, write_results
+
+User = get_user_model()
+
+# Relative weight of each action in the simulated traffic, roughly what the
+# home page and its scripts send for an active player.
+TRAFFIC_MIX = {
+    'home': 20,
+    'farm-me': 8,
+    'farm-expand': 1,
+    'crop-type-list': 4,
+    'plot-list': 6,
+    'inventory-list': 6,
+    'contract-list': 6,
+    'plant': 5,
+    'plant-cell': 5,
+    'harvest': 10,
+    'plant-many': 3,
+    'harvest-many': 3,
+    'sell-npc': 8,
+    'complete-contract': 2,
+    'market-create-listing': 5,
+    'market-buy': 5,
+    'market-order': 4,
+    'health': 1,
+}
+
+# streaming responses only make sense against an ASGI server
+SKIPPED = {'event-stream': 'needs an ASGI server'}
+
+
+class VirtualUser:
+    def __init__(self, user, farm):
+        self.user = user
+        self.farm = farm
+        self.client = Client()
+        self.client.force_login(user)
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway database with players and drive mixed traffic through every game endpoint, '
+        'reporting latency percentiles, throughput and query counts per endpoint as JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50, help='Simulated players.')
+        parser.add_argument('--requests', type=int, default=5000, help='Total requests to send.')
+        parser.add_argument('--listings', type=int, default=2000, help='Open market listings to seed.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, so runs are reproducible.')
+        parser.add_argument('--warmup', type=int, default=200, help='Requests sent before measuring.')
+        parser.add_argument('--output', help='Write the JSON results to this file.')
+        parser.add_argument('--compare', help='Print p95 changes against a previous results file.')
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        # expected 4xx responses (unripe crops, sold listings) would flood the output
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        with benchmark_database():
+            users = self.seed(options['users'], options['listings'])
+            self.drive(users, options['warmup'])
+            started = time.perf_counter()
+            samples = self.drive(users, options['requests'])
+            elapsed = time.perf_counter() - started
+
+        results = {
+            'commit': self.commit(),
+            'users': options['users'],
+            'requests': options['requests'],
+            'listings': options['listings'],
+            'seed': options['seed'],
+            'elapsed_seconds': round(elapsed, 3),
+            'requests_per_sec': round(options['requests'] / elapsed, 1),
+            'endpoints': self.summarize(samples, elapsed),
+            'skipped': SKIPPED,
+        }
+        write_results(results, options['output'], self.stdout)
+        if options['compare']:
+            self.compare(results, options['compare'])
+
+    def seed(self, user_count, listing_count):
+        crops = [
+            CropType.objects.create(name='Radish', grow_time_seconds=0, base_price=2, seed_price=1),
+            CropType.objects.create(name='Wheat', grow_time_seconds=10, base_price=3, seed_price=1),
+            CropType.objects.create(name='Corn', grow_time_seconds=30, base_price=5, seed_price=3),
+        ]
+        accounts = User.objects.bulk_create(User(username=f'load{i}') for i in range(user_count))
+        farms = create_farms_for_users(accounts)
+        users = [VirtualUser(user, farm) for user, farm in zip(accounts, farms)]
+
+        farm_ids = [farm.id for farm in farms]
+        Farm.objects.filter(id__in=farm_ids).update(balance=10 ** 6)
+        Farm.unlocked_crops.through.objects.bulk_create(
+            Farm.unlocked_crops.through(farm_id=farm_id, croptype_id=crop.id)
+            for farm_id in farm_ids for crop in crops
+            if crop.name != 'Wheat'  # unlocked on signup
+        )
+        InventoryItem.objects.bulk_create(
+            InventoryItem(farm_id=farm_id, crop_type=crop, quantity=10 ** 4)
+            for farm_id in farm_ids for crop in crops
+        )
+        MarketListing.objects.bulk_create(
+            MarketListing(
+                seller_id=random.choice(farm_ids),
+                crop_type=random.choice(crops),
+                quantity=random.randint(1, 20),
+                unit_price=random.randint(1, 20),
+            )
+            for _ in range(listing_count)
+        )
+        ensure_contracts_for_farms(farm_ids)
+        self.crops = crops
+        return users
+
+    def drive(self, users, count):
+        actions = list(TRAFFIC_MIX)
+        weights = list(TRAFFIC_MIX.values())
+        samples = defaultdict(list)
+        for _ in range(count):
+            vu = random.choice(users)
+            name = random.choices(actions, weights)[0]
+            method, url, data = self.request_for(name, vu)
+            # the query log is capped, so start each request with an empty one
+            reset_queries()
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = getattr(vu.client, method)(url, data, content_type='application/json')
+                elapsed = time.perf_counter() - started
+            samples[name].append((elapsed, len(queries.captured_queries), response.status_code))
+        return samples
+
+    def request_for(self, name, vu):
+        """Return ``(method, url, data)`` for one request of kind ``name`` from ``vu``."""
+        crop = random.choice(self.crops)
+        if name == 'home':
+            return 'get', reverse('home'), None
+        if name in ('plant', 'harvest'):
+            # plots only exist once their cell has been planted
+            plot_id = (
+                Plot.objects.filter(farm=vu.farm, crop_type__isnull=name == 'plant')
+                .values_list('id', flat=True).first()
+            )
+            return 'post', reverse(name, args=[plot_id or 0]), {'crop_type_id': crop.id}
+        if name == 'plant-cell':
+            x, y = random.randrange(GRID_SIZE), random.randrange(GRID_SIZE)
+            return 'post', reverse(name, args=[x, y]), {'crop_type_id': crop.id}
+        if name == 'farm-expand':
+            return 'post', reverse(name), None
+        if name == 'plant-many':
+            return 'post', reverse(name), {'crop_type_id': crop.id, 'plot_ids': 'all'}
+        if name == 'harvest-many':
+            return 'post', reverse(name), {'plot_ids': 'all'}
+        if name == 'sell-npc':
+            return 'post', reverse(name), {'crop_type_id': crop.id, 'quantity': random.randint(1, 5)}
+        if name == 'complete-contract':
+            contract_id = (
+                Contract.objects.filter(farm=vu.farm, completed_at__isnull=True).values_list('id', flat=True).first()
+            )
+            return 'post', reverse(name, args=[contract_id or 0]), None
+        if name == 'market-create-listing':
+            data = {'crop_type_id': crop.id, 'quantity': random.randint(1, 5), 'unit_price': random.randint(1, 20)}
+            return 'post', reverse(name), data
+        if name == 'market-buy':
+            listing_id = (
+                MarketListing.objects.filter(active=True, crop_type=crop).exclude(seller=vu.farm)
+                .values_list('id', flat=True).first()
+            )
+            return 'post', reverse(name, args=[listing_id or 0]), None
+        if name == 'market-order':
+            return 'post', reverse(name), {'crop_type_id': crop.id, 'quantity': random.randint(1, 10)}
+        return 'get', reverse(name), None
+
+    def summarize(self, samples, elapsed):
+        endpoints = {}
+        for name, rows in sorted(samples.items()):
+            latencies = sorted(row[0] * 1000 for row in rows)
+            queries = [row[1] for row in rows]
+            endpoints[name] = {
+                'requests': len(rows),
+                'status_codes': dict(Counter(str(row[2]) for row in rows)),
+                'p50_ms': round(percentile(latencies, 50), 3),
+                'p95_ms': round(percentile(latencies, 95), 3),
+                'p99_ms': round(percentile(latencies, 99), 3),
+                'max_ms': round(latencies[-1], 3),
+                'requests_per_sec': round(len(rows) / elapsed, 1),
+                'queries_avg': round(sum(queries) / len(queries), 2),
+                'queries_max': max(queries),
+            }
+        names = {pattern.name for pattern in game_urls.urlpatterns}
+        missing = names - set(endpoints) - set(SKIPPED)
+        if missing:
+            self.stderr.write(f'Not exercised: {", ".join(sorted(missing))}')
+        return endpoints
+
+    def compare(self, results, path):
+        with open(path) as f:
+            baseline = json.load(f)
+        self.stdout.write(f'\np95 latency vs {path} ({baseline.get("commit") or "unknown commit"}):')
+        for name, current in results['endpoints'].items():
+            before = baseline.get('endpoints', {}).get(name)
+            if not before:
+                continue
+            change = (current['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0
+            queries = current['queries_avg'] - before['queries_avg']
+            self.stdout.write(
+                f'  {name:24} {before["p95_ms"]:9.3f} -> {current["p95_ms"]:9.3f} ms ({change:+.1f}%), '
+                f'queries {queries:+.2f}'
+            )
+
+    def commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
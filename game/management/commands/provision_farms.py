@@ -0,0 +1,45 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from game.models import create_farms_for_users
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Create users with farms in batched transactions, for launch events and load-test seeding.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('count', type=int, help='Number of users to create.')
+        parser.add_argument('--prefix', default='player', help='Usernames are <prefix><n>.')
+        parser.add_argument('--start', type=int, default=0, help='First n to use in usernames.')
+        parser.add_argument('--password', help='Password for every user; without it they cannot log in.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Users per transaction.')
+
+    def handle(self, *args, **options):
+        count, prefix, start = options['count'], options['prefix'], options['start']
+        usernames = [f'{prefix}{n}' for n in range(start, start + count)]
+        taken = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+        if taken:
+            raise CommandError(f'{len(taken)} usernames already exist, e.g. {min(taken)}; pick another --prefix or --start.')
+
+        # hashing is deliberately slow, so do it once and share the hash
+        password = make_password(options['password'])
+
+        started = time.monotonic()
+        batch_size = options['batch_size']
+        for offset in range(0, count, batch_size):
+            with transaction.atomic():
+                users = User.objects.bulk_create(
+                    User(username=username, password=password) for username in usernames[offset:offset + batch_size]
+                )
+                create_farms_for_users(users)
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{offset + len(users)}/{count}')
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(f'Created {count} users and farms in {elapsed:.2f}s ({count / elapsed:.0f}/s)')
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from game.history import rollup_trades
+
+
+class Command(BaseCommand):
+    help = 'Fold new market trades into the per-crop 1m, 1h and 1d candles served by /api/market/history/.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Roll up everything pending and exit.')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between passes.')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Trades per rollup transaction.')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            total = 0
+            while True:
+                rolled = rollup_trades(limit=options['batch_size'])
+                total += rolled
+                if rolled < options['batch_size']:
+                    break
+            elapsed = time.monotonic() - started
+            if total and options['verbosity'] > 1:
+                self.stdout.write(f'Rolled up {total} trades in {elapsed:.2f}s')
+            if options['once']:
+                break
+            time.sleep(max(0, options['interval'] - elapsed))
@@ -0,0 +1,39 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from game.models import rotate_contract_batches
+
+
+class Command(BaseCommand):
+    help = (
+        'Rotate contract batches ahead of expiry for active farms. '
+        'Run with GAME_CONTRACT_SCHEDULER = True so that views only read contracts.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run a single rotation pass and exit.')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between rotation passes.')
+        parser.add_argument('--lead', type=int, default=30, help='Seconds before expiry to create the next batch.')
+        parser.add_argument('--active-days', type=int, default=7, help='Only rotate farms whose user logged in this recently.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Farms per transaction.')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            active_since = timezone.now() - timedelta(days=options['active_days'])
+            rotated, deleted = rotate_contract_batches(
+                lead_seconds=options['lead'],
+                active_since=active_since,
+                batch_size=options['batch_size'],
+            )
+            elapsed = time.monotonic() - started
+            if rotated or deleted or options['verbosity'] > 1:
+                self.stdout.write(
+                    f'Rotated {rotated} farms, deleted {deleted} expired contracts in {elapsed:.2f}s'
+                )
+            if options['once']:
+                break
+            time.sleep(max(0, options['interval'] - elapsed))
@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from game.catalog import get_catalog
+
+from ._benchmark import write_results
+
+
+class Command(BaseCommand):
+    help = (
+        'Simulate the economy offline with vectorized agent farms playing by the game\'s rules on the '
+        'current crop catalog, and report coin supply, sources and sinks and market prices per day. '
+        'Requires NumPy.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--farms', type=int, default=10000, help='Simulated farms.')
+        parser.add_argument('--days', type=int, default=100, help='Simulated days.')
+        parser.add_argument('--visits', type=float, default=8, help='Mean visits per farm per day.')
+        parser.add_argument('--list-share', type=float, default=0.5,
+                            help='Share of surplus listed on the market while it pays more than NPCs.')
+        parser.add_argument('--expand-factor', type=float, default=3,
+                            help='Farms expand once their balance is this many times the cost.')
+        parser.add_argument('--seed', type=int, help='Random seed, for reproducible runs.')
+        parser.add_argument('--output', help='Write the JSON results to this file.')
+
+    def handle(self, *args, **options):
+        try:
+            from game.simulation import Economy
+        except ImportError:
+            raise CommandError('simulate_economy requires NumPy: pip install numpy')
+
+        crop_types = get_catalog().crop_types
+        if not crop_types:
+            raise CommandError('There are no crop types to simulate.')
+
+        economy = Economy(
+            crop_types, options['farms'], visits=options['visits'], list_share=options['list_share'],
+            expand_factor=options['expand_factor'], seed=options['seed'],
+        )
+        started = time.perf_counter()
+        days = economy.run(options['days'])
+        elapsed = time.perf_counter() - started
+
+        farm_days = options['farms'] * options['days']
+        results = {
+            'farms': options['farms'], 'days': options['days'], 'visits': options['visits'],
+            'list_share': options['list_share'], 'expand_factor': options['expand_factor'], 'seed': options['seed'],
+            'elapsed_sec': round(elapsed, 2),
+            'farm_days_per_sec': round(farm_days / elapsed) if elapsed else None,
+            'coin_supply': [day['coin_supply'] for day in days],
+            'market_price': {name: [day['market_price'][name] for day in days] for name in economy.names},
+            'per_day': days,
+        }
+        write_results(results, options['output'], self.stdout)
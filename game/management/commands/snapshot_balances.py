@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from game.ledger import prune_snapshots, settle_pending, take_snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        'Settle pending market proceeds into farm balances, snapshot the ledger balance of farms with new '
+        'entries and prune superseded snapshots.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run a single pass and exit.')
+        parser.add_argument('--interval', type=float, default=300, help='Seconds between passes.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Farms per snapshot insert or delete.')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            settled = 0
+            while True:
+                farm_ids = settle_pending()
+                if not farm_ids:
+                    break
+                settled += len(farm_ids)
+            snapshots = take_snapshots(batch_size=options['batch_size'])
+            pruned = prune_snapshots(batch_size=options['batch_size'])
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'Settled {settled} farms, wrote {snapshots} snapshots, pruned {pruned} in {elapsed:.2f}s'
+            )
+            if options['once']:
+                break
+            time.sleep(max(0, options['interval'] - elapsed))
@@ -0,0 +1,110 @@
+"""
+In-memory request metrics, exposed in the Prometheus text format.
+
+``game.middleware.RequestMetricsMiddleware`` records every request here when
+``GAME_REQUEST_METRICS`` is on, and ``/api/metrics/`` renders the result.
+Metrics are per process, so each worker reports its own series; scrape every
+worker or aggregate with the ``instance`` label Prometheus adds.
+"""
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+# upper bounds in seconds (durations) or queries (counts); +Inf is implied
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """Yield ``(upper_bound, cumulative_count)`` pairs, ending with ``+Inf``."""
+        total = 0
+        for bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            total += count
+            yield bound, total
+
+
+class ViewMetrics:
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.db_duration = Histogram(DURATION_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.duplicate_queries = 0
+        self.responses = defaultdict(int)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = defaultdict(ViewMetrics)
+
+    def record(self, view, status, duration, db_duration, queries, duplicates):
+        with self._lock:
+            metrics = self._views[view]
+            metrics.duration.observe(duration)
+            metrics.responses[status] += 1
+            metrics.db_duration.observe(db_duration)
+            metrics.queries.observe(queries)
+            metrics.duplicate_queries += duplicates
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+    def render(self):
+        """Return every series in the Prometheus text exposition format."""
+        with self._lock:
+            views = sorted(self._views.items())
+            lines = []
+            self._histogram(lines, views, 'game_request_duration_seconds', 'duration',
+                            'Wall time spent handling a request, by view.')
+            self._histogram(lines, views, 'game_request_db_duration_seconds', 'db_duration',
+                            'Time spent executing SQL per request, by view.')
+            self._histogram(lines, views, 'game_request_queries', 'queries',
+                            'SQL queries executed per request, by view.')
+
+            lines.append('# HELP game_request_duplicate_queries_total Queries that repeated an earlier query '
+                         'of the same request, by view.')
+            lines.append('# TYPE game_request_duplicate_queries_total counter')
+            for view, metrics in views:
+                lines.append(f'game_request_duplicate_queries_total{{view="{_escape(view)}"}} '
+                             f'{metrics.duplicate_queries}')
+
+            lines.append('# HELP game_responses_total Responses sent, by view and status code.')
+            lines.append('# TYPE game_responses_total counter')
+            for view, metrics in views:
+                for status, count in sorted(metrics.responses.items()):
+                    lines.append(f'game_responses_total{{view="{_escape(view)}",status="{status}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _histogram(lines, views, name, attr, help_text):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for view, metrics in views:
+            histogram = getattr(metrics, attr)
+            if not histogram.count:
+                continue
+            label = f'view="{_escape(view)}"'
+            for bound, count in histogram.cumulative():
+                lines.append(f'{name}_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'{name}_sum{{{label}}} {round(histogram.sum, 6)}')
+            lines.append(f'{name}_count{{{label}}} {histogram.count}')
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = MetricsRegistry()
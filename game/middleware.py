@@ -0,0 +1,71 @@
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from .metrics import registry
+
+
+class QueryRecorder:
+    """``connection.execute_wrapper`` that counts and times queries and spots repeats."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.duplicates = 0
+        self._seen = set()
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql in self._seen:
+            self.duplicates += 1
+        else:
+            self._seen.add(sql)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+class RequestMetricsMiddleware:
+    """
+    Record wall time, query count, SQL time and repeated queries for each
+    request, add them to the response as a ``Server-Timing`` header and
+    aggregate them per view in ``game.metrics.registry``.
+
+    Enabled with ``GAME_REQUEST_METRICS = True``. Sync-only, so under ASGI
+    Django runs it on the thread that sync views (and the async views' ORM
+    calls) query from, and every view's queries are recorded. Only the
+    response itself is timed for streaming views, not the stream.
+    """
+    sync_capable = True
+    async_capable = False
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'GAME_REQUEST_METRICS', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+        registry.record(
+            _view_name(request), response.status_code, duration,
+            recorder.duration, recorder.count, recorder.duplicates,
+        )
+        response['Server-Timing'] = (
+            f'db;dur={recorder.duration * 1000:.2f};desc="{recorder.count} queries, {recorder.duplicates} repeated", '
+            f'total;dur={duration * 1000:.2f}'
+        )
+        return response
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    # unmatched URLs share one label so scanners cannot blow up the series count
+    return match.view_name if match is not None else '<unresolved>'
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:55
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def open_ledgers(apps, schema_editor):
+    # existing balances become each farm's opening entry
+    Farm = apps.get_model('game', 'Farm')
+    LedgerEntry = apps.get_model('game', 'LedgerEntry')
+    LedgerEntry.objects.bulk_create(
+        (LedgerEntry(farm_id=farm_id, amount=balance, reason='opening')
+         for farm_id, balance in Farm.objects.values_list('id', 'balance').iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0011_croptype_emoji'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.IntegerField()),
+                ('taken_at', models.DateTimeField()),
+                ('farm', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to='game.farm')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['farm', 'taken_at'], name='snapshot_farm_taken_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField()),
+                ('reason', models.CharField(choices=[('opening', 'Opening balance'), ('seeds', 'Seeds'), ('npc_sale', 'Sale to NPC'), ('contract', 'Contract reward'), ('market_purchase', 'Market purchase'), ('market_sale', 'Market sale')], max_length=20)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('settled', models.BooleanField(default=True)),
+                ('farm', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='game.farm')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['farm', 'created_at'], name='ledger_farm_created_idx'), models.Index(condition=models.Q(('settled', False)), fields=['farm'], name='ledger_unsettled_idx')],
+            },
+        ),
+        migrations.RunPython(open_ledgers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:57
+
+from django.db import migrations, models
+
+
+def drop_duplicate_plots(apps, schema_editor):
+    # keep the oldest plot in each cell so the unique constraint can be added
+    Plot = apps.get_model('game', 'Plot')
+    duplicates = (
+        Plot.objects.values('farm_id', 'y', 'x')
+        .annotate(count=models.Count('id'), keep=models.Min('id'))
+        .filter(count__gt=1)
+    )
+    for cell in duplicates:
+        Plot.objects.filter(farm_id=cell['farm_id'], y=cell['y'], x=cell['x']).exclude(id=cell['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0012_ledger'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contract',
+            index=models.Index(fields=['farm', 'expires_at'], name='contract_farm_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contract',
+            index=models.Index(condition=models.Q(('completed_at__isnull', True)), fields=['farm'], name='contract_farm_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contract',
+            index=models.Index(fields=['expires_at'], name='contract_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='marketlisting',
+            index=models.Index(condition=models.Q(('active', True), ('quantity__gt', 0)), fields=['crop_type', 'unit_price'], name='listing_open_crop_price_idx'),
+        ),
+        migrations.RunPython(drop_duplicate_plots, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='plot',
+            constraint=models.UniqueConstraint(fields=('farm', 'y', 'x'), name='plot_unique_farm_cell'),
+        ),
+    ]
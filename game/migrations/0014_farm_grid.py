@@ -0,0 +1,48 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:07
+
+import struct
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# same layout as game.grid.CELL at the time of this migration
+CELL = struct.Struct('<HHqiq')
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def build_grids(apps, schema_editor):
+    Farm = apps.get_model('game', 'Farm')
+    FarmGrid = apps.get_model('game', 'FarmGrid')
+    Plot = apps.get_model('game', 'Plot')
+
+    farm_ids = list(Farm.objects.values_list('id', flat=True))
+    for start in range(0, len(farm_ids), 500):
+        chunk = farm_ids[start:start + 500]
+        cells = defaultdict(list)
+        plots = Plot.objects.filter(farm_id__in=chunk).order_by('farm_id', 'y', 'x').values_list(
+            'farm_id', 'x', 'y', 'id', 'crop_type_id', 'planted_at',
+        )
+        for farm_id, x, y, plot_id, crop_type_id, planted_at in plots:
+            planted_us = (planted_at - EPOCH) // timedelta(microseconds=1) if crop_type_id and planted_at else 0
+            cells[farm_id].append(CELL.pack(x, y, plot_id, crop_type_id or 0, planted_us))
+        FarmGrid.objects.bulk_create(FarmGrid(farm_id=farm_id, cells=b''.join(cells[farm_id])) for farm_id in chunk)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0013_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FarmGrid',
+            fields=[
+                ('farm', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='grid', serialize=False, to='game.farm')),
+                ('cells', models.BinaryField(default=bytes)),
+            ],
+        ),
+        migrations.RunPython(build_grids, migrations.RunPython.noop),
+    ]
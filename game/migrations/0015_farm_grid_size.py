@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0014_farm_grid'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='farm',
+            name='grid_size',
+            field=models.PositiveSmallIntegerField(default=5),
+        ),
+        migrations.AlterField(
+            model_name='ledgerentry',
+            name='reason',
+            field=models.CharField(choices=[('opening', 'Opening balance'), ('seeds', 'Seeds'), ('npc_sale', 'Sale to NPC'), ('contract', 'Contract reward'), ('expansion', 'Farm expansion'), ('market_purchase', 'Market purchase'), ('market_sale', 'Market sale')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0015_farm_grid_size'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryDelta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('crop_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='game.croptype')),
+                ('farm', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inventory_deltas', to='game.farm')),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0016_inventorydelta'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('starts_at', models.DateTimeField()),
+                ('npc_quantity', models.PositiveBigIntegerField(default=0)),
+                ('trade_quantity', models.PositiveBigIntegerField(default=0)),
+                ('trade_value', models.PositiveBigIntegerField(default=0)),
+                ('crop_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='game.croptype')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('starts_at', 'crop_type'), name='price_bucket_unique')],
+            },
+        ),
+    ]
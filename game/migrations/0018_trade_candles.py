@@ -0,0 +1,54 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:51
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0017_pricebucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TradeRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_trade_id', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Trade',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('listing_id', models.BigIntegerField()),
+                ('buyer_id', models.BigIntegerField()),
+                ('seller_id', models.BigIntegerField()),
+                ('quantity', models.PositiveIntegerField()),
+                ('unit_price', models.PositiveIntegerField()),
+                ('executed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('crop_type', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='game.croptype')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Candle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interval', models.CharField(choices=[('1m', '1 minute'), ('1h', '1 hour'), ('1d', '1 day')], max_length=2)),
+                ('starts_at', models.DateTimeField()),
+                ('open', models.PositiveIntegerField()),
+                ('high', models.PositiveIntegerField()),
+                ('low', models.PositiveIntegerField()),
+                ('close', models.PositiveIntegerField()),
+                ('volume', models.PositiveBigIntegerField()),
+                ('value', models.PositiveBigIntegerField()),
+                ('trades', models.PositiveIntegerField()),
+                ('crop_type', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='game.croptype')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('crop_type', 'interval', 'starts_at'), name='candle_unique')],
+            },
+        ),
+    ]
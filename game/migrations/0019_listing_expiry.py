@@ -0,0 +1,41 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:54
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0018_trade_candles'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedListing',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('seller_id', models.BigIntegerField()),
+                ('crop_type_id', models.BigIntegerField()),
+                ('quantity', models.PositiveIntegerField()),
+                ('unit_price', models.PositiveIntegerField()),
+                ('active', models.BooleanField()),
+                ('created_at', models.DateTimeField()),
+                ('expires_at', models.DateTimeField(null=True)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='marketlisting',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='marketlisting',
+            index=models.Index(condition=models.Q(('active', True), ('quantity__gt', 0)), fields=['expires_at'], name='listing_open_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='marketlisting',
+            index=models.Index(condition=models.Q(('active', True), ('quantity__gt', 0), _negated=True), fields=['id'], name='listing_closed_idx'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+import struct
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from django.db import migrations
+
+# game.grid.CELL before and after this migration: records gain the stored harvest_ready_at
+OLD_CELL = struct.Struct('<HHqiq')
+CELL = struct.Struct('<HHqiqq')
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _micros(value):
+    return (value - EPOCH) // timedelta(microseconds=1) if value is not None else 0
+
+
+def repack(apps, with_ready_time):
+    FarmGrid = apps.get_model('game', 'FarmGrid')
+    Plot = apps.get_model('game', 'Plot')
+
+    farm_ids = list(FarmGrid.objects.values_list('farm_id', flat=True))
+    for start in range(0, len(farm_ids), 500):
+        chunk = farm_ids[start:start + 500]
+        cells = defaultdict(list)
+        plots = Plot.objects.filter(farm_id__in=chunk).order_by('farm_id', 'y', 'x').values_list(
+            'farm_id', 'x', 'y', 'id', 'crop_type_id', 'planted_at', 'harvest_ready_at',
+        )
+        for farm_id, x, y, plot_id, crop_type_id, planted_at, ready_at in plots:
+            if not crop_type_id:
+                planted_at = ready_at = None
+            if with_ready_time:
+                cell = CELL.pack(x, y, plot_id, crop_type_id or 0, _micros(planted_at), _micros(ready_at))
+            else:
+                cell = OLD_CELL.pack(x, y, plot_id, crop_type_id or 0, _micros(planted_at))
+            cells[farm_id].append(cell)
+        FarmGrid.objects.bulk_update(
+            [FarmGrid(farm_id=farm_id, cells=b''.join(cells[farm_id])) for farm_id in chunk], ['cells'],
+        )
+
+
+def add_ready_time(apps, schema_editor):
+    repack(apps, True)
+
+
+def drop_ready_time(apps, schema_editor):
+    repack(apps, False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0019_listing_expiry'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_ready_time, drop_ready_time),
+    ]
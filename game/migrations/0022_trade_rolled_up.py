@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:39
+
+from django.db import migrations, models
+
+
+def mark_rolled_up(apps, schema_editor):
+    # trades up to the old cursor are already in their candles
+    Trade = apps.get_model('game', 'Trade')
+    TradeRollup = apps.get_model('game', 'TradeRollup')
+    last_trade_id = TradeRollup.objects.filter(id=1).values_list('last_trade_id', flat=True).first()
+    if last_trade_id:
+        Trade.objects.filter(id__lte=last_trade_id).update(rolled_up=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0021_cache_table'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trade',
+            name='rolled_up',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_rolled_up, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='traderollup',
+            name='last_trade_id',
+        ),
+        migrations.AddIndex(
+            model_name='trade',
+            index=models.Index(condition=models.Q(('rolled_up', False)), fields=['id'], name='trade_pending_rollup_idx'),
+        ),
+    ]
@@ -7,10 +7,20 @@ User = get_user_model()
 
 # Create your models here.
 
+GRID_SIZE = 5  # side of a new farm's square grid
+MAX_GRID_SIZE = 64
+GRID_EXPANSION_COST_PER_CELL = 2  # coins per cell added by an expansion
+STARTING_BALANCE = 1
+STARTING_CROP = 'Wheat'  # unlocked on every new farm, if it exists
+
+def expansion_cost(size, new_size):
+    return GRID_EXPANSION_COST_PER_CELL * (new_size * new_size - size * size)
+
 class Farm(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='farm')
     name = models.CharField(max_length=100)
     balance = models.IntegerField(default=0)
+    grid_size = models.PositiveSmallIntegerField(default=GRID_SIZE)
     unlocked_crops = models.ManyToManyField('CropType', blank=True, related_name='farms_unlocked')
 
     def __str__(self):
@@ -27,6 +37,7 @@ class CropType(models.Model):
         return self.name
 
 class Plot(models.Model):
+    # created the first time a cell is planted; cells without a row are empty
     farm = models.ForeignKey(Farm, on_delete=models.CASCADE, related_name='plots')
     x = models.PositiveSmallIntegerField(default=0)
     y = models.PositiveSmallIntegerField(default=0)
@@ -34,6 +45,12 @@ class Plot(models.Model):
     planted_at = models.DateTimeField(null=True, blank=True)
     harvest_ready_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        constraints = [
+            # (y, x) order so the index also serves plots ordered by row
+            models.UniqueConstraint(fields=['farm', 'y', 'x'], name='plot_unique_farm_cell'),
+        ]
+
     def __str__(self):
         return f"Plot ({self.x}, {self.y}) of {self.farm.name}"
     
@@ -60,6 +77,14 @@ class Plot(models.Model):
         hours = total // 3600
         return f'{hours}h'
     
+class FarmGrid(models.Model):
+    """Packed copy of a farm's plots, so the whole grid reads as one row (see game.grid)."""
+    farm = models.OneToOneField(Farm, on_delete=models.CASCADE, primary_key=True, related_name='grid')
+    cells = models.BinaryField(default=bytes)
+
+    def __str__(self):
+        return f"Grid of farm {self.farm_id}"
+
 class InventoryItem(models.Model):
     farm = models.ForeignKey(Farm, on_delete=models.CASCADE, related_name='inventory')
     crop_type = models.ForeignKey(CropType, on_delete=models.CASCADE)
@@ -71,6 +96,19 @@ class InventoryItem(models.Model):
     def __str__(self):
         return f"{self.quantity} x {self.crop_type.name} on {self.farm.name}"
     
+class InventoryDelta(models.Model):
+    """
+    Harvested crops not yet added to the farm's InventoryItem, written instead
+    of updating the item when ``GAME_INVENTORY_WRITE_BEHIND`` is on.
+    ``game.inventory.settle_inventory`` folds them in and deletes them.
+    """
+    farm = models.ForeignKey(Farm, on_delete=models.CASCADE, related_name='inventory_deltas')
+    crop_type = models.ForeignKey(CropType, on_delete=models.CASCADE, related_name='+')
+    quantity = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f'+{self.quantity} x {self.crop_type_id} (farm={self.farm_id})'
+
 class Contract(models.Model):
     farm = models.ForeignKey(Farm, on_delete=models.CASCADE, related_name='contracts')
     crop_type = models.ForeignKey(CropType, on_delete=models.CASCADE)
@@ -87,6 +125,13 @@ class Contract(models.Model):
         on_delete=models.SET_NULL,
         related_name='unlocking_contracts',
     )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['farm', 'expires_at'], name='contract_farm_expiry_idx'),
+            models.Index(fields=['farm'], condition=models.Q(completed_at__isnull=True), name='contract_farm_open_idx'),
+            models.Index(fields=['expires_at'], name='contract_expiry_idx'),
+        ]
     
     def __str__(self):
         return f"Contract for {self.quantity_required} x {self.crop_type.name} for {self.farm.name}"
@@ -104,124 +149,275 @@ class Contract(models.Model):
         return not self.is_completed and not self.is_expired
     
 CONTRACT_DURATION_MINUTES = 1
+CONTRACT_QUANTITY_RANGE = (15, 50)  # crops required, inclusive
+CONTRACT_PREMIUM_RANGE = (1.1, 1.5)  # reward over the crops' base price
+CONTRACT_UNLOCK_CHANCE = 0.33  # chance that a new contract unlocks a locked crop
 
 
-def ensure_contracts_for_farm(farm, desired_count=3):
-    from datetime import timedelta
-    import random
-
-    now = timezone.now()
-
-    # Drop expired contracts
-    Contract.objects.filter(farm=farm, expires_at__lte=now).delete()
-
-    # Active contracts (include completed, just not expired)
-    existing = Contract.objects.filter(
-        farm=farm,
-        expires_at__gt=now,
-    ).order_by('created_at')
-
-    if existing.count() >= desired_count:
-        return existing[:desired_count]
-
-    crop_types = list(CropType.objects.all())
-    if not crop_types:
-        return existing
-
-    if existing.exists():
-        batch_expires_at = existing.first().expires_at
-    else:
-        batch_expires_at = now + timedelta(minutes=CONTRACT_DURATION_MINUTES)
-
-    needed = max(0, desired_count - existing.count())
+def generate_contracts(farm_id, existing, unlocked_ids, crop_types, needed, expires_at):
+    """
+    Build (without saving) ``needed`` new contracts for a farm that already
+    holds the unexpired contracts in ``existing``. At most one contract across
+    the farm's active batch unlocks a new crop.
+    """
+    if existing:
+        expires_at = existing[0].expires_at
 
     # Unlocked vs locked crops for this farm
-    unlocked_qs = farm.unlocked_crops.all()
-    unlocked_ids = set(unlocked_qs.values_list('id', flat=True))
+    unlocked_crops = [c for c in crop_types if c.id in unlocked_ids]
     locked_crops = [c for c in crop_types if c.id not in unlocked_ids]
 
     # Track if there is already an unlock contract active to prevent more than one
-    active_unlock_ids = set(
-        existing.filter(unlocks_crop__isnull=False)
-                .values_list('unlocks_crop_id', flat=True)
-    )
+    active_unlock_ids = {c.unlocks_crop_id for c in existing if c.unlocks_crop_id is not None}
     unlock_already_present = len(active_unlock_ids) > 0
 
-    def pick_payment_crop():
-        # Prefer crops the farm can actually plant
-        if unlocked_qs.exists():
-            return random.choice(list(unlocked_qs))
-        return random.choice(crop_types)
-
-    created_unlock_this_batch = False
+    # Prefer crops the farm can actually plant
+    payment_crops = unlocked_crops or crop_types
 
+    contracts = []
     for _ in range(needed):
-        create_unlock_contract = False
         target_crop = None
 
-        # Locked crops that are not already targeted by an unlock contract
-        available_unlock_targets = [
-            c for c in locked_crops
-            if c.id not in active_unlock_ids
-        ]
-
         # Only allow a single unlock contract overall (existing or newly created)
-        if not unlock_already_present and not created_unlock_this_batch:
-            if available_unlock_targets and random.random() < 0.33:
-                create_unlock_contract = True
+        if not unlock_already_present:
+            # Locked crops that are not already targeted by an unlock contract
+            available_unlock_targets = [
+                c for c in locked_crops
+                if c.id not in active_unlock_ids
+            ]
+            if available_unlock_targets and random.random() < CONTRACT_UNLOCK_CHANCE:
                 target_crop = random.choice(available_unlock_targets)
                 active_unlock_ids.add(target_crop.id)
-                created_unlock_this_batch = True
                 unlock_already_present = True
 
-        payment_crop = pick_payment_crop()
-        quantity_required = random.randint(15, 50)
+        payment_crop = random.choice(payment_crops)
+        quantity_required = random.randint(*CONTRACT_QUANTITY_RANGE)
 
-        premium = random.uniform(1.1, 1.5)
+        premium = random.uniform(*CONTRACT_PREMIUM_RANGE)
         base_total = quantity_required * payment_crop.base_price
         reward_coins = int(base_total * premium)
 
-        Contract.objects.create(
-            farm=farm,
+        contracts.append(Contract(
+            farm_id=farm_id,
             crop_type=payment_crop,
             quantity_required=quantity_required,
             reward_coins=reward_coins,
-            expires_at=batch_expires_at,
-            unlocks_crop=target_crop if create_unlock_contract else None,
-        )
+            expires_at=expires_at,
+            unlocks_crop=target_crop,
+        ))
+    return contracts
+
+
+def ensure_contracts_for_farms(farm_ids, desired_count=3, catalog=None):
+    """
+    Top up every farm in ``farm_ids`` to ``desired_count`` unexpired contracts.
+
+    Works on the whole set at once: one delete for expired contracts, one
+    query each for the remaining contracts and the farms' unlocked crops, and
+    one ``bulk_create`` for the new contracts. Returns a dict mapping each
+    farm id to its contracts in creation order, with crop types attached from
+    ``catalog`` (by default the current one).
+    """
+    from collections import defaultdict
+    from datetime import timedelta
+    from .catalog import get_catalog
 
-    return Contract.objects.filter(
-        farm=farm,
-        expires_at__gt=now,
-    ).order_by('created_at')[:desired_count]
+    farm_ids = list(farm_ids)
+    now = timezone.now()
+    catalog = catalog or get_catalog()
 
-GRID_SIZE = 5
-def create_farm_for_user(user, custom_name=None):
-    from django.utils.text import slugify
+    # Drop expired contracts
+    Contract.objects.filter(farm_id__in=farm_ids, expires_at__lte=now).delete()
+
+    # Active contracts (include completed, just not expired)
+    existing = defaultdict(list)
+    active = Contract.objects.filter(farm_id__in=farm_ids, expires_at__gt=now).order_by('created_at', 'id')
+    for contract in active:
+        existing[contract.farm_id].append(contract)
+
+    short = [farm_id for farm_id in farm_ids if len(existing[farm_id]) < desired_count]
+    if short and catalog.crop_types:
+        unlocked = defaultdict(set)
+        rows = Farm.unlocked_crops.through.objects.filter(farm_id__in=short).values_list('farm_id', 'croptype_id')
+        for farm_id, crop_type_id in rows:
+            unlocked[farm_id].add(crop_type_id)
+
+        expires_at = now + timedelta(minutes=CONTRACT_DURATION_MINUTES)
+        created = []
+        for farm_id in short:
+            created.extend(generate_contracts(
+                farm_id,
+                existing[farm_id],
+                unlocked[farm_id],
+                catalog.crop_types,
+                desired_count - len(existing[farm_id]),
+                expires_at,
+            ))
+        Contract.objects.bulk_create(created)
+        for contract in created:
+            existing[contract.farm_id].append(contract)
+
+    return {
+        farm_id: _attach_crop_types(existing[farm_id][:desired_count], catalog)
+        for farm_id in farm_ids
+    }
+
+
+def ensure_contracts_for_farm(farm, desired_count=3, catalog=None):
+    return ensure_contracts_for_farms([farm.id], desired_count, catalog)[farm.id]
+
+
+def _attach_crop_types(contracts, catalog):
+    for contract in contracts:
+        if contract.crop_type_id in catalog.by_id:
+            contract.crop_type = catalog.by_id[contract.crop_type_id]
+        if contract.unlocks_crop_id is None or contract.unlocks_crop_id in catalog.by_id:
+            contract.unlocks_crop = catalog.by_id.get(contract.unlocks_crop_id)
+    return contracts
+
+
+def current_contracts_for_farm(farm, desired_count=3, catalog=None):
+    """
+    Read-only counterpart of ``ensure_contracts_for_farm`` for when the
+    contract scheduler is running: return the farm's earliest unexpired batch
+    without deleting or creating anything. Batches created ahead of time by
+    ``rotate_contract_batches`` stay hidden until the current one expires.
+    """
+    from .catalog import get_catalog
+
+    contracts = list(_current_contracts(farm, desired_count))
+    return _attach_crop_types(_first_batch(contracts, desired_count), catalog or get_catalog())
+
+
+async def acurrent_contracts_for_farm(farm, catalog, desired_count=3):
+    """``current_contracts_for_farm`` for async views, with crop types from ``catalog``."""
+    contracts = [contract async for contract in _current_contracts(farm, desired_count)]
+    return _attach_crop_types(_first_batch(contracts, desired_count), catalog)
+
+
+def _current_contracts(farm, desired_count):
+    return (
+        Contract.objects.filter(farm=farm, expires_at__gt=timezone.now())
+        .order_by('expires_at', 'created_at', 'id')[:2 * desired_count]
+    )
+
+
+def _first_batch(contracts, desired_count):
+    if contracts:
+        contracts = [c for c in contracts if c.expires_at == contracts[0].expires_at][:desired_count]
+    return contracts
+
+
+def rotate_contract_batches(lead_seconds=30, active_since=None, batch_size=1000, desired_count=3, now=None):
+    """
+    Create the next contract batch for every farm whose latest batch expires
+    within ``lead_seconds``, soonest first, then delete expired contracts.
+
+    Farms are handled ``batch_size`` at a time, each chunk in its own
+    transaction with one query for unlocked crops and one ``bulk_create``, so
+    no single statement or lock grows with the number of farms. Only farms
+    whose user logged in since ``active_since`` are rotated, when given.
+    Returns ``(farms_rotated, contracts_deleted)``.
+    """
+    from collections import defaultdict
+    from datetime import timedelta
+    from django.db import transaction
+    from django.db.models import Max
+    from .catalog import get_catalog
+
+    now = now or timezone.now()
+    horizon = now + timedelta(seconds=lead_seconds)
+    duration = timedelta(minutes=CONTRACT_DURATION_MINUTES)
+    catalog = get_catalog()
+    if not catalog.crop_types:
+        return 0, 0
+
+    farms = Farm.objects.all()
+    if active_since is not None:
+        farms = farms.filter(user__last_login__gte=active_since)
+
+    # (farm id, expiry of its latest batch) for farms due a new batch
+    due = list(
+        farms.annotate(last_expiry=Max('contracts__expires_at'))
+        .filter(models.Q(last_expiry__isnull=True) | models.Q(last_expiry__lte=horizon))
+        .order_by(models.F('last_expiry').asc(nulls_first=True), 'id')
+        .values_list('id', 'last_expiry')
+    )
 
+    for start in range(0, len(due), batch_size):
+        chunk = due[start:start + batch_size]
+        unlocked = defaultdict(set)
+        rows = Farm.unlocked_crops.through.objects.filter(
+            farm_id__in=[farm_id for farm_id, _ in chunk],
+        ).values_list('farm_id', 'croptype_id')
+        for farm_id, crop_type_id in rows:
+            unlocked[farm_id].add(crop_type_id)
+
+        created = []
+        for farm_id, last_expiry in chunk:
+            # the next batch starts when the current one ends
+            starts_at = max(last_expiry, now) if last_expiry else now
+            created.extend(generate_contracts(
+                farm_id, [], unlocked[farm_id], catalog.crop_types, desired_count, starts_at + duration,
+            ))
+        with transaction.atomic():
+            Contract.objects.bulk_create(created, batch_size=batch_size)
+
+    deleted = 0
+    while True:
+        expired = list(
+            Contract.objects.filter(expires_at__lte=now)
+            .order_by('expires_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not expired:
+            break
+        deleted += Contract.objects.filter(id__in=expired).delete()[0]
+    return len(due), deleted
+
+def create_farm_for_user(user, custom_name=None):
     # avoid duplicate farms
     if hasattr(user, "farm"):
         return user.farm
 
-    farm = Farm.objects.create(
-        user=user,
-        name=custom_name or f"{user.username}'s Farm",
-        balance=1,
+    return create_farms_for_users([user], [custom_name])[0]
+
+def create_farms_for_users(users, names=None):
+    """
+    Create a farm for each of ``users`` (none of which may have one yet) with
+    a fixed number of queries however many there are: one bulk insert each
+    for farms, opening ledger entries, Wheat unlocks and (empty) packed grids.
+    Plots are created as cells are first planted.
+    ``names`` optionally gives a farm name per user; ``None`` entries get the
+    default name. Call inside a transaction when the batch must be atomic.
+    """
+    from .catalog import get_catalog
+
+    names = names or [None] * len(users)
+    farms = Farm.objects.bulk_create(
+        Farm(user=user, name=name or f"{user.username}'s Farm", balance=STARTING_BALANCE)
+        for user, name in zip(users, names)
+    )
+    for user, farm in zip(users, farms):
+        user.farm = farm
+
+    LedgerEntry.objects.bulk_create(
+        LedgerEntry(farm=farm, amount=farm.balance, reason=LedgerEntry.Reason.OPENING) for farm in farms
     )
 
     # unlock Wheat if it exists
-    try:
-        wheat = CropType.objects.get(name="Wheat")
-        farm.unlocked_crops.add(wheat)
-    except CropType.DoesNotExist:
-        pass
+    wheat = get_catalog().by_name.get(STARTING_CROP)
+    if wheat is not None:
+        Farm.unlocked_crops.through.objects.bulk_create(
+            Farm.unlocked_crops.through(farm_id=farm.id, croptype_id=wheat.id) for farm in farms
+        )
 
-    # create full GRID_SIZE x GRID_SIZE plots
-    for y in range(GRID_SIZE):
-        for x in range(GRID_SIZE):
-            Plot.objects.create(farm=farm, x=x, y=y)
+    FarmGrid.objects.bulk_create(FarmGrid(farm=farm, cells=b'') for farm in farms)
+
+    return farms
+
+OPEN_LISTING = models.Q(active=True, quantity__gt=0)
 
-    return farm
 
 class MarketListing(models.Model):
     seller = models.ForeignKey(
@@ -234,6 +430,21 @@ class MarketListing(models.Model):
     unit_price = models.PositiveIntegerField()  # coins per unit
     active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(null=True, blank=True)  # unsold stock goes back to the seller then
+
+    class Meta:
+        indexes = [
+            # open listings of a crop, cheapest first (market board and order book)
+            models.Index(
+                fields=['crop_type', 'unit_price'],
+                condition=OPEN_LISTING,
+                name='listing_open_crop_price_idx',
+            ),
+            # open listings by expiry, for game.listings.expire_listings
+            models.Index(fields=['expires_at'], condition=OPEN_LISTING, name='listing_open_expiry_idx'),
+            # sold, expired and cancelled listings, for game.listings.compact_listings
+            models.Index(fields=['id'], condition=~OPEN_LISTING, name='listing_closed_idx'),
+        ]
 
     def __str__(self):
         return f'{self.quantity} {self.crop_type.name} @ {self.unit_price}c (seller={self.seller.name})'
@@ -242,3 +453,150 @@ class MarketListing(models.Model):
     def is_open(self):
         return self.active and self.quantity > 0
 
+
+class Trade(models.Model):
+    """
+    One fill of a market listing, appended by every market purchase. Charts
+    read the Candle rollups (see ``game.history``), never these rows, so the
+    only other index is on the trades not rolled up yet. Listing and farm ids
+    are kept as plain integers so listings can be archived and farms deleted
+    without touching the history.
+    """
+    crop_type = models.ForeignKey(CropType, on_delete=models.CASCADE, related_name='+', db_index=False)
+    listing_id = models.BigIntegerField()
+    buyer_id = models.BigIntegerField()
+    seller_id = models.BigIntegerField()
+    quantity = models.PositiveIntegerField()
+    unit_price = models.PositiveIntegerField()
+    executed_at = models.DateTimeField(default=timezone.now)
+    rolled_up = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            # trades game.history.rollup_trades has yet to fold into candles
+            models.Index(fields=['id'], condition=models.Q(rolled_up=False), name='trade_pending_rollup_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.quantity} x {self.crop_type_id} @ {self.unit_price}c (listing={self.listing_id})'
+
+
+class Candle(models.Model):
+    """Open, high, low and close price and volume of a crop's trades over one interval."""
+    class Interval(models.TextChoices):
+        MINUTE = '1m', '1 minute'
+        HOUR = '1h', '1 hour'
+        DAY = '1d', '1 day'
+
+    crop_type = models.ForeignKey(CropType, on_delete=models.CASCADE, related_name='+', db_index=False)
+    interval = models.CharField(max_length=2, choices=Interval.choices)
+    starts_at = models.DateTimeField()
+    open = models.PositiveIntegerField()
+    high = models.PositiveIntegerField()
+    low = models.PositiveIntegerField()
+    close = models.PositiveIntegerField()
+    volume = models.PositiveBigIntegerField()  # units
+    value = models.PositiveBigIntegerField()  # coins
+    trades = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            # also the index charts read: one crop and interval, by time
+            models.UniqueConstraint(fields=['crop_type', 'interval', 'starts_at'], name='candle_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.crop_type_id} {self.interval} @ {self.starts_at:%Y-%m-%d %H:%M}'
+
+
+class TradeRollup(models.Model):
+    """The single row whose lock lets one trade rollup pass run at a time."""
+
+
+class PriceBucket(models.Model):
+    """
+    NPC sales and market trades of one crop type during the bucket starting
+    at ``starts_at``, added to by every process. ``game.pricing`` keeps the
+    recent ones in memory to price NPC sales.
+    """
+    crop_type = models.ForeignKey(CropType, on_delete=models.CASCADE, related_name='+')
+    starts_at = models.DateTimeField()
+    npc_quantity = models.PositiveBigIntegerField(default=0)
+    trade_quantity = models.PositiveBigIntegerField(default=0)
+    trade_value = models.PositiveBigIntegerField(default=0)  # coins
+
+    class Meta:
+        constraints = [
+            # starts_at first: the window is read and pruned by time across all crops
+            models.UniqueConstraint(fields=['starts_at', 'crop_type'], name='price_bucket_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.crop_type_id} @ {self.starts_at:%Y-%m-%d %H:%M}'
+
+
+class ArchivedListing(models.Model):
+    """
+    A sold, expired or cancelled MarketListing, moved here with its id by
+    ``game.listings.compact_listings`` so that the MarketListing table only
+    holds open listings. Farm and crop type ids are plain integers, as in
+    Trade.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    seller_id = models.BigIntegerField()
+    crop_type_id = models.BigIntegerField()
+    quantity = models.PositiveIntegerField()
+    unit_price = models.PositiveIntegerField()
+    active = models.BooleanField()
+    created_at = models.DateTimeField()
+    expires_at = models.DateTimeField(null=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'{self.quantity} x {self.crop_type_id} @ {self.unit_price}c (archived listing {self.id})'
+
+
+class LedgerEntry(models.Model):
+    """
+    One coin movement for a farm. Entries are only ever appended; a farm's
+    balance at any time is the sum of its entries up to then (see
+    ``game.ledger.balance_at``).
+
+    Market sale proceeds are written unsettled so that a trade never has to
+    touch the seller's Farm row; ``game.ledger.settle_pending`` folds them
+    into ``Farm.balance`` later.
+    """
+    class Reason(models.TextChoices):
+        OPENING = 'opening', 'Opening balance'
+        SEEDS = 'seeds', 'Seeds'
+        NPC_SALE = 'npc_sale', 'Sale to NPC'
+        CONTRACT = 'contract', 'Contract reward'
+        EXPANSION = 'expansion', 'Farm expansion'
+        MARKET_PURCHASE = 'market_purchase', 'Market purchase'
+        MARKET_SALE = 'market_sale', 'Market sale'
+
+    farm = models.ForeignKey(Farm, on_delete=models.CASCADE, related_name='ledger_entries')
+    amount = models.IntegerField()  # positive credits, negative debits
+    reason = models.CharField(max_length=20, choices=Reason.choices)
+    created_at = models.DateTimeField(default=timezone.now)
+    settled = models.BooleanField(default=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['farm', 'created_at'], name='ledger_farm_created_idx'),
+            models.Index(fields=['farm'], condition=models.Q(settled=False), name='ledger_unsettled_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.amount:+d}c {self.reason} (farm={self.farm_id})'
+
+class BalanceSnapshot(models.Model):
+    """A farm's ledger balance as of ``taken_at``, so balance_at only sums entries since."""
+    farm = models.ForeignKey(Farm, on_delete=models.CASCADE, related_name='balance_snapshots')
+    balance = models.IntegerField()
+    taken_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['farm', 'taken_at'], name='snapshot_farm_taken_idx'),
+        ]
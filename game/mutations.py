@@ -0,0 +1,119 @@
+"""
+Atomic balance, inventory and planting mutations.
+
+Each function is a single conditional ``UPDATE`` (or upsert) that checks and
+changes the row in the database and returns the new value with
+``RETURNING``, so concurrent requests for the same farm cannot lose updates
+and no row has to be read or locked first. Call them inside
+``transaction.atomic()`` when several must succeed together.
+"""
+from django.db import connection
+
+from .models import Farm, InventoryItem, Plot, PriceBucket
+
+
+def _qn(name):
+    return connection.ops.quote_name(name)
+
+
+def _column(model, field_name):
+    return _qn(model._meta.get_field(field_name).column)
+
+
+def _fetchone(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchone()
+
+
+def debit_balance(farm_id, amount):
+    """Take ``amount`` coins from the farm if it has them; return the new balance or ``None``."""
+    table, balance, pk = _qn(Farm._meta.db_table), _column(Farm, 'balance'), _column(Farm, 'id')
+    row = _fetchone(
+        f'UPDATE {table} SET {balance} = {balance} - %s WHERE {pk} = %s AND {balance} >= %s RETURNING {balance}',
+        [amount, farm_id, amount],
+    )
+    return row[0] if row else None
+
+
+def credit_balance(farm_id, amount):
+    """Give ``amount`` coins to the farm and return the new balance."""
+    table, balance, pk = _qn(Farm._meta.db_table), _column(Farm, 'balance'), _column(Farm, 'id')
+    row = _fetchone(
+        f'UPDATE {table} SET {balance} = {balance} + %s WHERE {pk} = %s RETURNING {balance}',
+        [amount, farm_id],
+    )
+    if row is None:
+        raise Farm.DoesNotExist(farm_id)
+    return row[0]
+
+
+def add_inventory(farm_id, crop_type_id, quantity):
+    """
+    Add ``quantity`` of a crop to the farm's inventory, creating the item if
+    needed. Returns ``(item_id, new_quantity)``.
+    """
+    table = _qn(InventoryItem._meta.db_table)
+    farm, crop_type, amount = (
+        _column(InventoryItem, 'farm'), _column(InventoryItem, 'crop_type'), _column(InventoryItem, 'quantity'),
+    )
+    return _fetchone(
+        f'INSERT INTO {table} ({farm}, {crop_type}, {amount}) VALUES (%s, %s, %s) '
+        f'ON CONFLICT ({farm}, {crop_type}) DO UPDATE SET {amount} = {table}.{amount} + EXCLUDED.{amount} '
+        f'RETURNING {_column(InventoryItem, "id")}, {amount}',
+        [farm_id, crop_type_id, quantity],
+    )
+
+
+def take_inventory(farm_id, crop_type_id, quantity):
+    """
+    Remove ``quantity`` of a crop from the farm's inventory if it holds that
+    many. Returns ``(item_id, new_quantity)``, or ``None`` if it does not.
+    """
+    table = _qn(InventoryItem._meta.db_table)
+    farm, crop_type, amount = (
+        _column(InventoryItem, 'farm'), _column(InventoryItem, 'crop_type'), _column(InventoryItem, 'quantity'),
+    )
+    return _fetchone(
+        f'UPDATE {table} SET {amount} = {amount} - %s '
+        f'WHERE {farm} = %s AND {crop_type} = %s AND {amount} >= %s '
+        f'RETURNING {_column(InventoryItem, "id")}, {amount}',
+        [quantity, farm_id, crop_type_id, quantity],
+    )
+
+
+def plant_plots(plot_ids, crop_type_id, planted_at, harvest_ready_at):
+    """Plant whichever of ``plot_ids`` are still empty and return their ids."""
+    if not plot_ids:
+        return []
+    table = _qn(Plot._meta.db_table)
+    crop_type, planted, ready = (
+        _column(Plot, 'crop_type'), _column(Plot, 'planted_at'), _column(Plot, 'harvest_ready_at'),
+    )
+    pk = _column(Plot, 'id')
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} SET {crop_type} = %s, {planted} = %s, {ready} = %s '
+            f'WHERE {pk} IN ({", ".join(["%s"] * len(plot_ids))}) AND {crop_type} IS NULL RETURNING {pk}',
+            [crop_type_id, connection.ops.adapt_datetimefield_value(planted_at),
+             connection.ops.adapt_datetimefield_value(harvest_ready_at), *plot_ids],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def add_price_activity(crop_type_id, starts_at, npc_quantity, trade_quantity, trade_value):
+    """Add NPC sales and market trades to a crop's PriceBucket, creating it if needed."""
+    table = _qn(PriceBucket._meta.db_table)
+    columns = [
+        _column(PriceBucket, name)
+        for name in ('crop_type', 'starts_at', 'npc_quantity', 'trade_quantity', 'trade_value')
+    ]
+    crop_type, starts, *amounts = columns
+    updates = ', '.join(f'{amount} = {table}.{amount} + EXCLUDED.{amount}' for amount in amounts)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({", ".join(columns)}) VALUES (%s, %s, %s, %s, %s) '
+            f'ON CONFLICT ({starts}, {crop_type}) DO UPDATE SET {updates}',
+            [crop_type_id, connection.ops.adapt_datetimefield_value(starts_at),
+             npc_quantity, trade_quantity, trade_value],
+        )
@@ -0,0 +1,264 @@
+"""
+In-memory order books for the crop market.
+
+Each crop type gets an ``OrderBook`` holding its open ``MarketListing`` rows as
+asks in a heap ordered by price, then listing id (listing ids grow with
+creation time, so this is price-time priority). Buy orders are matched against
+the book in memory and the resulting trades are written back with
+``persist_trades``, which applies a whole batch of trades in one transaction
+using conditional updates. The database stays the source of truth: if a
+listing changed underneath the book, persisting raises ``StaleOrderBook`` and
+the book is reloaded.
+
+Bids are immediate-or-cancel: a limit bid fills whatever it can at or below
+its price and the rest is dropped, so the book never holds unfunded orders.
+"""
+import heapq
+import threading
+import time
+from collections import defaultdict
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .history import log_trades
+from .ledger import debit, record
+from .models import LedgerEntry, MarketListing
+from .mutations import add_inventory
+from .pricing import record_trades
+from .versions import market_epoch
+
+
+class StaleOrderBook(Exception):
+    """A listing no longer has the quantity the book thought it had."""
+
+
+class InsufficientFunds(Exception):
+    """A buyer cannot pay for the trades matched on their behalf."""
+
+
+class Fill(NamedTuple):
+    listing_id: int
+    seller_id: int
+    quantity: int
+    unit_price: int
+
+
+class Execution(NamedTuple):
+    """A fill bought by ``buyer_id``, as written by ``persist_trades`` (and logged as a ``models.Trade``)."""
+    buyer_id: int
+    crop_type_id: int
+    listing_id: int
+    seller_id: int
+    quantity: int
+    unit_price: int
+
+
+# heap entry layout: [unit_price, listing_id, seller_id, quantity]
+PRICE, LISTING, SELLER, QUANTITY = range(4)
+
+
+class OrderBook:
+    def __init__(self, crop_type_id):
+        self.crop_type_id = crop_type_id
+        self.lock = threading.Lock()
+        self.loaded_at = 0.0
+        self.epoch = None
+        self._asks = []
+        self._entries = {}
+
+    def load(self):
+        """Replace the book's contents with the open listings in the database."""
+        # read first: an epoch bumped while this loads makes the next get reload again
+        epoch = market_epoch()
+        rows = MarketListing.objects.filter(
+            crop_type_id=self.crop_type_id,
+            active=True,
+            quantity__gt=0,
+        ).values_list('unit_price', 'id', 'seller_id', 'quantity')
+        with self.lock:
+            self._asks = [list(row) for row in rows]
+            heapq.heapify(self._asks)
+            self._entries = {entry[LISTING]: entry for entry in self._asks}
+            self.loaded_at = time.monotonic()
+            self.epoch = epoch
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, listing_id, seller_id, quantity, unit_price):
+        with self.lock:
+            if listing_id in self._entries or quantity <= 0:
+                return
+            entry = [unit_price, listing_id, seller_id, quantity]
+            self._entries[listing_id] = entry
+            heapq.heappush(self._asks, entry)
+
+    def remove(self, listing_id):
+        with self.lock:
+            entry = self._entries.pop(listing_id, None)
+            if entry is not None:
+                # removed lazily from the heap when it reaches the top
+                entry[QUANTITY] = 0
+
+    def best_ask(self):
+        """Return ``(unit_price, quantity)`` of the best open ask, or ``None``."""
+        with self.lock:
+            self._discard_dead()
+            if not self._asks:
+                return None
+            entry = self._asks[0]
+            return entry[PRICE], entry[QUANTITY]
+
+    def asks(self):
+        """Return open asks as ``(unit_price, listing_id, seller_id, quantity)`` in priority order."""
+        with self.lock:
+            return sorted(tuple(entry) for entry in self._entries.values())
+
+    def match(self, quantity, limit_price=None, budget=None, exclude_seller=None):
+        """
+        Take up to ``quantity`` units off the book, best price first.
+
+        Stops at asks priced above ``limit_price`` and once ``budget`` coins
+        are spent. Asks from ``exclude_seller`` are skipped. Returns the list
+        of fills; the matched quantity is removed from the book immediately.
+        """
+        fills = []
+        skipped = []
+        with self.lock:
+            while quantity > 0 and self._asks:
+                entry = self._asks[0]
+                if entry[QUANTITY] <= 0:
+                    heapq.heappop(self._asks)
+                    continue
+                price = entry[PRICE]
+                if limit_price is not None and price > limit_price:
+                    break
+                if entry[SELLER] == exclude_seller:
+                    skipped.append(heapq.heappop(self._asks))
+                    continue
+
+                take = min(quantity, entry[QUANTITY])
+                if budget is not None and price:
+                    take = min(take, budget // price)
+                    if take <= 0:
+                        break
+                    budget -= take * price
+
+                fills.append(Fill(entry[LISTING], entry[SELLER], take, price))
+                quantity -= take
+                entry[QUANTITY] -= take
+                if entry[QUANTITY] == 0:
+                    heapq.heappop(self._asks)
+                    del self._entries[entry[LISTING]]
+
+            for entry in skipped:
+                heapq.heappush(self._asks, entry)
+        return fills
+
+    def restore(self, fills):
+        """Put the quantity of fills that could not be persisted back on the book."""
+        with self.lock:
+            for fill in fills:
+                entry = self._entries.get(fill.listing_id)
+                if entry is not None:
+                    entry[QUANTITY] += fill.quantity
+                    continue
+                entry = [fill.unit_price, fill.listing_id, fill.seller_id, fill.quantity]
+                self._entries[fill.listing_id] = entry
+                heapq.heappush(self._asks, entry)
+
+    def _discard_dead(self):
+        while self._asks and self._asks[0][QUANTITY] <= 0:
+            heapq.heappop(self._asks)
+
+
+_books = {}
+_books_lock = threading.Lock()
+
+
+def get_order_book(crop_type_id):
+    """
+    Return the process-wide book for ``crop_type_id``, loading it on first use
+    and again once it is older than ``GAME_ORDER_BOOK_MAX_AGE`` seconds so that
+    listings written by other processes are picked up, or at once when the
+    market epoch moves.
+    """
+    max_age = getattr(settings, 'GAME_ORDER_BOOK_MAX_AGE', 5)
+    with _books_lock:
+        book = _books.get(crop_type_id)
+        if book is None:
+            book = _books[crop_type_id] = OrderBook(crop_type_id)
+    if book.epoch != market_epoch() or time.monotonic() - book.loaded_at > max_age:
+        book.load()
+    return book
+
+
+def listing_opened(listing):
+    """Add a newly created listing to its crop's book if that book is loaded."""
+    book = _books.get(listing.crop_type_id)
+    if book is not None:
+        book.add(listing.id, listing.seller_id, listing.quantity, listing.unit_price)
+
+
+def listing_closed(crop_type_id, listing_id):
+    book = _books.get(crop_type_id)
+    if book is not None:
+        book.remove(listing_id)
+
+
+def reset_order_books():
+    with _books_lock:
+        _books.clear()
+
+
+def persist_trades(trades):
+    """
+    Write a batch of ``Execution`` trades in one transaction.
+
+    Listing quantities, buyer balances and inventories are aggregated across
+    the batch first, so each listing, farm and inventory row is written once
+    with a conditional update. Rows are updated in id order to keep lock
+    ordering consistent between concurrent batches. Sellers are paid with
+    unsettled ledger entries, so their Farm rows are not touched at all.
+    """
+    sold = defaultdict(int)
+    spent = defaultdict(int)
+    earned = defaultdict(int)
+    bought = defaultdict(int)
+    for trade in trades:
+        total = trade.quantity * trade.unit_price
+        sold[trade.listing_id] += trade.quantity
+        spent[trade.buyer_id] += total
+        earned[trade.seller_id] += total
+        bought[trade.buyer_id, trade.crop_type_id] += trade.quantity
+
+    with transaction.atomic():
+        for listing_id in sorted(sold):
+            updated = MarketListing.objects.filter(
+                id=listing_id,
+                active=True,
+                quantity__gte=sold[listing_id],
+            ).update(quantity=F('quantity') - sold[listing_id])
+            if not updated:
+                raise StaleOrderBook(listing_id)
+        MarketListing.objects.filter(id__in=sold, quantity=0).update(active=False)
+
+        for farm_id in sorted(spent):
+            if debit(farm_id, spent[farm_id]) is None:
+                raise InsufficientFunds(farm_id)
+        record(
+            [LedgerEntry(farm_id=farm_id, amount=-total, reason=LedgerEntry.Reason.MARKET_PURCHASE)
+             for farm_id, total in sorted(spent.items())]
+            + [LedgerEntry(farm_id=farm_id, amount=total, reason=LedgerEntry.Reason.MARKET_SALE, settled=False)
+               for farm_id, total in sorted(earned.items())]
+        )
+
+        for (farm_id, crop_type_id), quantity in sorted(bought.items()):
+            add_inventory(farm_id, crop_type_id, quantity)
+        log_trades(trades)
+        transaction.on_commit(
+            lambda: record_trades((trade.crop_type_id, trade.quantity, trade.unit_price) for trade in trades)
+        )
@@ -0,0 +1,208 @@
+"""
+Dynamic NPC prices.
+
+With ``GAME_DYNAMIC_NPC_PRICES`` on, what NPCs pay for a crop falls the more
+of it players have sold them recently, and never exceeds what the crop has
+been trading for on the market, so buying on the market to sell to NPCs does
+not pay. With it off, NPCs pay ``base_price``.
+
+Each process keeps a ``PriceWindow`` per crop type: a ring of ``BUCKETS``
+buckets covering the last ``GAME_NPC_PRICE_WINDOW`` seconds, with running
+totals of units sold to NPCs, units traded and coins traded. Sales and trades
+are added to the current bucket and the totals; buckets leaving the window are
+subtracted as it moves on. Quoting a price therefore reads three totals and
+never queries the database.
+
+Every ``GAME_NPC_PRICE_SYNC`` seconds a process adds what it recorded to the
+shared ``PriceBucket`` rows and reloads its windows from them, so every
+process prices from the activity of all of them and a restarted one starts
+warm. A process that dies loses at most its last unsynced seconds. The sync
+runs outside any transaction, before a sale is priced and after a sale or
+trade is recorded, and a failed one is logged and retried later: pricing
+carries on from the current windows.
+"""
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+
+from .models import PriceBucket
+from .mutations import add_price_activity
+
+BUCKETS = 60
+# the market's average price counts once this many units traded in the window
+MIN_MARKET_QUANTITY = 10
+# NPCs pay at least this share of base_price, however much is dumped on them
+NPC_PRICE_FLOOR = 0.25
+
+logger = logging.getLogger(__name__)
+
+
+class PriceWindow:
+    """
+    Rolling totals of one crop's NPC sales and market trades over the last
+    ``BUCKETS`` buckets. Amounts are ``[npc_quantity, trade_quantity, trade_value]``.
+    """
+
+    def __init__(self):
+        self.head = None  # index of the newest bucket
+        self.buckets = [[0, 0, 0] for _ in range(BUCKETS)]
+        self.totals = [0, 0, 0]
+
+    def add(self, index, amounts):
+        if self.head is None or index > self.head:
+            self._advance(index)
+        elif index <= self.head - BUCKETS:
+            return  # already out of the window
+        bucket = self.buckets[index % BUCKETS]
+        for i, amount in enumerate(amounts):
+            bucket[i] += amount
+            self.totals[i] += amount
+
+    def totals_at(self, index):
+        """Return ``(npc_quantity, trade_quantity, trade_value)`` over the window ending at bucket ``index``."""
+        if self.head is None or index > self.head:
+            self._advance(index)
+        return tuple(self.totals)
+
+    def _advance(self, index):
+        if self.head is None or index - self.head >= BUCKETS:
+            self.buckets = [[0, 0, 0] for _ in range(BUCKETS)]
+            self.totals = [0, 0, 0]
+        else:
+            for expired in range(self.head + 1, index + 1):
+                bucket = self.buckets[expired % BUCKETS]
+                for i in range(3):
+                    self.totals[i] -= bucket[i]
+                    bucket[i] = 0
+        self.head = index
+
+
+class PriceEngine:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        self.windows = defaultdict(PriceWindow)
+        # (crop_type_id, bucket index) -> amounts recorded here and not yet added to PriceBucket
+        self.pending = defaultdict(lambda: [0, 0, 0])
+        self.synced_at = 0.0
+
+    @staticmethod
+    def bucket_seconds():
+        return getattr(settings, 'GAME_NPC_PRICE_WINDOW', 3600) / BUCKETS
+
+    def index(self, now=None):
+        return int((time.time() if now is None else now) // self.bucket_seconds())
+
+    def starts_at(self, index):
+        return datetime.fromtimestamp(index * self.bucket_seconds(), tz=dt_timezone.utc)
+
+    def record(self, crop_type_id, amounts, now=None):
+        index = self.index(now)
+        with self.lock:
+            self.windows[crop_type_id].add(index, amounts)
+            pending = self.pending[crop_type_id, index]
+            for i, amount in enumerate(amounts):
+                pending[i] += amount
+
+    def quote(self, crop_type, quantity, now=None):
+        """Return the coins NPCs pay for ``quantity`` units of ``crop_type``."""
+        with self.lock:
+            npc, traded, value = self.windows[crop_type.id].totals_at(self.index(now))
+        reference = crop_type.base_price
+        if traded >= MIN_MARKET_QUANTITY:
+            reference = min(reference, value / traded)
+        # the price is reference * depth / (depth + sold); pay its mean over the units of this sale
+        depth = getattr(settings, 'GAME_NPC_PRICE_DEPTH', 1000)
+        factor = depth / quantity * math.log1p(quantity / (depth + npc))
+        # the floor never lifts the price above what the market pays
+        unit_price = min(max(reference * factor, crop_type.base_price * NPC_PRICE_FLOOR), reference)
+        return round(quantity * unit_price)
+
+    def sync_if_due(self):
+        if time.monotonic() - self.synced_at < getattr(settings, 'GAME_NPC_PRICE_SYNC', 5):
+            return
+        # one thread syncs; the others keep pricing from the current windows
+        if self.sync_lock.acquire(blocking=False):
+            try:
+                self.sync()
+            except DatabaseError:
+                # the pending activity was kept; wait a full period before trying again
+                self.synced_at = time.monotonic()
+                logger.exception('Syncing NPC prices failed')
+            finally:
+                self.sync_lock.release()
+
+    def sync(self, now=None):
+        """Add pending activity to the PriceBucket rows and reload the windows from them."""
+        with self.lock:
+            pending, self.pending = self.pending, defaultdict(lambda: [0, 0, 0])
+        try:
+            with transaction.atomic():
+                # in key order, so concurrent syncs lock rows in the same order
+                for (crop_type_id, index), amounts in sorted(pending.items()):
+                    add_price_activity(crop_type_id, self.starts_at(index), *amounts)
+        except DatabaseError:
+            with self.lock:
+                for key, amounts in pending.items():
+                    for i, amount in enumerate(amounts):
+                        self.pending[key][i] += amount
+            raise
+
+        oldest = self.starts_at(self.index(now) - BUCKETS)
+        PriceBucket.objects.filter(starts_at__lte=oldest).delete()
+        rows = PriceBucket.objects.filter(starts_at__gt=oldest).values_list(
+            'crop_type_id', 'starts_at', 'npc_quantity', 'trade_quantity', 'trade_value',
+        )
+        windows = defaultdict(PriceWindow)
+        for crop_type_id, starts_at, *amounts in rows:
+            windows[crop_type_id].add(round(starts_at.timestamp() / self.bucket_seconds()), amounts)
+        with self.lock:
+            # what was recorded while this ran is not in the rows yet
+            for (crop_type_id, index), amounts in self.pending.items():
+                windows[crop_type_id].add(index, amounts)
+            self.windows = windows
+            self.synced_at = time.monotonic()
+
+
+_engine = PriceEngine()
+
+
+def npc_sale_value(crop_type, quantity):
+    """Return the coins NPCs pay for ``quantity`` units of ``crop_type`` now."""
+    if not settings.GAME_DYNAMIC_NPC_PRICES:
+        return quantity * crop_type.base_price
+    _engine.sync_if_due()
+    return _engine.quote(crop_type, quantity)
+
+
+def record_npc_sale(crop_type_id, quantity):
+    """Add an NPC sale to the windows. Call once the sale has committed."""
+    if settings.GAME_DYNAMIC_NPC_PRICES:
+        _engine.record(crop_type_id, (quantity, 0, 0))
+        _engine.sync_if_due()
+
+
+def record_trades(trades):
+    """
+    Add ``(crop_type_id, quantity, unit_price)`` market trades to the windows.
+    Call once the trades have committed.
+    """
+    if settings.GAME_DYNAMIC_NPC_PRICES:
+        for crop_type_id, quantity, unit_price in trades:
+            _engine.record(crop_type_id, (0, quantity, quantity * unit_price))
+        _engine.sync_if_due()
+
+
+def sync_prices():
+    _engine.sync()
+
+
+def reset_prices():
+    global _engine
+    _engine = PriceEngine()
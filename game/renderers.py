@@ -0,0 +1,33 @@
+"""
+A drop-in for DRF's ``JSONRenderer`` that encodes with orjson when it is
+installed. The bytes are the same as ``JSONRenderer``'s with the default
+settings (compact, unescaped unicode, ``\\u2028``/``\\u2029`` escaped), so
+clients cannot tell which one produced a response. Without orjson, or for
+anything orjson cannot encode the same way, it falls back to DRF's renderer.
+"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # optional; only makes large responses faster
+    orjson = None
+
+_encoder = JSONEncoder()
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or self.ensure_ascii or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            # dates go through DRF's encoder, which trims microseconds to milliseconds
+            ret = orjson.dumps(data, default=_encoder.default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
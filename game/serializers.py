@@ -1,33 +1,84 @@
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Contract, Farm, CropType, MarketListing, Plot, InventoryItem
+from rest_framework.exceptions import ParseError
+from .catalog import get_catalog, serialized_crop_type
+from .models import Candle, Contract, Farm, CropType, MarketListing, Plot, InventoryItem
 
 class FarmSerializer(serializers.ModelSerializer):
     class Meta:
         model = Farm
-        fields = ['id', 'name', 'balance']
+        fields = ['id', 'name', 'balance', 'grid_size']
 
 class CropTypeSerializer(serializers.ModelSerializer):
     class Meta:
         model = CropType
         fields = ['id', 'name', 'grow_time_seconds', 'base_price', 'seed_price', 'emoji']
 
-class PlotSerializer(serializers.ModelSerializer):
-    crop_type = CropTypeSerializer(read_only=True)
+class CatalogCropTypeField(serializers.Field):
+    """
+    Read-only nested crop type taken from the cached catalog, so the related
+    CropType row is neither fetched nor re-serialized. Point ``source`` at the
+    foreign key's ``_id`` attribute.
+    """
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+        self.catalog = None
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        if request is not None and request.query_params.get('crop_types') == 'id':
+            # the client resolves ids against its copy of /api/crop-types/
+            return value
+        if self.catalog is None:
+            # one catalog (and one cache read) for every row this field serializes
+            self.catalog = get_catalog()
+        return serialized_crop_type(value, self.catalog)
+
+def requested_fields(params, available):
+    """
+    Return the field names listed in the ``fields`` query parameter, or
+    ``None`` if there is none. Raises ParseError for names not in ``available``.
+    """
+    if 'fields' not in params:
+        return None
+    fields = [name for name in params['fields'].split(',') if name]
+    unknown = set(fields) - set(available)
+    if unknown:
+        raise ParseError(f'Unknown fields: {", ".join(sorted(unknown))}.')
+    return fields
+
+class SparseFieldsMixin:
+    """
+    Render only the fields named in ``?fields=`` when the serializer is given
+    the request in its context; the list endpoints do, event payloads don't.
+    """
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        wanted = requested_fields(request.query_params, fields) if request is not None else None
+        if wanted is None:
+            return fields
+        return {name: field for name, field in fields.items() if name in wanted}
+
+class PlotSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    crop_type = CatalogCropTypeField(source='crop_type_id')
 
     class Meta:
         model = Plot
         fields = ['id', 'x', 'y', 'crop_type', 'planted_at', 'harvest_ready_at']
 
-class InventoryItemSerializer(serializers.ModelSerializer):
-    crop_type = CropTypeSerializer(read_only=True)
+class InventoryItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    crop_type = CatalogCropTypeField(source='crop_type_id')
 
     class Meta:
         model = InventoryItem
         fields = ['id', 'crop_type', 'quantity']
 
-class ContractSerializer(serializers.ModelSerializer):
-    crop_type = CropTypeSerializer(read_only=True)
-    unlocks_crop = CropTypeSerializer(read_only=True)
+class ContractSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    crop_type = CatalogCropTypeField(source='crop_type_id')
+    unlocks_crop = CatalogCropTypeField(source='unlocks_crop_id')
     is_active = serializers.SerializerMethodField()
     is_completed = serializers.SerializerMethodField()
 
@@ -50,8 +101,8 @@ class ContractSerializer(serializers.ModelSerializer):
     def get_is_completed(self, obj):
         return obj.is_completed
 
-class MarketListingSerializer(serializers.ModelSerializer):
-    crop_type = CropTypeSerializer(read_only=True)
+class MarketListingSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    crop_type = CatalogCropTypeField(source='crop_type_id')
     seller_name = serializers.CharField(source='seller.name', read_only=True)
 
     class Meta:
@@ -65,3 +116,102 @@ class MarketListingSerializer(serializers.ModelSerializer):
             'active',
             'created_at',
         ]
+
+class CandleSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Candle
+        fields = ['starts_at', 'open', 'high', 'low', 'close', 'volume', 'value', 'trades']
+
+class RowSerializer:
+    """
+    Read-only fast path for the list endpoints: produces exactly what
+    ``serializer_class(..., many=True).data`` would, honouring ``?fields=``
+    and ``?crop_types=id``, but from ``.values()`` rows or plain instances
+    with one dict built per row and no field machinery.
+    """
+    serializer_class = None
+    sources = {}  # output name -> values() lookup or attribute, where they differ
+    crop_types = ()
+    datetimes = ()
+
+    def __init__(self, request=None, catalog=None):
+        # a DRF request, or a plain Django one from the async views
+        params = getattr(request, 'query_params', request.GET) if request is not None else {}
+        names = self.serializer_class.Meta.fields
+        wanted = requested_fields(params, names)
+        self.fields = [name for name in names if wanted is None or name in wanted]
+        self.crop_ids = params.get('crop_types') == 'id'
+        self.catalog = catalog
+
+    def values(self, queryset, *extra):
+        """``queryset.values()`` with the columns the fields need, plus ``extra`` (e.g. an ordering key)."""
+        return queryset.values(*dict.fromkeys([self.sources.get(name, name) for name in self.fields] + list(extra)))
+
+    def data(self, rows):
+        """Serialize dicts from ``values()``."""
+        plan = self._plan()
+        return [{name: convert(row[source]) if convert else row[source] for name, source, convert in plan}
+                for row in rows]
+
+    def data_from_objects(self, objects):
+        """Serialize model instances, e.g. plots decoded from a packed grid."""
+        plan = self._plan()
+        return [{name: convert(getattr(obj, source)) if convert else getattr(obj, source)
+                 for name, source, convert in plan}
+                for obj in objects]
+
+    def _plan(self):
+        crop_type = None if self.crop_ids else _crop_type_converter(self.catalog)
+        datetime = _datetime_converter()
+        return [
+            (name, self.sources.get(name, name),
+             crop_type if name in self.crop_types else datetime if name in self.datetimes else None)
+            for name in self.fields
+        ]
+
+def _crop_type_converter(catalog=None):
+    serialized = (catalog or get_catalog()).serialized
+
+    def convert(crop_type_id):
+        data = serialized.get(crop_type_id)
+        return dict(data) if data is not None else None
+    return convert
+
+def _datetime_converter():
+    # DateTimeField.to_representation with the default ISO 8601 format
+    tz = timezone.get_current_timezone() if settings.USE_TZ else None
+
+    def convert(value):
+        if not value:
+            return None
+        value = (value.astimezone(tz) if tz is not None else value).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return convert
+
+class PlotRows(RowSerializer):
+    serializer_class = PlotSerializer
+    sources = {'crop_type': 'crop_type_id'}
+    crop_types = ('crop_type',)
+    datetimes = ('planted_at', 'harvest_ready_at')
+
+class InventoryItemRows(RowSerializer):
+    serializer_class = InventoryItemSerializer
+    sources = {'crop_type': 'crop_type_id'}
+    crop_types = ('crop_type',)
+
+class ContractRows(RowSerializer):
+    # is_active and is_completed are properties, so contracts only come as instances
+    serializer_class = ContractSerializer
+    sources = {'crop_type': 'crop_type_id', 'unlocks_crop': 'unlocks_crop_id'}
+    crop_types = ('crop_type', 'unlocks_crop')
+    datetimes = ('created_at', 'expires_at')
+
+class MarketListingRows(RowSerializer):
+    serializer_class = MarketListingSerializer
+    sources = {'crop_type': 'crop_type_id', 'seller_name': 'seller__name'}
+    crop_types = ('crop_type',)
+    datetimes = ('created_at',)
+
+class CandleRows(RowSerializer):
+    serializer_class = CandleSerializer
+    datetimes = ('starts_at',)
@@ -0,0 +1,36 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .catalog import invalidate_catalog
+from .models import CropType, Farm, InventoryItem, MarketListing, Plot
+from .versions import changed
+
+
+@receiver(post_save, sender=CropType)
+@receiver(post_delete, sender=CropType)
+def crop_type_changed(sender, **kwargs):
+    invalidate_catalog()
+
+
+# the game views bump versions themselves; these catch saves made elsewhere, e.g. in the admin
+@receiver(post_save, sender=Farm)
+@receiver(post_delete, sender=Farm)
+def farm_changed(sender, instance, **kwargs):
+    changed([instance.id])
+
+
+@receiver(post_save, sender=Plot)
+@receiver(post_delete, sender=Plot)
+@receiver(post_save, sender=InventoryItem)
+@receiver(post_delete, sender=InventoryItem)
+def farm_contents_changed(sender, instance, **kwargs):
+    changed([instance.farm_id])
+
+
+@receiver(post_save, sender=MarketListing)
+@receiver(post_delete, sender=MarketListing)
+def listing_changed(sender, instance, signal, **kwargs):
+    # compaction deletes closed listings, which nobody sees anyway
+    if signal is post_delete and not instance.is_open:
+        return
+    changed([instance.seller_id], market=True)
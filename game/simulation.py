@@ -0,0 +1,264 @@
+"""
+Headless, vectorized economy simulator for offline balancing.
+
+``Economy`` steps a population of agent farms through the game's loop with
+NumPy arrays, one element per farm, instead of model instances. It uses the
+crop types from the catalog and the same rules as the game itself: starting
+balance and crop, contract quantities, premiums and unlock chance, seed and
+NPC prices, expansion costs and the market's buyer-pays-seller trades.
+
+Each simulated day, every farm visits a number of times, drawn around its own
+engagement level. A visit:
+
+1. harvests what the farm planted on its previous visit (grow times are
+   minutes, visits hours apart);
+2. receives a fresh batch of contracts, since the last one has expired;
+3. completes what it can from inventory, then buys missing crops on the
+   market when that still leaves a profit and it can pay;
+4. plants every plot it can afford with the crop its contracts need most,
+   or else the one with the best margin over seed;
+5. keeps what open contracts need if it can afford to replant, lists
+   ``list_share`` of the rest on the market while the market pays more than
+   NPCs, and sells the remainder to NPCs at base price;
+6. expands its grid once it holds ``expand_factor`` times the cost.
+
+Market prices move once a day with the ratio of unmet demand to unsold
+supply. Nothing here touches the ORM; the catalog is read once up front.
+NumPy is imported by this module, so import it only where NumPy is
+installed.
+"""
+import numpy as np
+
+from .models import (
+    CONTRACT_PREMIUM_RANGE, CONTRACT_QUANTITY_RANGE, CONTRACT_UNLOCK_CHANCE, GRID_SIZE, MAX_GRID_SIZE,
+    STARTING_BALANCE, STARTING_CROP, expansion_cost,
+)
+
+CONTRACTS_PER_FARM = 3
+
+
+class Economy:
+    def __init__(self, crop_types, farms, visits=8, list_share=0.5, expand_factor=3, price_step=0.1, seed=None):
+        self.rng = np.random.default_rng(seed)
+        self.names = [crop.name for crop in crop_types]
+        self.base_price = np.array([crop.base_price for crop in crop_types], dtype=np.int64)
+        self.seed_price = np.array([crop.seed_price for crop in crop_types], dtype=np.int64)
+        self.list_share = list_share
+        self.expand_factor = expand_factor
+        self.price_step = price_step
+        crops = len(crop_types)
+
+        self.balance = np.full(farms, STARTING_BALANCE, dtype=np.int64)
+        self.size = np.full(farms, GRID_SIZE, dtype=np.int64)
+        self.inventory = np.zeros((farms, crops), dtype=np.int64)
+        self.growing = np.zeros((farms, crops), dtype=np.int64)
+        self.listed = np.zeros((farms, crops), dtype=np.int64)
+        self.unlocked = np.zeros((farms, crops), dtype=bool)
+        if STARTING_CROP in self.names:
+            self.unlocked[:, self.names.index(STARTING_CROP)] = True
+        # engagement differs between players: mean visits per day, per farm
+        self.engagement = self.rng.gamma(2.0, visits / 2.0, farms)
+        self.price = self.base_price.astype(np.float64)
+
+        shape = (farms, CONTRACTS_PER_FARM)
+        self.contract_crop = np.zeros(shape, dtype=np.int64)
+        self.contract_quantity = np.zeros(shape, dtype=np.int64)
+        self.contract_reward = np.zeros(shape, dtype=np.int64)
+        self.contract_unlock = np.full(shape, -1, dtype=np.int64)
+        self.contract_open = np.zeros(shape, dtype=bool)
+        self.day = 0
+
+    @property
+    def unit_price(self):
+        """Market listings are priced in whole coins."""
+        return np.maximum(np.rint(self.price), 1).astype(np.int64)
+
+    def run(self, days):
+        """Simulate ``days`` days and return one stats dict per day."""
+        return [self.step() for _ in range(days)]
+
+    def step(self):
+        """Simulate one day."""
+        self.flows = dict.fromkeys(
+            ('npc_sales', 'contract_rewards', 'seeds', 'expansions', 'market_trades', 'market_units',
+             'contracts_completed', 'unlocks', 'expansion_count'), 0,
+        )
+        self.demand = np.zeros(len(self.names), dtype=np.int64)
+        self.supply = np.zeros(len(self.names), dtype=np.int64)
+        supply_before = int(self.balance.sum())
+
+        visits = self.rng.poisson(self.engagement)
+        for visit in range(int(visits.max(initial=0))):
+            self.visit(np.flatnonzero(visits > visit))
+
+        self.price *= np.exp(self.price_step * (self.demand - self.supply) / (self.demand + self.supply + 1))
+        self.price = np.clip(self.price, 1, 10 * self.base_price)
+        self.day += 1
+        return self.stats(supply_before)
+
+    def visit(self, farms):
+        self.inventory[farms] += self.growing[farms]
+        self.growing[farms] = 0
+        self.new_contracts(farms)
+        self.complete_contracts(farms)
+        for slot in range(CONTRACTS_PER_FARM):
+            self.buy_missing(farms, slot)
+        self.complete_contracts(farms)
+        self.plant(farms)
+        self.sell_surplus(farms)
+        self.expand(farms)
+
+    def plantable(self, farms):
+        # a farm without unlocks may plant anything, as in the game
+        plantable = self.unlocked[farms]
+        plantable[~plantable.any(axis=1)] = True
+        return plantable
+
+    def choose(self, mask, count):
+        """For each row of ``mask``, ``count`` random column indexes where it is True."""
+        scores = self.rng.random((len(mask), count, mask.shape[1])) * mask[:, None, :]
+        return scores.argmax(axis=2)
+
+    def new_contracts(self, farms):
+        count = len(farms)
+        crop = self.choose(self.plantable(farms), CONTRACTS_PER_FARM)
+        low, high = CONTRACT_QUANTITY_RANGE
+        quantity = self.rng.integers(low, high + 1, (count, CONTRACTS_PER_FARM))
+        premium = self.rng.uniform(*CONTRACT_PREMIUM_RANGE, (count, CONTRACTS_PER_FARM))
+
+        # at most one contract per batch unlocks a crop the farm does not have
+        locked = ~self.unlocked[farms]
+        can_unlock = locked.any(axis=1)
+        unlock = np.full((count, CONTRACTS_PER_FARM), -1, dtype=np.int64)
+        for slot in range(CONTRACTS_PER_FARM):
+            drawn = can_unlock & (self.rng.random(count) < CONTRACT_UNLOCK_CHANCE)
+            unlock[drawn, slot] = self.choose(locked[drawn], 1)[:, 0]
+            can_unlock &= ~drawn
+
+        self.contract_crop[farms] = crop
+        self.contract_quantity[farms] = quantity
+        self.contract_reward[farms] = (quantity * self.base_price[crop] * premium).astype(np.int64)
+        self.contract_unlock[farms] = unlock
+        self.contract_open[farms] = True
+
+    def complete_contracts(self, farms):
+        for slot in range(CONTRACTS_PER_FARM):
+            crop = self.contract_crop[farms, slot]
+            quantity = self.contract_quantity[farms, slot]
+            done = self.contract_open[farms, slot] & (self.inventory[farms, crop] >= quantity)
+            done_farms, crop, quantity = farms[done], crop[done], quantity[done]
+            reward = self.contract_reward[done_farms, slot]
+
+            self.inventory[done_farms, crop] -= quantity
+            self.balance[done_farms] += reward
+            unlock = self.contract_unlock[done_farms, slot]
+            self.unlocked[done_farms[unlock >= 0], unlock[unlock >= 0]] = True
+            self.contract_open[done_farms, slot] = False
+
+            self.flows['contract_rewards'] += int(reward.sum())
+            self.flows['contracts_completed'] += len(done_farms)
+            self.flows['unlocks'] += int((unlock >= 0).sum())
+
+    def buy_missing(self, farms, slot):
+        """Buy what one contract slot is missing on the market, for the farms it still pays off for."""
+        price = self.unit_price
+        crop = self.contract_crop[farms, slot]
+        missing = self.contract_quantity[farms, slot] - self.inventory[farms, crop]
+        cost = missing * price[crop]
+        wanted = self.contract_open[farms, slot] & (missing > 0)
+        self.demand += np.bincount(crop[wanted], missing[wanted], minlength=len(self.names)).astype(np.int64)
+        buying = wanted & (cost < self.contract_reward[farms, slot]) & (cost <= self.balance[farms])
+        buyers, crop, missing = farms[buying], crop[buying], missing[buying]
+        if not len(buyers):
+            return
+
+        # buyers of each crop are served in random order until its listings run out
+        order = np.lexsort((self.rng.random(len(buyers)), crop))
+        buyers, crop, missing = buyers[order], crop[order], missing[order]
+        total = np.cumsum(missing)
+        first = np.r_[True, crop[1:] != crop[:-1]]
+        served_before = np.maximum.accumulate(np.where(first, total - missing, 0))
+        available = self.listed.sum(axis=0)
+        filled = total - served_before <= available[crop]
+        buyers, crop, missing = buyers[filled], crop[filled], missing[filled]
+
+        self.inventory[buyers, crop] += missing
+        self.balance[buyers] -= missing * price[crop]
+        sold = np.bincount(crop, missing, minlength=len(self.names)).astype(np.int64)
+        for crop_index in np.flatnonzero(sold):
+            self.take_listings(crop_index, sold[crop_index], price[crop_index])
+
+    def take_listings(self, crop, quantity, price):
+        """Take ``quantity`` units of ``crop`` off sellers' listings in random order and pay them."""
+        sellers = np.flatnonzero(self.listed[:, crop])
+        self.rng.shuffle(sellers)
+        listed = self.listed[sellers, crop]
+        sold = np.clip(quantity - (np.cumsum(listed) - listed), 0, listed)
+        self.listed[sellers, crop] -= sold
+        self.balance[sellers] += sold * price
+        self.flows['market_trades'] += int(quantity * price)
+        self.flows['market_units'] += int(quantity)
+
+    def open_needs(self, farms):
+        """Crops each farm's open contracts require, by crop."""
+        needs = np.zeros((len(farms), len(self.names)), dtype=np.int64)
+        rows = np.arange(len(farms))
+        for slot in range(CONTRACTS_PER_FARM):
+            needs[rows, self.contract_crop[farms, slot]] += (
+                self.contract_open[farms, slot] * self.contract_quantity[farms, slot]
+            )
+        return needs
+
+    def plant(self, farms):
+        plantable = self.plantable(farms)
+        shortfall = np.maximum(self.open_needs(farms) - self.inventory[farms], 0) * plantable
+        margin = np.where(plantable, self.base_price - self.seed_price, np.iinfo(np.int64).min)
+        crop = np.where(shortfall.max(axis=1) > 0, shortfall.argmax(axis=1), margin.argmax(axis=1))
+
+        seed_price = self.seed_price[crop]
+        plots = self.size[farms] ** 2
+        planted = np.where(seed_price > 0, np.minimum(plots, self.balance[farms] // np.maximum(seed_price, 1)), plots)
+        self.balance[farms] -= planted * seed_price
+        self.growing[farms, crop] += planted
+        self.flows['seeds'] += int((planted * seed_price).sum())
+
+    def sell_surplus(self, farms):
+        # a farm that cannot pay for its next planting sells what it was saving, too
+        cheapest_seed = np.where(self.plantable(farms), self.seed_price, np.iinfo(np.int64).max).min(axis=1)
+        saving = self.balance[farms] >= self.size[farms] ** 2 * cheapest_seed
+        surplus = np.maximum(self.inventory[farms] - self.open_needs(farms) * saving[:, None], 0)
+        share = np.where(self.unit_price > self.base_price, self.list_share, 0.0)
+        to_list = (surplus * share).astype(np.int64)
+        to_npc = surplus - to_list
+
+        self.inventory[farms] -= surplus
+        self.listed[farms] += to_list
+        self.supply += to_list.sum(axis=0)
+        income = to_npc @ self.base_price
+        self.balance[farms] += income
+        self.flows['npc_sales'] += int(income.sum())
+
+    def expand(self, farms):
+        cost = expansion_cost(self.size[farms], self.size[farms] + 1)
+        growing = (self.size[farms] < MAX_GRID_SIZE) & (self.balance[farms] >= self.expand_factor * cost)
+        grown, cost = farms[growing], cost[growing]
+        self.balance[grown] -= cost
+        self.size[grown] += 1
+        self.flows['expansions'] += int(cost.sum())
+        self.flows['expansion_count'] += len(grown)
+
+    def stats(self, supply_before):
+        coin_supply = int(self.balance.sum())
+        p50, p90, p99 = np.percentile(self.balance, [50, 90, 99])
+        return {
+            'day': self.day,
+            'coin_supply': coin_supply,
+            'coin_supply_change': coin_supply - supply_before,
+            'balance_p50': float(p50),
+            'balance_p90': float(p90),
+            'balance_p99': float(p99),
+            'mean_grid_size': round(float(self.size.mean()), 3),
+            **self.flows,
+            'market_price': dict(zip(self.names, np.round(self.price, 3).tolist())),
+            'market_listed': dict(zip(self.names, self.listed.sum(axis=0).tolist())),
+        }
@@ -7,6 +7,7 @@ function getCookie(name) {
 const csrftoken = getCookie('csrftoken');
 
 let selectedSeedId = null;
+let liveUpdatesActive = false;
 
 function setSelectedSeed(cropTypeId) {
     selectedSeedId = cropTypeId || null;
@@ -18,12 +19,21 @@ function setSelectedSeed(cropTypeId) {
 }
 
 function plantPlot(plotId) {
+    plantAt(`/api/plots/${plotId}/plant/`);
+}
+
+function plantCell(x, y) {
+    // works whether or not the cell has been planted before
+    plantAt(`/api/plots/cells/${x}/${y}/plant/`);
+}
+
+function plantAt(url) {
     if (!selectedSeedId) {
         alert('Choose a seed first');
         return;
     }
 
-    fetch(`/api/plots/${plotId}/plant/`, {
+    fetch(url, {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
@@ -56,7 +66,7 @@ function harvestPlot(plotId) {
     }).then(async (resp) => {
         if (resp.ok) {
             const data = await resp.json();
-            updatePlotCellEmpty(plotId);
+            updatePlotCellEmpty(data.plot);
             if (data.inventory_item) {
                 refreshInventoryItem(data.inventory_item);
             }
@@ -72,6 +82,81 @@ function harvestPlot(plotId) {
     });
 }
 
+function plantAll() {
+    if (!selectedSeedId) {
+        alert('Choose a seed first');
+        return;
+    }
+
+    fetch('/api/plots/plant/', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': csrftoken,
+        },
+        body: JSON.stringify({ crop_type_id: selectedSeedId, plot_ids: 'all' }),
+    }).then(async (resp) => {
+        if (resp.ok) {
+            const data = await resp.json();
+            data.plots.forEach(updatePlotCellGrowing);
+            updateTimers();
+            refreshBalance();
+        } else {
+            let msg = 'Error planting';
+            try {
+                const data = await resp.json();
+                if (data.detail) msg = data.detail;
+            } catch {}
+            alert(msg);
+        }
+    });
+}
+
+function harvestAll() {
+    fetch('/api/plots/harvest/', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': csrftoken,
+        },
+        body: JSON.stringify({ plot_ids: 'all' }),
+    }).then(async (resp) => {
+        if (resp.ok) {
+            const data = await resp.json();
+            data.plots.forEach(updatePlotCellEmpty);
+            data.inventory_items.forEach(refreshInventoryItem);
+        } else {
+            let msg = 'Error harvesting';
+            try {
+                const data = await resp.json();
+                if (data.detail) msg = data.detail;
+            } catch {}
+            alert(msg);
+        }
+    });
+}
+
+function expandFarm() {
+    fetch('/api/farm/expand/', {
+        method: 'POST',
+        headers: {
+            'X-CSRFToken': csrftoken,
+        },
+    }).then(async (resp) => {
+        if (resp.ok) {
+            // the new cells and the next expansion price come with the page
+            window.location.reload();
+        } else {
+            let msg = 'Error expanding farm';
+            try {
+                const data = await resp.json();
+                if (data.detail) msg = data.detail;
+            } catch {}
+            alert(msg);
+        }
+    });
+}
+
 function sellNpc(cropTypeId, quantity) {
     fetch('/api/inventory/sell-npc/', {
         method: 'POST',
@@ -85,7 +170,9 @@ function sellNpc(cropTypeId, quantity) {
         console.log('sell-npc response:', resp.status, text);
 
         if (resp.ok) {
-            window.location.reload();
+            const data = JSON.parse(text);
+            setBalance(data.balance);
+            refreshInventoryItem(data.inventory_item);
         } else {
             let msg = 'Error selling';
             try {
@@ -201,73 +288,119 @@ function initTimers() {
     setInterval(updateTimers, 1000);
 }
 
-function initContractBoard() {
-    const items = Array.from(document.querySelectorAll('.contract-item'));
-    const timerEl = document.getElementById('contracts-timer');
-    const expiresAt = timerEl ? new Date(timerEl.getAttribute('data-expires-at')).getTime() : null;
-    if (!items.length || !timerEl || !expiresAt) return;
+function formatCountdown(seconds) {
+    if (seconds <= 0) return 'Expired';
+    const minutes = Math.floor(seconds / 60);
+    const secs = Math.max(0, seconds % 60);
+    return `${minutes}:${secs.toString().padStart(2, '0')}`;
+}
 
-    let refreshed = false;
+let contractsRefreshRequested = false;
 
-    function formatCountdown(seconds) {
-        if (seconds <= 0) return 'Expired';
-        const minutes = Math.floor(seconds / 60);
-        const secs = Math.max(0, seconds % 60);
-        return `${minutes}:${secs.toString().padStart(2, '0')}`;
+function updateContractTimers() {
+    const timerEl = document.getElementById('contracts-timer');
+    const expiresAt = timerEl ? new Date(timerEl.getAttribute('data-expires-at')).getTime() : null;
+    if (!expiresAt) return;
+
+    const diffSeconds = Math.floor((expiresAt - Date.now()) / 1000);
+    if (diffSeconds <= 0) {
+        timerEl.textContent = 'New Contracts In: 0:00';
+        document.querySelectorAll('.contract-item').forEach(item => {
+            item.classList.add('contract-expired');
+            item.classList.remove('contract-active');
+        });
+        // the live update stream pushes the next batch; without it, reload
+        if (!liveUpdatesActive && !contractsRefreshRequested) {
+            contractsRefreshRequested = true;
+            setTimeout(() => window.location.reload(), 500);
+        }
+    } else {
+        timerEl.textContent = 'New Contracts In: ' + formatCountdown(diffSeconds);
     }
+}
 
-    function updateContractTimers() {
-        const now = Date.now();
-        const diffSeconds = Math.floor((expiresAt - now) / 1000);
-        if (diffSeconds <= 0) {
-            timerEl.textContent = 'New Contracts In: 0:00';
-            items.forEach(item => {
-                item.classList.add('contract-expired');
-                item.classList.remove('contract-active');
-            });
-            if (!refreshed) {
-                refreshed = true;
-                setTimeout(() => window.location.reload(), 500);
-            }
-        } else {
-            timerEl.textContent = 'New Contracts In: ' + formatCountdown(diffSeconds);
+function tryCompleteContract(item) {
+    if (
+        item.classList.contains('contract-expired') ||
+        item.classList.contains('contract-completed') ||
+        item.classList.contains('contract-busy')
+    ) return;
+    const id = item.getAttribute('data-contract-id');
+    if (!id) return;
+
+    item.classList.add('contract-busy');
+    fetch(`/api/contracts/${id}/complete/`, {
+        method: 'POST',
+        headers: {
+            'X-CSRFToken': csrftoken,
+        },
+    }).then(async (resp) => {
+        if (resp.ok) {
+            window.location.reload();
         }
-    }
+    }).catch(() => {
+        // silent failure per requirements
+    }).finally(() => {
+        item.classList.remove('contract-busy');
+    });
+}
 
-    function tryComplete(item) {
-        if (
-            item.classList.contains('contract-expired') ||
-            item.classList.contains('contract-completed') ||
-            item.classList.contains('contract-busy')
-        ) return;
-        const id = item.getAttribute('data-contract-id');
-        if (!id) return;
-
-        item.classList.add('contract-busy');
-        fetch(`/api/contracts/${id}/complete/`, {
-            method: 'POST',
-            headers: {
-                'X-CSRFToken': csrftoken,
-            },
-        }).then(async (resp) => {
-            if (resp.ok) {
-                window.location.reload();
-            }
-        }).catch(() => {
-            // silent failure per requirements
-        }).finally(() => {
-            item.classList.remove('contract-busy');
-        });
-    }
+function initContractBoard() {
+    const list = document.querySelector('.contracts-list');
+    if (!list) return;
 
-    items.forEach(item => {
-        item.addEventListener('click', () => tryComplete(item));
+    list.addEventListener('click', (e) => {
+        const item = e.target.closest('.contract-item');
+        if (item) tryCompleteContract(item);
     });
 
     updateContractTimers();
     setInterval(updateContractTimers, 1000);
 }
 
+function renderContracts(contracts) {
+    const list = document.querySelector('.contracts-list');
+    const header = document.querySelector('.contracts-header');
+    if (!list || !header) return;
+
+    let timerEl = document.getElementById('contracts-timer');
+    if (!contracts.length) {
+        list.innerHTML = '<li>No active contracts.</li>';
+        if (timerEl) timerEl.remove();
+        return;
+    }
+    if (!timerEl) {
+        timerEl = document.createElement('div');
+        timerEl.id = 'contracts-timer';
+        timerEl.className = 'contracts-timer';
+        header.appendChild(timerEl);
+    }
+    timerEl.setAttribute('data-expires-at', contracts[0].expires_at);
+
+    list.innerHTML = contracts.map(c => {
+        const state = c.is_completed ? 'contract-completed' : (c.is_active ? 'contract-active' : 'contract-expired');
+        const unlock = c.unlocks_crop ? `<div class="contract-meta contract-unlock">Unlocks: ${c.unlocks_crop.name}</div>` : '';
+        const completed = c.is_completed ? '<div class="contract-meta">Completed</div>' : '';
+        return `
+            <li class="contract-item ${state}" data-contract-id="${c.id}" data-crop-id="${c.crop_type.id}" data-quantity="${c.quantity_required}">
+                <div class="contract-title">${c.crop_type.name} ×${c.quantity_required}</div>
+                <div class="contract-meta">Reward: ${c.reward_coins} coins</div>
+                ${unlock}
+                ${completed}
+            </li>
+        `;
+    }).join('');
+
+    contractsRefreshRequested = false;
+    updateContractTimers();
+    refreshMarket();
+}
+
+function openContractCropIds() {
+    return Array.from(document.querySelectorAll('.contract-item:not(.contract-completed)'))
+        .map(item => parseInt(item.getAttribute('data-crop-id'), 10));
+}
+
 document.addEventListener('DOMContentLoaded', () => {
     const globalSeedSelect = document.getElementById('global-crop-select');
     if (globalSeedSelect) {
@@ -288,7 +421,7 @@ document.addEventListener('DOMContentLoaded', () => {
     initSellInputs();
     initTimers();
     initContractBoard();
-    initBalancePolling();
+    initLiveUpdates();
     const cropSelect = document.getElementById('market-crop-select');
     const qtyInput = document.getElementById('market-qty');
     if (cropSelect && qtyInput) {
@@ -307,7 +440,6 @@ document.addEventListener('DOMContentLoaded', () => {
         qtyInput.addEventListener('input', capQuantity);
         capQuantity();
     }
-    initMarketRefresh();
 });
 
 function submitMarketListing() {
@@ -364,7 +496,10 @@ function buyListing(listingId) {
         body: JSON.stringify({}),
     }).then(async (resp) => {
         if (resp.ok) {
-            window.location.reload();
+            const data = await resp.json();
+            setBalance(data.buyer_farm.balance);
+            refreshInventoryItem(data.inventory_item);
+            refreshMarket();
         } else {
             let msg = 'Error buying listing';
             try {
@@ -404,18 +539,22 @@ function initBalancePolling() {
 }
 
 async function refreshBalance() {
-    const balanceEl = document.getElementById('farm-balance-value');
-    if (!balanceEl) return;
+    if (liveUpdatesActive) return;  // pushed by the live update stream
     try {
         const resp = await fetch('/api/farm/me/');
         if (!resp.ok) return;
         const data = await resp.json();
-        if (typeof data.balance === 'number') {
-            balanceEl.textContent = `${data.balance} coins`;
-        }
+        setBalance(data.balance);
     } catch {}
 }
 
+function setBalance(balance) {
+    const balanceEl = document.getElementById('farm-balance-value');
+    if (balanceEl && typeof balance === 'number') {
+        balanceEl.textContent = `${balance} coins`;
+    }
+}
+
 function renderMarketListings(listings) {
     const listEl = document.querySelector('.market-list');
     if (!listEl) return;
@@ -443,23 +582,85 @@ function renderMarketListings(listings) {
     listEl.innerHTML = html;
 }
 
+async function refreshMarket() {
+    try {
+        const resp = await fetch('/api/market/listings/');
+        if (!resp.ok) return;
+        const data = await resp.json();
+        renderMarketListings(data);
+    } catch (_) {
+        // ignore refresh errors
+    }
+}
+
 function initMarketRefresh() {
-    async function tick() {
-        try {
-            const resp = await fetch('/api/market/listings/');
-            if (!resp.ok) return;
-            const data = await resp.json();
-            renderMarketListings(data);
-        } catch (_) {
-            // ignore refresh errors
-        }
+    refreshMarket();
+    setInterval(refreshMarket, 5000);
+}
+
+let pollingStarted = false;
+
+function startPolling() {
+    if (pollingStarted) return;
+    pollingStarted = true;
+    liveUpdatesActive = false;
+    initBalancePolling();
+    initMarketRefresh();
+}
+
+function initLiveUpdates() {
+    if (!window.EventSource) {
+        startPolling();
+        return;
     }
 
-    tick();
-    setInterval(tick, 5000);
+    const source = new EventSource('/api/events/');
+    source.addEventListener('open', () => {
+        liveUpdatesActive = true;
+    });
+    source.addEventListener('error', () => {
+        // a closed source will not reconnect (e.g. the server is not running under ASGI)
+        if (source.readyState === EventSource.CLOSED) {
+            startPolling();
+        }
+    });
+
+    source.addEventListener('balance', (e) => {
+        setBalance(JSON.parse(e.data).balance);
+    });
+    source.addEventListener('inventory', (e) => {
+        JSON.parse(e.data).forEach(refreshInventoryItem);
+    });
+    source.addEventListener('plots', (e) => {
+        JSON.parse(e.data).forEach(plot => {
+            if (plot.crop_type) {
+                updatePlotCellGrowing(plot);
+            } else {
+                updatePlotCellEmpty(plot);
+            }
+        });
+        updateTimers();
+    });
+    source.addEventListener('plot_ready', () => {
+        updateTimers();
+    });
+    source.addEventListener('contracts', (e) => {
+        renderContracts(JSON.parse(e.data));
+    });
+    source.addEventListener('market', (e) => {
+        const cropId = JSON.parse(e.data).crop_type_id;
+        if (openContractCropIds().includes(cropId)) {
+            refreshMarket();
+        }
+    });
 }
+function plotCell(plot) {
+    // cells outside the rendered viewport are not on the page
+    return document.querySelector(`.plot-cell[data-x="${plot.x}"][data-y="${plot.y}"]`);
+}
+
 function updatePlotCellGrowing(plot) {
-    const cell = document.querySelector(`.plot-cell[data-plot-id="${plot.id}"]`);
+    const cell = plotCell(plot);
     if (!cell) return;
 
     const readyAt = plot.harvest_ready_at;
@@ -467,6 +668,8 @@ function updatePlotCellGrowing(plot) {
     const emoji = plot.crop_type?.emoji || '🌾';
 
     cell.className = 'plot-cell plot-growing';
+    cell.setAttribute('data-plot-id', plot.id);
+    cell.removeAttribute('onclick');
     cell.setAttribute('data-emoji', emoji);
     cell.innerHTML = `
         <div class="plot-title">${cropName}</div>
@@ -475,12 +678,12 @@ function updatePlotCellGrowing(plot) {
     `;
 }
 
-function updatePlotCellEmpty(plotId) {
-    const cell = document.querySelector(`.plot-cell[data-plot-id="${plotId}"]`);
+function updatePlotCellEmpty(plot) {
+    const cell = plotCell(plot);
     if (!cell) return;
     cell.className = 'plot-cell plot-empty';
-    cell.setAttribute('data-plot-id', plotId);
-    cell.setAttribute('onclick', `plantPlot(${plotId})`);
+    cell.setAttribute('data-plot-id', plot.id);
+    cell.setAttribute('onclick', `plantCell(${plot.x}, ${plot.y})`);
     cell.innerHTML = `<div class="plot-title">Empty</div>`;
 }
 
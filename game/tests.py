@@ -1,3 +1,1632 @@
-from django.test import TestCase
+import base64
+import json
+import math
+import random
+import sys
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, transaction
+from django.test import Client, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from . import async_views, urls as game_urls
+from .board import COLUMNS as BOARD_COLUMNS, board_listings, reset_boards
+from .catalog import get_catalog, get_crop_type, invalidate_catalog
+from .checks import shared_cache_check
+from .events import MARKET_CHANNEL, farm_channel, get_broker
+from .grid import grid_plots, rebuild_grid
+from .history import rollup_trades
+from .inventory import add_harvest, add_items, settle_farm_inventory, settle_inventory
+from .ledger import balance_at, prune_snapshots, settle_pending, take_snapshots
+from .listings import compact_listings, expire_listings
+from .metrics import registry as metrics_registry
+from .middleware import QueryRecorder
+from .models import (
+    GRID_SIZE, MAX_GRID_SIZE, ArchivedListing, BalanceSnapshot, Candle, Contract, CropType, Farm, FarmGrid, InventoryDelta, InventoryItem, LedgerEntry, MarketListing, Plot,
+    PriceBucket, Trade,
+    create_farm_for_user, current_contracts_for_farm, ensure_contracts_for_farm, ensure_contracts_for_farms,
+    rotate_contract_batches,
+)
+from .mutations import plant_plots
+from .orderbook import OrderBook, get_order_book, reset_order_books
+from .pricing import PriceWindow, record_trades, reset_prices, sync_prices
+from .renderers import FastJSONRenderer
+from .serializers import (
+    ContractRows, ContractSerializer, CropTypeSerializer, InventoryItemRows, InventoryItemSerializer, MarketListingRows,
+    MarketListingSerializer, PlotRows, PlotSerializer,
+)
+from .versions import farm_version
+from .views import HOME_QUERY_BUDGET, HOME_VIEWPORT
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+User = get_user_model()
+
+# the API as routed with GAME_ASYNC_READS on, for AsyncReadTests
+ASYNC_READS = {
+    'farm-me': async_views.farm_me,
+    'crop-type-list': async_views.crop_type_list,
+    'plot-list': async_views.plot_list,
+    'inventory-list': async_views.inventory_list,
+    'contract-list': async_views.contract_list,
+    'market-create-listing': async_views.market_create_listing,
+}
+urlpatterns = [
+    path('api/', include([
+        path(str(url.pattern), ASYNC_READS.get(url.name, url.callback), name=url.name)
+        for url in game_urls.urlpatterns
+    ])),
+]
+
+
+def make_crop_types():
+    return [
+        CropType.objects.create(name='Wheat', grow_time_seconds=10, base_price=2, seed_price=1, emoji='🌾'),
+        CropType.objects.create(name='Corn', grow_time_seconds=30, base_price=5, seed_price=3, emoji='🌽'),
+        CropType.objects.create(name='Carrot', grow_time_seconds=60, base_price=8, seed_price=5, emoji='🥕'),
+    ]
+
+
+def create_plots(farm):
+    """Give every cell of ``farm`` a plot row, as if each had been planted before."""
+    size = farm.grid_size
+    Plot.objects.bulk_create(Plot(farm=farm, x=x, y=y) for y in range(size) for x in range(size))
+    rebuild_grid(farm.id)
+
+
+class HomeQueryBudgetTests(TestCase):
+    def setUp(self):
+        reset_boards()
+        self.crops = make_crop_types()
+        self.user = User.objects.create_user('alice', password='pw')
+        self.farm = create_farm_for_user(self.user)
+        create_plots(self.farm)
+        seller = create_farm_for_user(User.objects.create_user('bob', password='pw'))
+        for crop in self.crops:
+            for price in (3, 4, 5):
+                MarketListing.objects.create(seller=seller, crop_type=crop, quantity=10, unit_price=price)
+        self.client.force_login(self.user)
+
+    def count_home_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('home'))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_home_stays_within_query_budget(self):
+        self.client.get(reverse('home'))  # first load generates contracts
+        queries = self.count_home_queries()
+        self.assertLessEqual(queries, HOME_QUERY_BUDGET)
+
+    def test_home_reads_the_catalog_version_once(self):
+        self.client.get(reverse('home'))
+        with mock.patch('game.catalog.cache.get_or_set', wraps=cache.get_or_set) as get_version:
+            self.assertEqual(self.client.get(reverse('home')).status_code, 200)
+        self.assertEqual(get_version.call_count, 1)
+
+    def test_query_count_does_not_grow_with_planted_plots(self):
+        self.client.get(reverse('home'))
+        empty = self.count_home_queries()
+
+        now = timezone.now()
+        for i, plot in enumerate(self.farm.plots.all()):
+            plot.crop_type = self.crops[i % len(self.crops)]
+            plot.planted_at = now
+            plot.harvest_ready_at = now + timedelta(seconds=i - 10)
+            plot.save()
+        rebuild_grid(self.farm.id)
+        ensure_contracts_for_farm(self.farm)
+
+        self.assertEqual(self.count_home_queries(), empty)
+
+
+class IndexUsageTests(TestCase):
+    """EXPLAIN the hot query shapes against a large seeded dataset and check they use their indexes."""
+    listings = 1_000_000
+    farms = 2000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crops = make_crop_types()
+        users = User.objects.bulk_create(User(username=f'user{i}') for i in range(cls.farms))
+        farms = Farm.objects.bulk_create(Farm(user=user, name=user.username) for user in users)
+        Plot.objects.bulk_create(
+            Plot(farm=farm, x=x, y=y) for farm in farms for y in range(GRID_SIZE) for x in range(GRID_SIZE)
+        )
+        expires_at = timezone.now() + timedelta(minutes=1)
+        Contract.objects.bulk_create(
+            Contract(farm=farm, crop_type=cls.crops[i % 3], quantity_required=10, reward_coins=10,
+                     expires_at=expires_at + timedelta(seconds=i % 2 * 60),
+                     completed_at=expires_at if i % 3 == 0 else None)
+            for farm in farms for i in range(6)
+        )
+        cls.farm, other = farms[0], farms[1]
+
+        # most listings are sold out or withdrawn, like on a long-running market
+        table = connection.ops.quote_name(MarketListing._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} (seller_id, crop_type_id, quantity, unit_price, active, created_at) '
+                'WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < %s) '
+                'SELECT CASE WHEN i %% 2 = 0 THEN %s ELSE %s END, '
+                'CASE i %% 3 WHEN 0 THEN %s WHEN 1 THEN %s ELSE %s END, '
+                'i %% 7, 1 + i %% 50, i %% 10 = 0, CURRENT_TIMESTAMP FROM n',
+                [cls.listings, cls.farm.id, other.id, *[crop.id for crop in cls.crops]],
+            )
+            cursor.execute('ANALYZE')
+
+    def assertUsesIndex(self, queryset, *names):
+        plan = queryset.explain()
+        self.assertTrue(any(name in plan for name in names), plan)
+
+    def test_market_board_uses_open_listing_index(self):
+        listings = MarketListing.objects.filter(
+            active=True, quantity__gt=0, crop_type_id__in=[self.crops[0].id, self.crops[1].id],
+        ).exclude(seller=self.farm).order_by('unit_price')
+        self.assertUsesIndex(listings, 'listing_open_crop_price_idx')
+
+    def test_order_book_load_uses_open_listing_index(self):
+        listings = MarketListing.objects.filter(crop_type_id=self.crops[0].id, active=True, quantity__gt=0)
+        self.assertUsesIndex(listings, 'listing_open_crop_price_idx')
+
+    def test_contract_queries_use_farm_indexes(self):
+        now = timezone.now()
+        self.assertUsesIndex(
+            Contract.objects.filter(farm=self.farm, expires_at__gt=now).order_by('expires_at'),
+            'contract_farm_expiry_idx',
+        )
+        self.assertUsesIndex(
+            Contract.objects.filter(farm=self.farm, completed_at__isnull=True),
+            'contract_farm_open_idx',
+        )
+
+    def test_plots_come_out_of_the_cell_index_in_row_order(self):
+        plots = Plot.objects.filter(farm=self.farm).order_by('y', 'x')
+        self.assertUsesIndex(plots, 'plot_unique_farm_cell', 'sqlite_autoindex_game_plot')
+        self.assertNotIn('TEMP B-TREE', plots.explain())
+        self.assertNotIn('Sort', plots.explain())
+
+
+class FarmProvisioningTests(TestCase):
+    def setUp(self):
+        make_crop_types()
+        get_catalog()
+
+    def test_signup_farm_takes_fixed_queries(self):
+        user = User.objects.create_user('alice')
+        # existing farm check, the catalog-version cache read, then one insert per table
+        with self.assertNumQueries(6):
+            farm = create_farm_for_user(user)
+        self.assertEqual(farm.grid_size, GRID_SIZE)
+        self.assertFalse(farm.plots.exists())
+        self.assertEqual([crop.name for crop in farm.unlocked_crops.all()], ['Wheat'])
+        self.assertEqual(grid_plots(farm), [])
+        self.assertEqual(balance_at(farm, timezone.now()), 1)
+        self.assertIs(create_farm_for_user(user), farm)
+
+    def test_provision_farms_command(self):
+        call_command('provision_farms', 7, prefix='launch', batch_size=3, stdout=StringIO())
+        farms = Farm.objects.filter(user__username__startswith='launch')
+        self.assertEqual(farms.count(), 7)
+        self.assertFalse(Plot.objects.filter(farm__in=farms).exists())
+        self.assertEqual(FarmGrid.objects.filter(farm__in=farms).count(), 7)
+        with self.assertRaises(CommandError):
+            call_command('provision_farms', 2, prefix='launch', stdout=StringIO())
+
+
+class FarmGridTests(TestCase):
+    def setUp(self):
+        self.wheat, self.corn, _ = make_crop_types()
+        self.user = User.objects.create_user('alice')
+        self.farm = create_farm_for_user(self.user)
+        Farm.objects.filter(id=self.farm.id).update(balance=100)
+        self.client.force_login(self.user)
+        get_catalog()
+
+    def plots(self):
+        return grid_plots(Farm.objects.select_related('grid').get(id=self.farm.id))
+
+    def test_plot_list_reads_one_row(self):
+        create_plots(self.farm)
+        self.client.get(reverse('plot-list'))  # caches the farm's id and version
+        # session, user, the farm-id and farm-version cache reads, farm joined with its grid,
+        # then the catalog-version cache read
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('plot-list'))
+        self.assertEqual([(plot['x'], plot['y']) for plot in response.json()[:6]],
+                         [(x, 0) for x in range(5)] + [(0, 1)])
+
+    def test_plot_changes_are_written_through(self):
+        self.client.post(reverse('plant-cell', args=[2, 1]), {'crop_type_id': self.wheat.id},
+                         content_type='application/json')
+        plot = self.farm.plots.get(x=2, y=1)
+        self.client.post(reverse('plant-many'), {'crop_type_id': self.wheat.id, 'plot_ids': 'all'},
+                         content_type='application/json')
+
+        plots = self.plots()
+        self.assertEqual([p.id for p in plots], list(self.farm.plots.order_by('y', 'x').values_list('id', flat=True)))
+        planted = plots[7]
+        self.assertEqual((planted.id, planted.crop_type, planted.ready), (plot.id, self.wheat, False))
+        plot.refresh_from_db()
+        self.assertEqual(planted.harvest_ready_at, plot.harvest_ready_at)
+        self.assertEqual([p.crop_type for p in plots], [self.wheat] * 25)
+
+        self.farm.plots.update(harvest_ready_at=timezone.now())
+        self.client.post(reverse('harvest', args=[plot.id]))
+        self.client.post(reverse('harvest-many'), {'plot_ids': 'all'}, content_type='application/json')
+        self.assertEqual([p.crop_type for p in self.plots()], [None] * 25)
+
+    def test_readiness_comes_from_the_stored_ready_time(self):
+        create_plots(self.farm)
+        planted_at = timezone.now() - timedelta(seconds=20)
+        for y, crop in ((0, self.wheat), (1, self.corn)):
+            self.farm.plots.filter(y=y).update(
+                crop_type=crop, planted_at=planted_at,
+                harvest_ready_at=planted_at + timedelta(seconds=crop.grow_time_seconds),
+            )
+        rebuild_grid(self.farm.id)
+        # a grow time changed after planting moves neither the grid nor harvesting
+        self.corn.grow_time_seconds = 5
+        self.corn.save()
+
+        plots = self.plots()
+        self.assertTrue(all(plot.ready for plot in plots[:5]))
+        self.assertFalse(any(plot.ready for plot in plots[5:]))
+        self.assertEqual(plots[5].harvest_ready_at, planted_at + timedelta(seconds=30))
+        self.assertEqual(self.client.post(reverse('harvest', args=[plots[5].id])).status_code, 400)
+
+
+class BulkPlotActionTests(TestCase):
+    def setUp(self):
+        self.wheat, self.corn, _ = make_crop_types()
+        self.user = User.objects.create_user('alice', password='pw')
+        self.farm = create_farm_for_user(self.user)
+        self.farm.balance = 100
+        self.farm.save()
+        self.client.force_login(self.user)
+
+    def test_plant_all_then_harvest_all(self):
+        response = self.client.post(
+            reverse('plant-many'),
+            {'crop_type_id': self.wheat.id, 'plot_ids': 'all'},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['plots']), 25)
+        self.assertEqual(response.json()['balance'], 75)
+
+        self.farm.plots.update(harvest_ready_at=timezone.now())
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(
+                reverse('harvest-many'), {'plot_ids': 'all'}, content_type='application/json',
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(len(ctx.captured_queries), 15)
+        [item] = response.json()['inventory_items']
+        self.assertEqual(item['quantity'], 25)
+        self.assertFalse(self.farm.plots.filter(crop_type__isnull=False).exists())
+
+    def test_plant_stops_when_funds_run_out(self):
+        create_plots(self.farm)
+        plot_ids = list(self.farm.plots.values_list('id', flat=True)[:10])
+        self.farm.balance = 7
+        self.farm.save()
+        response = self.client.post(
+            reverse('plant-many'),
+            {'crop_type_id': self.wheat.id, 'plot_ids': plot_ids},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['plots']), 7)
+        self.farm.refresh_from_db()
+        self.assertEqual(self.farm.balance, 0)
+
+    def test_harvest_skips_plots_that_are_not_ready(self):
+        create_plots(self.farm)
+        self.farm.plots.update(crop_type=self.corn, harvest_ready_at=timezone.now() + timedelta(minutes=5))
+        response = self.client.post(
+            reverse('harvest-many'), {'plot_ids': 'all'}, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class FarmExpansionTests(TestCase):
+    def setUp(self):
+        self.wheat = make_crop_types()[0]
+        self.user = User.objects.create_user('alice')
+        self.farm = create_farm_for_user(self.user)
+        Farm.objects.filter(id=self.farm.id).update(balance=10 ** 5)
+        self.client.force_login(self.user)
+        get_catalog()
+
+    def expand(self, **data):
+        return self.client.post(reverse('farm-expand'), data, content_type='application/json')
+
+    def test_expansion_is_paid_for_and_recorded(self):
+        response = self.expand()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['grid_size'], GRID_SIZE + 1)
+        cost = 10 ** 5 - response.json()['balance']
+        self.assertEqual(cost, 2 * ((GRID_SIZE + 1) ** 2 - GRID_SIZE ** 2))
+
+        response = self.expand(size=50)
+        self.assertEqual(response.json()['grid_size'], 50)
+        self.assertEqual(
+            list(self.farm.ledger_entries.filter(reason=LedgerEntry.Reason.EXPANSION).values_list('amount', flat=True)),
+            [-cost, -2 * (50 ** 2 - (GRID_SIZE + 1) ** 2)],
+        )
+        self.assertEqual(self.expand(size=MAX_GRID_SIZE + 1).status_code, 400)
+        self.assertEqual(self.expand(size=10).status_code, 400)
+
+    def test_expansion_needs_funds(self):
+        Farm.objects.filter(id=self.farm.id).update(balance=1)
+        self.assertEqual(self.expand().status_code, 400)
+        self.farm.refresh_from_db()
+        self.assertEqual((self.farm.grid_size, self.farm.balance), (GRID_SIZE, 1))
+
+    def test_cells_get_plots_when_first_planted(self):
+        self.expand(size=50)
+        url = reverse('plant-cell', args=[49, 30])
+        response = self.client.post(url, {'crop_type_id': self.wheat.id}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['x'], response.json()['y']), (49, 30))
+        self.assertEqual(list(self.farm.plots.values_list('x', 'y')), [(49, 30)])
+
+        again = self.client.post(url, {'crop_type_id': self.wheat.id}, content_type='application/json')
+        self.assertEqual(again.status_code, 400)
+        outside = reverse('plant-cell', args=[50, 0])
+        self.assertEqual(self.client.post(outside, {'crop_type_id': self.wheat.id},
+                                          content_type='application/json').status_code, 404)
+
+    def test_failed_plant_leaves_no_plot_row(self):
+        self.expand(size=50)
+        Farm.objects.filter(id=self.farm.id).update(balance=0)
+        url = reverse('plant-cell', args=[49, 30])
+        for data in ({}, {'crop_type_id': self.wheat.id}):
+            self.assertEqual(self.client.post(url, data, content_type='application/json').status_code, 400)
+        self.assertFalse(self.farm.plots.exists())
+
+    def test_plant_all_only_creates_plots_it_can_pay_for(self):
+        self.expand(size=50)
+        Farm.objects.filter(id=self.farm.id).update(balance=60)
+        response = self.client.post(reverse('plant-many'), {'crop_type_id': self.wheat.id, 'plot_ids': 'all'},
+                                    content_type='application/json')
+        self.assertEqual(len(response.json()['plots']), 60)
+        self.assertEqual(self.farm.plots.count(), 60)
+        self.assertEqual(self.farm.plots.order_by('-y', '-x').values_list('x', 'y').first(), (9, 1))
+
+    def test_plant_all_is_sized_by_the_balance_at_planting(self):
+        Farm.objects.filter(id=self.farm.id).update(balance=60)
+
+        def spend(farm_ids):
+            # a concurrent request spends coins after this one has read the farm
+            Farm.objects.filter(id=self.farm.id).update(balance=20)
+
+        with mock.patch('game.views.settle_pending', side_effect=spend):
+            response = self.client.post(reverse('plant-many'), {'crop_type_id': self.wheat.id, 'plot_ids': 'all'},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((len(response.json()['plots']), response.json()['balance']), (20, 0))
+
+    def test_plant_all_pays_only_for_the_plots_it_plants(self):
+        Farm.objects.filter(id=self.farm.id).update(balance=60)
+        create_plots(self.farm)
+        taken = self.farm.plots.order_by('y', 'x').first()
+
+        def race(plot_ids, *args):
+            # a concurrent request plants the first plot after this one has listed the empty ones
+            Plot.objects.filter(id=taken.id).update(crop_type=self.wheat)
+            return plant_plots(plot_ids, *args)
+
+        with CaptureQueriesContext(connection) as queries, mock.patch('game.views.plant_plots', side_effect=race):
+            response = self.client.post(reverse('plant-many'), {'crop_type_id': self.wheat.id, 'plot_ids': 'all'},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((len(response.json()['plots']), response.json()['balance']), (24, 36))
+        self.assertNotIn(taken.id, [plot['id'] for plot in response.json()['plots']])
+        self.assertFalse([query for query in queries if 'FOR UPDATE' in query['sql']])
+
+    def test_region_queries(self):
+        self.expand(size=50)
+        Plot.objects.bulk_create(Plot(farm=self.farm, x=x, y=y) for y in range(0, 50, 7) for x in range(0, 50, 7))
+        rebuild_grid(self.farm.id)
+
+        response = self.client.get(reverse('plot-list'), {'x0': 10, 'y0': 5, 'x1': 30, 'y1': 21})
+        self.assertEqual([(plot['x'], plot['y']) for plot in response.json()],
+                         [(x, y) for y in (7, 14, 21) for x in (14, 21, 28)])
+        self.assertEqual(len(self.client.get(reverse('plot-list')).json()), 64)
+        self.assertEqual(len(self.client.get(reverse('plot-list'), {'y0': 40}).json()), 16)
+        self.assertEqual(self.client.get(reverse('plot-list'), {'x0': 9, 'x1': 2}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('plot-list'), {'x0': 'a'}).status_code, 400)
+
+    def test_home_renders_a_viewport(self):
+        self.expand(size=50)
+        response = self.client.get(reverse('home'), {'x0': 45, 'y0': 14})
+        grid = response.context['grid']
+        self.assertEqual((len(grid), len(grid[0])), (HOME_VIEWPORT, 5))
+        self.assertEqual((grid[0][0].x, grid[0][0].y), (45, 14))
+        self.assertEqual(response.context['pan']['right'], None)
+        self.assertEqual(response.context['pan']['left'], '?x0=40&y0=14')
+
+
+class ListPaginationTests(TestCase):
+    def setUp(self):
+        reset_boards()
+        self.crops = make_crop_types()
+        self.user = User.objects.create_user('alice')
+        self.farm = create_farm_for_user(self.user)
+        seller = create_farm_for_user(User.objects.create_user('bob'))
+        Contract.objects.create(farm=self.farm, crop_type=self.crops[0], quantity_required=1, reward_coins=1,
+                                expires_at=timezone.now() + timedelta(minutes=5))
+        MarketListing.objects.bulk_create(
+            MarketListing(seller=seller, crop_type=self.crops[0], quantity=1, unit_price=i % 4 + 1) for i in range(25)
+        )
+        self.client.force_login(self.user)
+        get_catalog()
+
+    def pages(self, url, **params):
+        rows, cursor = [], None
+        while True:
+            query = dict(params, cursor=cursor) if cursor else params
+            body = self.client.get(url, query).json()
+            rows.extend(body['results'])
+            cursor = body['next']
+            if cursor is None:
+                return rows
+
+    def test_listing_pages_follow_price_then_id(self):
+        everything = self.client.get(reverse('market-create-listing')).json()
+        self.assertEqual(len(everything), 25)
+        paged = self.pages(reverse('market-create-listing'), limit=7)
+        self.assertEqual(paged, everything)
+        self.assertEqual([row['unit_price'] for row in paged], sorted(row['unit_price'] for row in paged))
+
+    def test_pages_do_not_shift_when_rows_are_removed(self):
+        first = self.client.get(reverse('market-create-listing'), {'limit': 5}).json()
+        MarketListing.objects.filter(id__in=[row['id'] for row in first['results']]).update(active=False)
+        second = self.client.get(reverse('market-create-listing'), {'limit': 5, 'cursor': first['next']}).json()
+        self.assertEqual(second['results'][0]['unit_price'], 1)
+        self.assertGreater(second['results'][0]['id'], first['results'][-1]['id'])
+
+    def test_sparse_fields_and_crop_type_ids(self):
+        response = self.client.get(reverse('market-create-listing'),
+                                   {'fields': 'id,crop_type,unit_price', 'crop_types': 'id', 'limit': 1})
+        [row] = response.json()['results']
+        self.assertEqual(set(row), {'id', 'crop_type', 'unit_price'})
+        self.assertEqual(row['crop_type'], self.crops[0].id)
+
+        crops = self.client.get(reverse('crop-type-list'), {'fields': 'id,name'})
+        self.assertEqual(crops.json()[0], {'id': self.crops[0].id, 'name': 'Wheat'})
+        self.assertNotEqual(crops['ETag'], self.client.get(reverse('crop-type-list'))['ETag'])
+
+    def test_plot_and_inventory_pages(self):
+        create_plots(self.farm)
+        plots = self.pages(reverse('plot-list'), limit=10, fields='x,y')
+        self.assertEqual(plots, [{'x': x, 'y': y} for y in range(GRID_SIZE) for x in range(GRID_SIZE)])
+
+        for crop in self.crops:
+            InventoryItem.objects.create(farm=self.farm, crop_type=crop, quantity=3)
+        items = self.pages(reverse('inventory-list'), limit=2, crop_types='id')
+        self.assertEqual([item['crop_type'] for item in items], [crop.id for crop in self.crops])
+
+    def test_bad_requests(self):
+        url = reverse('market-create-listing')
+        self.assertEqual(self.client.get(url, {'cursor': 'nonsense'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'limit': 0}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'fields': 'id,password'}).status_code, 400)
+
+
+class FastSerializerTests(TestCase):
+    """The row serializers and renderer must produce the same bytes as the ModelSerializers and JSONRenderer."""
+
+    def setUp(self):
+        self.crops = make_crop_types()
+        self.farm = create_farm_for_user(User.objects.create_user('alice'))
+        seller = create_farm_for_user(User.objects.create_user('bob'), custom_name='Bøb\u2028"\\\x01 🚜')
+        create_plots(self.farm)
+        now = timezone.now().replace(microsecond=123456)
+        self.farm.plots.filter(y=0).update(crop_type=self.crops[1], planted_at=now, harvest_ready_at=now)
+        for crop in self.crops:
+            InventoryItem.objects.create(farm=self.farm, crop_type=crop, quantity=crop.id)
+            MarketListing.objects.create(seller=seller, crop_type=crop, quantity=2, unit_price=3)
+        Contract.objects.create(farm=self.farm, crop_type=self.crops[0], unlocks_crop=self.crops[2],
+                                quantity_required=1, reward_coins=1, expires_at=now + timedelta(minutes=5))
+        get_catalog()
+
+    def assertSameBytes(self, slow, fast):
+        self.assertEqual(FastJSONRenderer().render(fast), JSONRenderer().render(slow))
+
+    def check(self, query=''):
+        request = APIRequestFactory().get('/' + query)
+        request = Request(request)
+        context = {'request': request}
+        plots = list(Plot.objects.filter(farm=self.farm).order_by('y', 'x'))
+        self.assertSameBytes(PlotSerializer(plots, many=True, context=context).data,
+                             PlotRows(request).data_from_objects(plots))
+
+        items = InventoryItem.objects.filter(farm=self.farm).order_by('crop_type_id')
+        rows = InventoryItemRows(request)
+        self.assertSameBytes(InventoryItemSerializer(items, many=True, context=context).data,
+                             rows.data(rows.values(items)))
+
+        listings = MarketListing.objects.order_by('unit_price', 'id')
+        rows = MarketListingRows(request)
+        self.assertSameBytes(MarketListingSerializer(listings, many=True, context=context).data,
+                             rows.data(rows.values(listings)))
+
+        contracts = list(Contract.objects.filter(farm=self.farm))
+        self.assertSameBytes(ContractSerializer(contracts, many=True, context=context).data,
+                             ContractRows(request).data_from_objects(contracts))
+
+    def test_full_output_matches(self):
+        self.check()
+
+    def test_sparse_output_matches(self):
+        self.check('?crop_types=id')
+        self.check('?fields=id,crop_type')
+
+    def test_endpoint_matches_model_serializer(self):
+        self.client.force_login(self.farm.user)
+        response = self.client.get(reverse('plot-list'))
+        plots = grid_plots(Farm.objects.select_related('grid').get(id=self.farm.id))
+        self.assertEqual(response.content, JSONRenderer().render(PlotSerializer(plots, many=True).data))
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        reset_boards()
+        self.wheat = make_crop_types()[0]
+        self.user = User.objects.create_user('alice')
+        self.farm = create_farm_for_user(self.user)
+        self.seller = create_farm_for_user(User.objects.create_user('bob'))
+        Farm.objects.filter(id=self.farm.id).update(balance=100)
+        InventoryItem.objects.create(farm=self.farm, crop_type=self.wheat, quantity=10)
+        InventoryItem.objects.create(farm=self.seller, crop_type=self.wheat, quantity=10)
+        Contract.objects.create(farm=self.farm, crop_type=self.wheat, quantity_required=1, reward_coins=1,
+                                expires_at=timezone.now() + timedelta(minutes=5))
+        self.client.force_login(self.user)
+        get_catalog()
+
+    def revalidate(self, name, **params):
+        response = self.client.get(reverse(name), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        return self.client.get(reverse(name), params, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_version_counters_need_a_shared_cache(self):
+        self.assertEqual(shared_cache_check(None), [])
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with override_settings(CACHES=locmem):
+            self.assertEqual([error.id for error in shared_cache_check(None)], ['game.E001'])
+
+    def test_unchanged_farm_answers_not_modified_without_reading_it(self):
+        etag = self.client.get(reverse('farm-me'))['ETag']
+        # session, user, and the farm-id and farm-version cache reads
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('farm-me'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.revalidate('plot-list').status_code, 304)
+        self.assertEqual(self.revalidate('inventory-list').status_code, 304)
+        # the query string selects fields and pages, so it has its own ETag
+        self.assertNotEqual(self.client.get(reverse('inventory-list'), {'limit': 1})['ETag'],
+                            self.client.get(reverse('inventory-list'))['ETag'])
+
+    def test_writes_change_the_etag(self):
+        etag = self.client.get(reverse('inventory-list'))['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('sell-npc'), {'crop_type_id': self.wheat.id, 'quantity': 1},
+                             content_type='application/json')
+        response = self.client.get(reverse('inventory-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['quantity'], 9)
+
+    def test_market_board_follows_listings(self):
+        self.assertEqual(self.revalidate('market-create-listing').status_code, 304)
+        etag = self.client.get(reverse('market-create-listing'))['ETag']
+
+        self.client.force_login(self.seller.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('market-create-listing'),
+                             {'crop_type_id': self.wheat.id, 'quantity': 2, 'unit_price': 3},
+                             content_type='application/json')
+        seller_etag = self.client.get(reverse('farm-me'))['ETag']
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('market-create-listing'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(len(response.json()), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            bought = self.client.post(reverse('market-buy', args=[response.json()[0]['id']]))
+        self.assertEqual(bought.status_code, 200)
+
+        # the sale pays the seller, whose next poll must see it
+        self.client.force_login(self.seller.user)
+        response = self.client.get(reverse('farm-me'), HTTP_IF_NONE_MATCH=seller_etag)
+        self.assertEqual(response.json()['balance'], 1 + 6)
+
+
+class MarketBoardTests(TestCase):
+    def setUp(self):
+        reset_boards()
+        reset_order_books()
+        self.wheat, self.corn, _ = make_crop_types()
+        self.sellers = [create_farm_for_user(User.objects.create_user(name)) for name in ('bob', 'carol')]
+        for crop in (self.wheat, self.corn):
+            for i, seller in enumerate(self.sellers):
+                MarketListing.objects.create(seller=seller, crop_type=crop, quantity=5, unit_price=4 - i)
+                InventoryItem.objects.create(farm=seller, crop_type=crop, quantity=20)
+        self.players = []
+        for name in ('alice', 'dave'):
+            farm = create_farm_for_user(User.objects.create_user(name))
+            Farm.objects.filter(id=farm.id).update(balance=1000)
+            for crop in (self.wheat, self.corn):
+                Contract.objects.create(farm=farm, crop_type=crop, quantity_required=1, reward_coins=1,
+                                        expires_at=timezone.now() + timedelta(minutes=5))
+            self.players.append(farm)
+        get_catalog()
+
+    def board(self, farm):
+        self.client.force_login(farm.user)
+        return self.client.get(reverse('market-create-listing')).json()
+
+    def test_pollers_share_the_board(self):
+        board = self.board(self.players[0])
+        self.assertEqual([(row['unit_price'], row['seller_name']) for row in board],
+                         [(3, 'carol\'s Farm'), (3, 'carol\'s Farm'), (4, 'bob\'s Farm'), (4, 'bob\'s Farm')])
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.board(self.players[1]), board)
+        self.assertFalse([q for q in ctx.captured_queries if 'game_marketlisting' in q['sql']])
+
+        # a seller does not see their own listings
+        self.assertEqual({row['seller_name'] for row in self.board(self.sellers[0])}, set())
+
+    def test_writes_update_the_board_in_place(self):
+        self.board(self.players[0])
+        self.client.force_login(self.sellers[0].user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('market-create-listing'),
+                             {'crop_type_id': self.wheat.id, 'quantity': 2, 'unit_price': 1},
+                             content_type='application/json')
+        board = self.board(self.players[0])
+        self.assertEqual((board[0]['unit_price'], board[0]['quantity']), (1, 2))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('market-buy', args=[board[0]['id']]))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('market-order'), {'crop_type_id': self.corn.id, 'quantity': 2},
+                             content_type='application/json')
+
+        with CaptureQueriesContext(connection) as ctx:
+            board = self.board(self.players[1])
+        self.assertFalse([q for q in ctx.captured_queries if 'game_marketlisting' in q['sql']])
+        self.assertEqual([(row['crop_type']['name'], row['unit_price'], row['quantity']) for row in board],
+                         [('Wheat', 3, 5), ('Corn', 3, 3), ('Wheat', 4, 5), ('Corn', 4, 5)])
+        self.assertEqual(
+            board,
+            MarketListingRows().data(
+                MarketListing.objects.filter(active=True, quantity__gt=0).exclude(seller=self.players[1])
+                .order_by('unit_price', 'id').values(*BOARD_COLUMNS)
+            ),
+        )
+
+    def test_a_listing_reloaded_before_it_is_added_shows_once(self):
+        self.board(self.players[0])
+        self.client.force_login(self.sellers[0].user)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(reverse('market-create-listing'),
+                             {'crop_type_id': self.wheat.id, 'quantity': 2, 'unit_price': 1},
+                             content_type='application/json')
+        with override_settings(GAME_MARKET_BOARD_MAX_AGE=0):
+            self.assertEqual(len(self.board(self.players[0])), 5)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(len(self.board(self.players[0])), 5)
+
+    def test_stale_boards_are_reloaded(self):
+        self.board(self.players[0])
+        MarketListing.objects.filter(seller=self.sellers[1]).update(active=False)
+        self.assertEqual(len(self.board(self.players[0])), 4)
+        with override_settings(GAME_MARKET_BOARD_MAX_AGE=0):
+            self.assertEqual(len(self.board(self.players[0])), 2)
+
+    def test_home_renders_the_board(self):
+        self.client.force_login(self.players[0].user)
+        listings = self.client.get(reverse('home')).context['market_listings']
+        self.assertEqual([(listing.crop_type, listing.total_price) for listing in listings],
+                         [(self.wheat, 15), (self.corn, 15), (self.wheat, 20), (self.corn, 20)])
+
+
+@override_settings(ROOT_URLCONF='game.tests')
+class AsyncReadTests(TestCase):
+    """The async read views must answer exactly as the DRF views they stand in for."""
+
+    def setUp(self):
+        reset_boards()
+        self.crops = make_crop_types()
+        self.farm = create_farm_for_user(User.objects.create_user('alice'))
+        seller = create_farm_for_user(User.objects.create_user('bob'))
+        create_plots(self.farm)
+        now = timezone.now()
+        self.farm.plots.filter(y=1).update(crop_type=self.crops[1], planted_at=now, harvest_ready_at=now)
+        rebuild_grid(self.farm.id)
+        for crop in self.crops:
+            InventoryItem.objects.create(farm=self.farm, crop_type=crop, quantity=crop.id)
+            InventoryItem.objects.create(farm=seller, crop_type=crop, quantity=10)
+            MarketListing.objects.create(seller=seller, crop_type=crop, quantity=2, unit_price=crop.id)
+            Contract.objects.create(farm=self.farm, crop_type=crop, quantity_required=1, reward_coins=1,
+                                    expires_at=now + timedelta(minutes=5))
+        LedgerEntry.objects.create(farm=self.farm, amount=7, reason=LedgerEntry.Reason.MARKET_SALE, settled=False)
+        self.client.force_login(self.farm.user)
+        get_catalog()
+
+    def test_responses_match_sync_views(self):
+        for name in ASYNC_READS:
+            for params in ({}, {'limit': 2}, {'fields': 'id'}, {'crop_types': 'id'}, {'fields': 'nope'}):
+                if name in ('farm-me', 'contract-list') and params:
+                    continue
+                with self.subTest(name=name, params=params):
+                    response = self.client.get(reverse(name), params)
+                    with self.settings(ROOT_URLCONF='farmers_market.urls'):
+                        expected = self.client.get(reverse(name), params)
+                    self.assertEqual(response.status_code, expected.status_code)
+                    self.assertEqual(response.content, expected.content)
+                    self.assertEqual(response.get('ETag'), expected.get('ETag'))
+                    if expected.status_code == 200:
+                        self.assertEqual(response['Content-Type'], 'application/json')
+        with self.settings(GAME_CONTRACT_SCHEDULER=True):
+            response = self.client.get(reverse('contract-list'))
+            with self.settings(ROOT_URLCONF='farmers_market.urls'):
+                self.assertEqual(response.content, self.client.get(reverse('contract-list')).content)
+        # the pending sale was settled on the first read
+        self.assertEqual(self.client.get(reverse('farm-me')).json()['balance'], 1 + 7)
+
+    async def test_unchanged_reads_answer_not_modified(self):
+        await self.async_client.aforce_login(self.farm.user)
+        for name in ('farm-me', 'plot-list', 'inventory-list', 'market-create-listing', 'crop-type-list'):
+            with self.subTest(name=name):
+                response = await self.async_client.get(reverse(name))
+                self.assertEqual(response.status_code, 200)
+                response = await self.async_client.get(reverse(name), headers={'If-None-Match': response['ETag']})
+                self.assertEqual(response.status_code, 304)
+
+    def test_other_authenticators_match_sync_views(self):
+        self.client.logout()
+        self.farm.user.set_password('pw')
+        self.farm.user.save()
+        for credentials, status_code in (('alice:pw', 200), ('alice:wrong', 403)):
+            with self.subTest(credentials=credentials):
+                auth = 'Basic ' + base64.b64encode(credentials.encode()).decode()
+                response = self.client.get(reverse('plot-list'), HTTP_AUTHORIZATION=auth)
+                with self.settings(ROOT_URLCONF='farmers_market.urls'):
+                    expected = self.client.get(reverse('plot-list'), HTTP_AUTHORIZATION=auth)
+                self.assertEqual(response.status_code, status_code)
+                self.assertEqual((response.status_code, response.content), (expected.status_code, expected.content))
+
+    async def test_anonymous_and_write_requests(self):
+        response = await self.async_client.get(reverse('plot-list'))
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json(), {'detail': 'Authentication credentials were not provided.'})
+
+        await self.async_client.aforce_login(self.farm.user)
+        self.assertEqual((await self.async_client.post(reverse('inventory-list'))).status_code, 405)
+        response = await self.async_client.post(
+            reverse('market-create-listing'), {'crop_type_id': self.crops[0].id, 'quantity': 1, 'unit_price': 9},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['unit_price'], 9)
+
+
+class OrderBookTests(TestCase):
+    def setUp(self):
+        reset_order_books()
+        self.wheat = make_crop_types()[0]
+        self.seller = create_farm_for_user(User.objects.create_user('bob', password='pw'))
+        self.user = User.objects.create_user('alice', password='pw')
+        self.farm = create_farm_for_user(self.user)
+        self.farm.balance = 100
+        self.farm.save()
+        self.client.force_login(self.user)
+
+    def listing(self, quantity, unit_price, seller=None):
+        return MarketListing.objects.create(
+            seller=seller or self.seller, crop_type=self.wheat, quantity=quantity, unit_price=unit_price,
+        )
+
+    def test_match_uses_price_then_time_priority(self):
+        early = self.listing(5, 3)
+        late_cheap = self.listing(5, 2)
+        self.listing(5, 3)
+        own = self.listing(5, 1, seller=self.farm)
+        book = OrderBook(self.wheat.id)
+        book.load()
+
+        fills = book.match(8, exclude_seller=self.farm.id)
+
+        self.assertEqual(
+            [(fill.listing_id, fill.quantity) for fill in fills],
+            [(late_cheap.id, 5), (early.id, 3)],
+        )
+        self.assertEqual(book.best_ask(), (1, 5))
+        self.assertEqual(book.match(5, exclude_seller=self.farm.id)[0], (early.id, self.seller.id, 2, 3))
+        self.assertIn(own.id, [ask[1] for ask in book.asks()])
+
+    def test_market_order_partially_fills_listings(self):
+        first = self.listing(4, 2)
+        second = self.listing(10, 5)
+        response = self.client.post(
+            reverse('market-order'), {'crop_type_id': self.wheat.id, 'quantity': 6}, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['total_price'], 4 * 2 + 2 * 5)
+        self.assertEqual(data['buyer_farm']['balance'], 100 - 18)
+        self.assertEqual(data['inventory_item']['quantity'], 6)
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertFalse(first.active)
+        self.assertEqual(second.quantity, 8)
+        # sellers are paid through the ledger and settled later
+        self.seller.refresh_from_db()
+        self.assertEqual(self.seller.balance, 1)
+        self.assertEqual(settle_pending(), [self.seller.id])
+        self.seller.refresh_from_db()
+        self.assertEqual(self.seller.balance, 1 + 18)
+
+    def test_limit_bid_stops_at_limit_price(self):
+        self.listing(3, 2)
+        self.listing(3, 9)
+        response = self.client.post(
+            reverse('market-order'),
+            {'crop_type_id': self.wheat.id, 'quantity': 6, 'limit_price': 5},
+            content_type='application/json',
+        )
+        self.assertEqual(response.json()['quantity'], 3)
+
+    def test_stale_book_is_reloaded(self):
+        listing = self.listing(5, 2)
+        get_order_book(self.wheat.id)
+        MarketListing.objects.filter(id=listing.id).update(quantity=1)
+        response = self.client.post(
+            reverse('market-order'), {'crop_type_id': self.wheat.id, 'quantity': 5}, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['quantity'], 1)
+
+
+class EventStreamTests(TestCase):
+    def setUp(self):
+        make_crop_types()
+        self.user = User.objects.create_user('alice', password='pw')
+        self.farm = create_farm_for_user(self.user)
+
+    def test_stream_requires_asgi(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('event-stream')).status_code, 501)
+
+    async def test_stream_pushes_published_events(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('event-stream'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = response.streaming_content
+        self.assertEqual(await anext(stream), b'retry: 3000\n\n')
+
+        get_broker().publish(farm_channel(self.farm.id), 'balance', {'balance': 42})
+        get_broker().publish(MARKET_CHANNEL, 'market', {'crop_type_id': 7})
+        self.assertEqual(await anext(stream), b'event: balance\ndata: {"balance": 42}\n\n')
+        self.assertEqual(await anext(stream), b'event: market\ndata: {"crop_type_id": 7}\n\n')
+        await stream.aclose()
+
+
+class CropCatalogTests(TestCase):
+    def setUp(self):
+        self.wheat, self.corn, self.carrot = make_crop_types()
+
+    def test_crop_type_list_answers_not_modified(self):
+        response = self.client.get(reverse('crop-type-list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([crop['name'] for crop in response.json()], ['Wheat', 'Corn', 'Carrot'])
+
+        with self.assertNumQueries(1):  # the catalog-version cache read
+            cached = self.client.get(reverse('crop-type-list'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_saving_a_crop_type_invalidates_the_catalog(self):
+        etag = self.client.get(reverse('crop-type-list'))['ETag']
+        self.corn.base_price = 6
+        self.corn.save()
+
+        response = self.client.get(reverse('crop-type-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[1]['base_price'], 6)
+        self.assertEqual(get_crop_type(self.corn.id).base_price, 6)
+
+    def test_nested_crop_types_match_the_model_serializer(self):
+        farm = create_farm_for_user(User.objects.create_user('alice', password='pw'))
+        create_plots(farm)
+        farm.plots.update(crop_type=self.carrot)
+        plots = list(farm.plots.all())
+        get_catalog()
+        with self.assertNumQueries(1):  # the catalog-version cache read
+            data = PlotSerializer(plots, many=True).data
+        self.assertEqual(data[0]['crop_type'], CropTypeSerializer(self.carrot).data)
+
+    def test_catalog_is_read_once_and_unknown_ids_do_not_reload_it(self):
+        get_catalog()
+        with mock.patch('game.catalog.cache.get_or_set', wraps=cache.get_or_set) as get_version:
+            with self.assertNumQueries(2):  # one catalog-version cache read per lookup, no crop types
+                PlotSerializer([Plot(crop_type=self.carrot), Plot(crop_type=self.corn)], many=True).data
+                self.assertIsNone(get_crop_type(10 ** 6))
+        self.assertEqual(get_version.call_count, 2)
+
+
+class EnsureContractsTests(TestCase):
+    def setUp(self):
+        self.crops = make_crop_types()
+        self.farms = [
+            create_farm_for_user(User.objects.create_user(f'farmer{i}'))
+            for i in range(20)
+        ]
+        get_catalog()
+
+    def test_tops_up_many_farms_in_a_fixed_number_of_queries(self):
+        with self.assertNumQueries(5):  # the catalog-version cache read, then four per batch
+            contracts = ensure_contracts_for_farms([farm.id for farm in self.farms])
+
+        for farm in self.farms:
+            self.assertEqual(len(contracts[farm.id]), 3)
+            self.assertLessEqual(sum(1 for c in contracts[farm.id] if c.unlocks_crop_id), 1)
+            # payment crops come from the farm's unlocked crops (Wheat)
+            self.assertEqual({c.crop_type.name for c in contracts[farm.id]}, {'Wheat'})
+        self.assertEqual(Contract.objects.count(), 60)
+
+    def test_existing_contracts_are_kept_and_expired_ones_replaced(self):
+        first = ensure_contracts_for_farm(self.farms[0])
+        self.assertEqual([c.id for c in ensure_contracts_for_farm(self.farms[0])], [c.id for c in first])
+
+        Contract.objects.filter(id=first[0].id).update(expires_at=timezone.now())
+        refreshed = ensure_contracts_for_farm(self.farms[0])
+        self.assertEqual([c.id for c in refreshed[:2]], [c.id for c in first[1:]])
+        # the replacement joins the surviving batch
+        self.assertEqual(refreshed[2].expires_at, first[1].expires_at)
+
+
+class ContractRotationTests(TestCase):
+    def setUp(self):
+        make_crop_types()
+        self.farms = [create_farm_for_user(User.objects.create_user(f'farmer{i}')) for i in range(5)]
+        get_catalog()
+
+    def test_rotation_creates_the_next_batch_ahead_of_expiry(self):
+        now = timezone.now()
+        rotated, _ = rotate_contract_batches(now=now)
+        self.assertEqual(rotated, 5)
+        current = current_contracts_for_farm(self.farms[0])
+        self.assertEqual(len(current), 3)
+
+        # nothing is due until the batch is within the lead window
+        self.assertEqual(rotate_contract_batches(lead_seconds=30, now=now)[0], 0)
+        expires_at = current[0].expires_at
+        rotated, _ = rotate_contract_batches(lead_seconds=30, now=expires_at - timedelta(seconds=10))
+        self.assertEqual(rotated, 5)
+        self.assertEqual(Contract.objects.filter(farm=self.farms[0]).count(), 6)
+        # the pre-created batch stays hidden until the current one expires
+        self.assertEqual([c.id for c in current_contracts_for_farm(self.farms[0])], [c.id for c in current])
+
+        _, deleted = rotate_contract_batches(now=expires_at)
+        self.assertEqual(deleted, 15)
+
+    @override_settings(GAME_CONTRACT_SCHEDULER=True)
+    def test_views_only_read_contracts_with_the_scheduler(self):
+        user = self.farms[0].user
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse('contract-list')).json(), [])
+        self.assertFalse(Contract.objects.exists())
+
+        rotate_contract_batches()
+        self.assertEqual(len(self.client.get(reverse('contract-list')).json()), 3)
+
+
+def ripen_plots(farm, crop):
+    """Give every cell of ``farm`` a plot of ``crop`` that is ready to harvest."""
+    create_plots(farm)
+    planted_at = timezone.now() - timedelta(seconds=crop.grow_time_seconds + 1)
+    farm.plots.update(crop_type=crop, planted_at=planted_at, harvest_ready_at=planted_at + timedelta(seconds=crop.grow_time_seconds))
+    rebuild_grid(farm.id)
+
+
+@override_settings(GAME_INVENTORY_WRITE_BEHIND=True)
+class InventoryWriteBehindTests(TestCase):
+    def setUp(self):
+        self.wheat = make_crop_types()[0]
+        self.farm = create_farm_for_user(User.objects.create_user('alice'))
+        ripen_plots(self.farm, self.wheat)
+        self.plots = list(self.farm.plots.order_by('id'))
+        self.client.force_login(self.farm.user)
+        get_catalog()
+
+    def harvest(self, count):
+        for plot in self.plots[:count]:
+            response = self.client.post(reverse('harvest', args=[plot.id]))
+            self.assertEqual(response.status_code, 200)
+        self.plots = self.plots[count:]
+        return response
+
+    def test_harvests_are_buffered_but_read_back(self):
+        response = self.harvest(3)
+        # the acting farm sees its own harvests before they are flushed
+        self.assertEqual(response.json()['inventory_item']['quantity'], 3)
+        self.assertFalse(InventoryItem.objects.filter(farm=self.farm).exists())
+        self.assertEqual(InventoryDelta.objects.filter(farm=self.farm).count(), 3)
+
+        response = self.client.post(reverse('harvest-many'), {'plot_ids': [self.plots[0].id]},
+                                    content_type='application/json')
+        self.assertEqual(response.json()['inventory_items'][0]['quantity'], 4)
+
+        self.assertEqual(self.client.get(reverse('inventory-list')).json()[0]['quantity'], 4)
+        self.assertFalse(InventoryDelta.objects.exists())
+
+    def test_a_harvest_writes_only_its_deltas(self):
+        self.harvest(1)
+        settle_inventory()
+        with self.assertNumQueries(2):  # the delta, then the item and pending quantities
+            item, = add_harvest(self.farm, {self.wheat.id: 2})
+        self.assertEqual((item.quantity, InventoryItem.objects.get(farm=self.farm).quantity), (3, 1))
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_settling_locks_only_the_items_it_adds_to(self):
+        other = create_farm_for_user(User.objects.create_user('bob'))
+        corn = CropType.objects.get(name='Corn')
+        with CaptureQueriesContext(connection) as queries, transaction.atomic():
+            add_items({(self.farm.id, self.wheat.id): 1, (other.id, corn.id): 1})
+        locking = [query['sql'] for query in queries if 'FOR UPDATE' in query['sql']]
+        # the pairs themselves, not both crops of both farms
+        self.assertTrue(locking)
+        self.assertTrue(all(' IN (' not in sql for sql in locking))
+
+    def test_buffered_crops_can_be_spent(self):
+        self.harvest(2)
+        response = self.client.post(reverse('sell-npc'), {'crop_type_id': self.wheat.id, 'quantity': 2},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['inventory_item']['quantity'], 0)
+
+    def test_flush_is_all_or_nothing(self):
+        self.harvest(5)
+        other = create_farm_for_user(User.objects.create_user('bob'))
+        InventoryDelta.objects.create(farm=other, crop_type=self.wheat, quantity=7)
+
+        # a crash between the upsert and deleting the deltas applies neither
+        with mock.patch('django.db.models.query.QuerySet.delete', side_effect=DatabaseError('crash')):
+            with self.assertRaises(DatabaseError):
+                settle_inventory()
+        self.assertFalse(InventoryItem.objects.exists())
+        self.assertEqual(InventoryDelta.objects.count(), 6)
+
+        # one multi-row upsert however many deltas and farms there are
+        with self.assertNumQueries(9):
+            self.assertEqual(settle_inventory(), sorted([self.farm.id, other.id]))
+        self.assertEqual(InventoryItem.objects.get(farm=self.farm).quantity, 5)
+        self.assertEqual(InventoryItem.objects.get(farm=other).quantity, 7)
+        self.assertFalse(InventoryDelta.objects.exists())
+        self.assertEqual(settle_inventory(), [])
+
+    @skipUnlessDBFeature('has_select_for_update_skip_locked')
+    def test_reads_wait_for_a_flush_in_progress(self):
+        self.harvest(2)
+        # the flush skips deltas being applied elsewhere; a farm about to read its inventory waits for them
+        for settle, skip_locked in ((settle_inventory, True), (lambda: settle_farm_inventory(self.farm.id), False)):
+            InventoryDelta.objects.create(farm=self.farm, crop_type=self.wheat, quantity=1)
+            with CaptureQueriesContext(connection) as queries:
+                settle()
+            locking = [query['sql'] for query in queries if 'FOR UPDATE' in query['sql']][0]
+            self.assertEqual('SKIP LOCKED' in locking, skip_locked)
+
+    def test_flush_command(self):
+        self.harvest(2)
+        call_command('flush_inventory', once=True)
+        self.assertEqual(InventoryItem.objects.get(farm=self.farm).quantity, 2)
+        self.assertFalse(InventoryDelta.objects.exists())
+
+
+class ListingExpiryTests(TestCase):
+    def setUp(self):
+        self.wheat, self.corn, _ = make_crop_types()
+        self.seller = create_farm_for_user(User.objects.create_user('alice'))
+        self.buyer = create_farm_for_user(User.objects.create_user('bob'))
+        reset_boards()
+        reset_order_books()
+        self.now = timezone.now()
+
+    def listing(self, crop, quantity, expires_in=-1, **kwargs):
+        return MarketListing.objects.create(
+            seller=self.seller, crop_type=crop, quantity=quantity, unit_price=2,
+            expires_at=self.now + timedelta(minutes=expires_in), **kwargs,
+        )
+
+    def test_new_listings_get_a_ttl(self):
+        InventoryItem.objects.create(farm=self.seller, crop_type=self.wheat, quantity=5)
+        self.client.force_login(self.seller.user)
+
+        def create():
+            response = self.client.post(reverse('market-create-listing'),
+                                        {'crop_type_id': self.wheat.id, 'quantity': 1, 'unit_price': 3},
+                                        content_type='application/json')
+            return MarketListing.objects.get(id=response.json()['id']).expires_at
+
+        with override_settings(GAME_LISTING_TTL=3600):
+            self.assertAlmostEqual(create(), timezone.now() + timedelta(hours=1), delta=timedelta(seconds=5))
+        with override_settings(GAME_LISTING_TTL=None):
+            self.assertIsNone(create())
+
+    def test_expired_stock_returns_to_the_seller(self):
+        InventoryItem.objects.create(farm=self.seller, crop_type=self.wheat, quantity=1)
+        for crop, quantity in ((self.wheat, 3), (self.wheat, 4), (self.corn, 5)):
+            self.listing(crop, quantity)
+        fresh = self.listing(self.wheat, 6, expires_in=10)
+        self.listing(self.wheat, 0, active=False)  # sold: nothing to return
+        get_order_book(self.wheat.id)
+        self.assertEqual(len(board_listings([self.wheat.id])), 3)
+        seller_version = farm_version(self.seller.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            # one batch costs the same queries however many listings it closes
+            with self.assertNumQueries(8):
+                self.assertEqual(expire_listings(now=self.now), 3)
+        self.assertEqual(expire_listings(now=self.now), 0)
+        self.assertNotEqual(farm_version(self.seller.id), seller_version)
+
+        inventory = dict(InventoryItem.objects.filter(farm=self.seller).values_list('crop_type_id', 'quantity'))
+        self.assertEqual(inventory, {self.wheat.id: 8, self.corn.id: 5})
+        self.assertEqual(list(MarketListing.objects.filter(active=True)), [fresh])
+        self.assertEqual([row['id'] for row in board_listings([self.wheat.id, self.corn.id])], [fresh.id])
+        # the boards and books loaded before reload from the moved market epoch
+        self.assertEqual([ask[1] for ask in get_order_book(self.wheat.id).asks()], [fresh.id])
+
+    def test_compaction_archives_closed_listings(self):
+        sold = self.listing(self.wheat, 0, active=False)
+        expired = self.listing(self.wheat, 2)
+        fresh = self.listing(self.wheat, 6, expires_in=10)
+        expire_listings(now=self.now)
+
+        self.assertEqual(compact_listings(limit=1), 1)
+        self.assertEqual(compact_listings(), 1)
+        self.assertEqual(compact_listings(), 0)
+        self.assertEqual(list(MarketListing.objects.all()), [fresh])
+        archived = ArchivedListing.objects.order_by('id')
+        self.assertEqual([(row.id, row.quantity, row.active) for row in archived],
+                         [(sold.id, 0, False), (expired.id, 2, False)])
+
+    def test_command_expires_and_compacts(self):
+        self.listing(self.wheat, 2)
+        out = StringIO()
+        call_command('compact_listings', once=True, stdout=out)
+        self.assertIn('Expired 1 listings, archived 1', out.getvalue())
+        self.assertFalse(MarketListing.objects.exists())
+        self.assertEqual(InventoryItem.objects.get(farm=self.seller, crop_type=self.wheat).quantity, 2)
+
+
+class MarketHistoryTests(TestCase):
+    def setUp(self):
+        self.wheat, self.corn, _ = make_crop_types()
+        self.farm = create_farm_for_user(User.objects.create_user('alice'))
+        self.client.force_login(self.farm.user)
+        reset_order_books()
+        self.start = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(days=1)
+
+    def trade(self, unit_price, quantity=1, minutes=0, crop=None):
+        return Trade.objects.create(
+            crop_type=crop or self.wheat, listing_id=1, buyer_id=1, seller_id=2, quantity=quantity,
+            unit_price=unit_price, executed_at=self.start + timedelta(minutes=minutes),
+        )
+
+    def candle(self, interval, minutes=0):
+        return Candle.objects.get(crop_type=self.wheat, interval=interval,
+                                  starts_at=self.start + timedelta(minutes=minutes))
+
+    def test_purchases_append_trades(self):
+        seller = create_farm_for_user(User.objects.create_user('bob'))
+        Farm.objects.filter(id=self.farm.id).update(balance=100)
+        first, second = (
+            MarketListing.objects.create(seller=seller, crop_type=self.wheat, quantity=3, unit_price=price)
+            for price in (2, 3)
+        )
+        self.client.post(reverse('market-buy', args=[first.id]))
+        self.client.post(reverse('market-order'), {'crop_type_id': self.wheat.id, 'quantity': 2},
+                         content_type='application/json')
+        self.assertEqual(
+            list(Trade.objects.order_by('id').values_list('listing_id', 'buyer_id', 'seller_id', 'quantity',
+                                                          'unit_price')),
+            [(first.id, self.farm.id, seller.id, 3, 2), (second.id, self.farm.id, seller.id, 2, 3)],
+        )
+
+    def test_rollup_builds_candles_incrementally(self):
+        for price, quantity, minutes in ((5, 2, 0), (9, 1, 0), (3, 4, 0), (4, 1, 1), (6, 1, 61)):
+            self.trade(price, quantity, minutes)
+        self.trade(7, crop=self.corn)
+        # folding in two passes gives the same candles as one
+        self.assertEqual(rollup_trades(limit=2), 2)
+        self.assertEqual(rollup_trades(), 4)
+        self.assertEqual(rollup_trades(), 0)
+
+        minute = self.candle(Candle.Interval.MINUTE)
+        self.assertEqual((minute.open, minute.high, minute.low, minute.close), (5, 9, 3, 3))
+        self.assertEqual((minute.volume, minute.value, minute.trades), (7, 31, 3))
+        hour = self.candle(Candle.Interval.HOUR)
+        self.assertEqual((hour.open, hour.high, hour.low, hour.close, hour.trades), (5, 9, 3, 4, 4))
+        self.assertEqual(self.candle(Candle.Interval.HOUR, 60).close, 6)
+        self.assertEqual(Candle.objects.filter(crop_type=self.wheat, interval=Candle.Interval.MINUTE).count(), 3)
+        self.assertEqual(Candle.objects.filter(crop_type=self.corn).count(), 3)
+
+    def test_trades_committed_out_of_id_order_are_not_skipped(self):
+        self.trade(5)
+        late = self.trade(6)
+        self.trade(7)
+        # the middle trade's transaction commits after a pass has folded in the later one
+        Trade.objects.filter(id=late.id).delete()
+        self.assertEqual(rollup_trades(), 2)
+        late.save(force_insert=True)
+        self.assertLess(late.id, Trade.objects.latest('id').id)
+        self.assertEqual(rollup_trades(), 1)
+        self.assertEqual(rollup_trades(), 0)
+        days = Candle.objects.filter(crop_type=self.wheat, interval=Candle.Interval.DAY)
+        self.assertEqual(sum(days.values_list('trades', flat=True)), 3)
+
+    def test_history_is_served_from_candles(self):
+        for minutes in range(0, 5 * 60, 30):
+            self.trade(minutes // 30 + 1, minutes=minutes)
+        rollup_trades()
+        Trade.objects.all().delete()
+        url = reverse('market-history', args=[self.wheat.id])
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([candle['close'] for candle in response.json()], [2, 4, 6, 8, 10])
+        self.assertEqual(response.json()[0]['starts_at'], self.start.isoformat().replace('+00:00', 'Z'))
+
+        since = (self.start + timedelta(hours=1)).isoformat()
+        response = self.client.get(url, {'interval': '1m', 'since': since, 'limit': 3, 'fields': 'open'})
+        self.assertEqual(response.json(), [{'open': 8}, {'open': 9}, {'open': 10}])
+        self.assertEqual(self.client.get(url, {'interval': '1d'}).json()[0]['volume'], 10)
+        self.assertEqual(self.client.get(url, {'interval': '5m'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'since': 'yesterday'}).status_code, 400)
+
+
+@override_settings(GAME_DYNAMIC_NPC_PRICES=True, GAME_NPC_PRICE_DEPTH=100)
+class NpcPricingTests(TestCase):
+    def setUp(self):
+        self.wheat, _, self.carrot = make_crop_types()
+        self.farm = create_farm_for_user(User.objects.create_user('alice'))
+        self.client.force_login(self.farm.user)
+        reset_prices()
+
+    def sell(self, crop, quantity):
+        InventoryItem.objects.update_or_create(farm=self.farm, crop_type=crop, defaults={'quantity': quantity})
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('sell-npc'), {'crop_type_id': crop.id, 'quantity': quantity},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['earned_coins']
+
+    def test_window_drops_buckets_as_it_moves_on(self):
+        window = PriceWindow()
+        window.add(0, (5, 1, 10))
+        window.add(30, (3, 0, 0))
+        self.assertEqual(window.totals_at(59), (8, 1, 10))
+        self.assertEqual(window.totals_at(60), (3, 0, 0))
+        window.add(0, (100, 0, 0))  # too old to count
+        self.assertEqual(window.totals_at(60), (3, 0, 0))
+        self.assertEqual(window.totals_at(500), (0, 0, 0))
+
+    def test_bulk_sales_lower_the_price(self):
+        first = self.sell(self.wheat, 100)
+        second = self.sell(self.wheat, 100)
+        self.assertLess(first, 100 * self.wheat.base_price)
+        self.assertLess(second, first)
+        # other crops are unaffected
+        self.assertEqual(self.sell(self.carrot, 1), self.carrot.base_price)
+        with override_settings(GAME_DYNAMIC_NPC_PRICES=False):
+            self.assertEqual(self.sell(self.wheat, 100), 100 * self.wheat.base_price)
+
+    def test_market_trades_cap_the_price(self):
+        seller = create_farm_for_user(User.objects.create_user('bob'))
+        listing = MarketListing.objects.create(seller=seller, crop_type=self.carrot, quantity=10, unit_price=4)
+        Farm.objects.filter(id=self.farm.id).update(balance=100)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('market-buy', args=[listing.id]))
+        # 10 carrots at a market price of 4 instead of their base price of 8
+        self.assertEqual(self.sell(self.carrot, 10), round(4 * 100 * math.log1p(10 / 100)))
+
+    def test_floor_stays_below_the_market_price(self):
+        # carrots trading at 1, below the floor of a quarter of their base price of 8
+        record_trades([(self.carrot.id, 10, 1)])
+        self.assertEqual(self.sell(self.carrot, 10), 10)
+
+    def test_activity_is_shared_through_price_buckets(self):
+        self.sell(self.wheat, 100)
+        sync_prices()
+        self.assertEqual(PriceBucket.objects.get(crop_type=self.wheat).npc_quantity, 100)
+
+        # a process starting afresh prices from the activity synced by others
+        reset_prices()
+        self.assertEqual(self.sell(self.wheat, 50), round(self.wheat.base_price * 100 * math.log1p(50 / 200)))
+
+    @override_settings(GAME_NPC_PRICE_SYNC=0)
+    def test_failed_sync_does_not_fail_the_sale(self):
+        with mock.patch('game.pricing.add_price_activity', side_effect=DatabaseError), \
+                self.assertLogs('game.pricing', 'ERROR'):
+            self.assertEqual(self.sell(self.wheat, 10), round(self.wheat.base_price * 100 * math.log1p(10 / 100)))
+        # the activity is kept for the next sync
+        sync_prices()
+        self.assertEqual(PriceBucket.objects.get(crop_type=self.wheat).npc_quantity, 10)
+
+
+class EconomySimulationTests(TestCase):
+    def setUp(self):
+        make_crop_types()
+
+    def simulate(self, **options):
+        out = StringIO()
+        call_command('simulate_economy', stdout=out, **options)
+        return json.loads(out.getvalue())
+
+    @skipIf(numpy is None, 'NumPy is not installed')
+    def test_coins_only_move_through_sources_and_sinks(self):
+        from .simulation import Economy
+
+        economy = Economy(get_catalog().crop_types, 500, seed=7)
+        days = economy.run(10)
+        for day in days:
+            change = day['npc_sales'] + day['contract_rewards'] - day['seeds'] - day['expansions']
+            self.assertEqual(day['coin_supply_change'], change)
+        self.assertEqual(days[-1]['coin_supply'], economy.balance.sum())
+        self.assertTrue((economy.balance >= 0).all())
+        self.assertTrue((economy.inventory >= 0).all() and (economy.listed >= 0).all())
+        self.assertGreater(sum(day['contracts_completed'] for day in days), 0)
+        self.assertGreater(sum(day['market_units'] for day in days), 0)
+
+    @skipIf(numpy is None, 'NumPy is not installed')
+    def test_command_reports_reproducible_curves(self):
+        results = self.simulate(farms=200, days=5, seed=3)
+        self.assertEqual(len(results['coin_supply']), 5)
+        self.assertEqual(set(results['market_price']), {'Wheat', 'Corn', 'Carrot'})
+        self.assertEqual(self.simulate(farms=200, days=5, seed=3)['per_day'], results['per_day'])
+
+    def test_command_requires_numpy(self):
+        with mock.patch.dict(sys.modules, {'numpy': None, 'game.simulation': None}):
+            with self.assertRaisesMessage(CommandError, 'requires NumPy'):
+                self.simulate(days=1)
+
+
+class LedgerTests(TestCase):
+    def setUp(self):
+        self.wheat = make_crop_types()[0]
+        self.user = User.objects.create_user('alice')
+        self.farm = create_farm_for_user(self.user)
+        self.client.force_login(self.user)
+
+    def sell(self, quantity):
+        InventoryItem.objects.update_or_create(farm=self.farm, crop_type=self.wheat, defaults={'quantity': quantity})
+        return self.client.post(
+            reverse('sell-npc'), {'crop_type_id': self.wheat.id, 'quantity': quantity}, content_type='application/json',
+        )
+
+    def test_money_moving_views_append_entries(self):
+        self.sell(5)
+        self.client.post(reverse('plant-cell', args=[0, 0]), {'crop_type_id': self.wheat.id},
+                         content_type='application/json')
+
+        self.farm.refresh_from_db()
+        self.assertEqual(
+            list(self.farm.ledger_entries.order_by('id').values_list('reason', 'amount')),
+            [('opening', 1), ('npc_sale', 10), ('seeds', -1)],
+        )
+        self.assertEqual(balance_at(self.farm, timezone.now()), self.farm.balance)
+
+    def test_market_buy_pays_seller_without_touching_their_farm(self):
+        seller = create_farm_for_user(User.objects.create_user('bob'))
+        listing = MarketListing.objects.create(seller=seller, crop_type=self.wheat, quantity=2, unit_price=4)
+        self.sell(5)
+
+        response = self.client.post(reverse('market-buy', args=[listing.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['buyer_farm']['balance'], 11 - 8)
+        self.assertEqual(response.json()['listing']['seller_name'], seller.name)
+        # the proceeds are unsettled, so no seller balance is reported
+        self.assertNotIn('seller_farm', response.json())
+        self.assertEqual(Farm.objects.get(id=seller.id).balance, 1)
+        self.assertEqual(balance_at(seller, timezone.now()), 1 + 8)
+
+        # the seller's next balance read settles the proceeds
+        self.client.force_login(seller.user)
+        self.assertEqual(self.client.get(reverse('farm-me')).json()['balance'], 9)
+        self.assertFalse(LedgerEntry.objects.filter(settled=False).exists())
+
+    @skipUnlessDBFeature('has_select_for_update_of')
+    def test_market_buy_locks_only_the_listing(self):
+        seller = create_farm_for_user(User.objects.create_user('bob'))
+        listing = MarketListing.objects.create(seller=seller, crop_type=self.wheat, quantity=2, unit_price=4)
+        self.sell(5)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.post(reverse('market-buy', args=[listing.id])).status_code, 200)
+        locking = [query['sql'] for query in queries
+                   if 'FOR UPDATE' in query['sql'] and '"game_marketlisting"' in query['sql']]
+        self.assertEqual(len(locking), 1)
+        self.assertNotIn('JOIN', locking[0])
+
+    def test_balance_at_uses_latest_snapshot(self):
+        start = timezone.now()
+        self.sell(5)
+        self.assertEqual(take_snapshots(taken_at=timezone.now()), 1)
+        snapshot = BalanceSnapshot.objects.get(farm=self.farm)
+        self.assertEqual(snapshot.balance, 11)
+        self.sell(2)
+
+        self.assertEqual(balance_at(self.farm, start), 1)
+        self.assertEqual(balance_at(self.farm, snapshot.taken_at), 11)
+        with self.assertNumQueries(2):
+            self.assertEqual(balance_at(self.farm, timezone.now()), 15)
+
+        take_snapshots(taken_at=timezone.now())
+        self.assertEqual(BalanceSnapshot.objects.filter(farm=self.farm).latest('taken_at').balance, 15)
+
+    def test_snapshots_skip_unchanged_farms_and_prune_superseded_ones(self):
+        other = create_farm_for_user(User.objects.create_user('bob'))
+        self.assertEqual(take_snapshots(taken_at=timezone.now()), 2)
+        self.assertEqual(take_snapshots(taken_at=timezone.now()), 0)
+        self.sell(5)
+        self.assertEqual(take_snapshots(taken_at=timezone.now()), 1)
+
+        # within the retention window nothing goes; past it each farm keeps its latest
+        self.assertEqual(prune_snapshots(), 0)
+        self.assertEqual(prune_snapshots(now=timezone.now() + timedelta(days=30)), 1)
+        self.assertEqual(BalanceSnapshot.objects.get(farm=self.farm).balance, 11)
+        self.assertEqual(BalanceSnapshot.objects.get(farm=other).balance, 1)
+        self.assertEqual(balance_at(self.farm, timezone.now()), 11)
+
+
+@override_settings(GAME_REQUEST_METRICS=True)
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        invalidate_catalog()  # no crop types here, but earlier tests may have cached some
+        metrics_registry.reset()
+        self.user = User.objects.create_user('alice')
+        self.farm = create_farm_for_user(self.user)
+        create_plots(self.farm)
+        self.client.force_login(self.user)
+
+    def test_requests_are_timed_per_view(self):
+        self.client.get(reverse('farm-me'))  # a cache miss writes its counter back in several queries
+        metrics_registry.reset()
+        response = self.client.get(reverse('farm-me'))
+        # the farm-id and farm-version cache reads run the same SQL
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries, 1 repeated", total;dur=[\d.]+$')
+
+        User.objects.filter(id=self.user.id).update(is_staff=True)
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('game_request_duration_seconds_count{view="farm-me"} 1', body)
+        self.assertIn('game_request_queries_bucket{view="farm-me",le="+Inf"} 1', body)
+        self.assertIn('game_responses_total{view="farm-me",status="200"} 1', body)
+
+    async def test_sync_and_async_views_are_measured_under_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        for urlconf in ('farmers_market.urls', 'game.tests'):
+            with self.subTest(urlconf=urlconf), self.settings(ROOT_URLCONF=urlconf):
+                response = await self.async_client.get(reverse('plot-list'))
+                self.assertEqual(response.status_code, 200)
+                self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="[1-9]\d* queries')
+
+    def test_repeated_queries_are_counted(self):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for plot in Plot.objects.filter(farm=self.farm)[:3]:
+                plot.farm.name  # one farm lookup per plot
+        self.assertEqual((recorder.count, recorder.duplicates), (4, 2))
+
+    @override_settings(GAME_METRICS_TOKEN='s3cret')
+    def test_metrics_need_staff_or_the_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+
+    @override_settings(GAME_REQUEST_METRICS=False)
+    def test_disabled_by_default(self):
+        response = self.client.get(reverse('farm-me'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+
+@skipUnlessDBFeature('test_db_allows_multiple_connections')
+class ConcurrentMutationTests(TransactionTestCase):
+    threads = 8
+    requests_per_thread = 25
+
+    def setUp(self):
+        self.wheat = make_crop_types()[0]
+        self.user = User.objects.create_user('alice', password='pw')
+        self.farm = create_farm_for_user(self.user)
+        Farm.objects.filter(id=self.farm.id).update(balance=0)
+        InventoryItem.objects.create(farm=self.farm, crop_type=self.wheat, quantity=100)
+
+    def hammer(self, make_request):
+        errors = []
+
+        def worker():
+            client = Client()
+            client.force_login(self.user)
+            try:
+                for _ in range(self.requests_per_thread):
+                    response = make_request(client)
+                    if response.status_code not in (200, 400):
+                        errors.append(response.status_code)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_concurrent_sales_never_oversell_or_lose_coins(self):
+        self.hammer(lambda client: client.post(
+            reverse('sell-npc'), {'crop_type_id': self.wheat.id, 'quantity': 1}, content_type='application/json',
+        ))
+        self.farm.refresh_from_db()
+        self.assertEqual(InventoryItem.objects.get(farm=self.farm).quantity, 0)
+        self.assertEqual(self.farm.balance, 100 * self.wheat.base_price)
+
+    @override_settings(GAME_INVENTORY_WRITE_BEHIND=True)
+    def test_buffered_harvests_survive_concurrent_flushes(self):
+        ripen_plots(self.farm, self.wheat)
+        plot_ids = list(self.farm.plots.values_list('id', flat=True))
+        done = threading.Event()
+
+        def flusher():
+            try:
+                while not done.is_set():
+                    settle_inventory()
+            finally:
+                connection.close()
+
+        flushing = threading.Thread(target=flusher)
+        flushing.start()
+        try:
+            self.hammer(lambda client: client.post(reverse('harvest', args=[random.choice(plot_ids)])))
+        finally:
+            done.set()
+            flushing.join()
+        settle_inventory()
+        self.assertEqual(InventoryItem.objects.get(farm=self.farm).quantity, 100 + len(plot_ids))
+        self.assertFalse(InventoryDelta.objects.exists())
+
+    def test_concurrent_planting_never_overspends(self):
+        Farm.objects.filter(id=self.farm.id).update(balance=10 * self.wheat.seed_price)
+
+        # cells are picked at random, so threads also race to create their plots
+        self.hammer(lambda client: client.post(
+            reverse('plant-cell', args=[random.randrange(GRID_SIZE), random.randrange(GRID_SIZE)]),
+            {'crop_type_id': self.wheat.id},
+            content_type='application/json',
+        ))
+        self.farm.refresh_from_db()
+        planted = self.farm.plots.filter(crop_type__isnull=False).count()
+        self.assertEqual(planted, 10)
+        self.assertEqual(self.farm.balance, 0)
@@ -1,17 +1,29 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# the polled reads, served by async views under ASGI
+reads = async_views if settings.GAME_ASYNC_READS else views
 
 urlpatterns = [
     path('health/', views.health_check, name='health'),
-    path('farm/me/', views.farm_me, name='farm-me'),
-    path('crop-types/', views.crop_type_list, name='crop-type-list'),
-    path('plots/', views.plot_list, name='plot-list'),  
+    path('farm/me/', reads.farm_me, name='farm-me'),
+    path('farm/expand/', views.farm_expand, name='farm-expand'),
+    path('crop-types/', reads.crop_type_list, name='crop-type-list'),
+    path('plots/', reads.plot_list, name='plot-list'),
+    path('plots/plant/', views.plant_many, name='plant-many'),
+    path('plots/harvest/', views.harvest_many, name='harvest-many'),
     path('plots/<int:plot_id>/plant/', views.plant, name='plant'),
     path('plots/<int:plot_id>/harvest/', views.harvest, name='harvest'),
-    path('inventory/', views.inventory_list, name='inventory-list'),
+    path('plots/cells/<int:x>/<int:y>/plant/', views.plant_cell, name='plant-cell'),
+    path('inventory/', reads.inventory_list, name='inventory-list'),
     path('inventory/sell-npc/', views.sell_npc, name='sell-npc'),
-    path('contracts/', views.contract_list, name='contract-list'),
+    path('contracts/', reads.contract_list, name='contract-list'),
     path('contracts/<int:contract_id>/complete/', views.complete_contract, name='complete-contract'),
-    path('market/listings/', views.market_create_listing, name='market-create-listing'),
+    path('market/listings/', reads.market_create_listing, name='market-create-listing'),
     path('market/listings/<int:listing_id>/buy/', views.market_buy, name='market-buy'),
+    path('market/orders/', views.market_order, name='market-order'),
+    path('market/history/<int:crop_type_id>/', views.market_history, name='market-history'),
+    path('events/', views.event_stream, name='event-stream'),
+    path('metrics/', views.metrics, name='metrics'),
 ]
\ No newline at end of file
@@ -0,0 +1,132 @@
+"""
+Version counters behind the ETags of the polled read endpoints.
+
+Each farm has a counter that the write views bump when anything its own
+endpoints show changes (balance, plots, inventory, grid size), and the market
+has one bumped whenever a listing opens, shrinks or closes. The counters live
+in the default Django cache, which must be shared by every process (web
+workers and background commands alike; see ``game.checks``). A read endpoint
+builds its ETag from them and can answer ``304 Not Modified`` before it runs
+its main query.
+
+Counters are bumped once the writing transaction commits, and readers read
+them before reading rows, so an ETag never labels data older than its
+version. A bump replaces the counter with a fresh random value rather than
+incrementing it, so it needs no atomic increment from the cache backend, and
+a counter that is evicted restarts at a random value too: either way ETags
+issued before stop matching rather than matching again.
+
+The market epoch is a second market counter, bumped only by listing changes
+made outside the web processes (listing expiry): every process's boards and
+order books reload when it moves, since no incremental update reached them.
+"""
+import hashlib
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Farm
+
+FARM_VERSION_KEY = 'game:farm-version:%s'
+MARKET_VERSION_KEY = 'game:market-version'
+MARKET_EPOCH_KEY = 'game:market-epoch'
+FARM_ID_KEY = 'game:farm-id:%s'
+
+
+def _fresh():
+    return uuid.uuid4().int >> 80
+
+
+def _version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _fresh(), None)
+        version = cache.get(key)
+    return version
+
+
+async def _aversion(key):
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, _fresh(), None)
+        version = await cache.aget(key)
+    return version
+
+
+def _bump(key):
+    # concurrent bumps each write a value no reader has seen yet
+    cache.set(key, _fresh(), None)
+
+
+def farm_version(farm_id):
+    return _version(FARM_VERSION_KEY % farm_id)
+
+
+def market_version():
+    return _version(MARKET_VERSION_KEY)
+
+
+def market_epoch():
+    return _version(MARKET_EPOCH_KEY)
+
+
+async def afarm_version(farm_id):
+    return await _aversion(FARM_VERSION_KEY % farm_id)
+
+
+async def amarket_version():
+    return await _aversion(MARKET_VERSION_KEY)
+
+
+async def amarket_epoch():
+    return await _aversion(MARKET_EPOCH_KEY)
+
+
+def changed(farm_ids=(), market=False, reload_market=False):
+    """
+    Bump the counters for ``farm_ids`` (and the market) once the current
+    transaction commits. ``reload_market`` also bumps the market epoch, for
+    listing changes the in-process boards and order books were not told about.
+    """
+    keys = [FARM_VERSION_KEY % farm_id for farm_id in set(farm_ids)]
+    if market or reload_market:
+        keys.append(MARKET_VERSION_KEY)
+    if reload_market:
+        keys.append(MARKET_EPOCH_KEY)
+
+    def bump():
+        for key in keys:
+            _bump(key)
+
+    transaction.on_commit(bump)
+
+
+def farm_id_for_user(user):
+    """The id of ``user``'s farm, or ``None``; cached since a user's farm never changes."""
+    key = FARM_ID_KEY % user.pk
+    farm_id = cache.get(key)
+    if farm_id is None:
+        farm_id = Farm.objects.filter(user=user).values_list('id', flat=True).first()
+        if farm_id is not None:
+            cache.set(key, farm_id, None)
+    return farm_id
+
+
+async def afarm_id_for_user(user):
+    key = FARM_ID_KEY % user.pk
+    farm_id = await cache.aget(key)
+    if farm_id is None:
+        farm_id = await Farm.objects.filter(user=user).values_list('id', flat=True).afirst()
+        if farm_id is not None:
+            await cache.aset(key, farm_id, None)
+    return farm_id
+
+
+def etag(request, *versions):
+    """
+    ETag for ``request``'s URL at ``versions``. The query string is part of it,
+    since it selects fields, pages and regions.
+    """
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()[:12]
+    return '"%s"' % '-'.join([path, *map(str, versions)])
@@ -1,19 +1,54 @@
+import copy
+import heapq
+import hmac
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
+from django.utils.dateparse import parse_datetime
+from django.utils.http import parse_etags
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from django.utils import timezone
-from datetime import timedelta
+from datetime import timedelta, timezone as dt_timezone
 from rest_framework import status
 from django.contrib.auth.decorators import login_required
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import login, logout as auth_logout
-from django.db.models import F
+from django.db.models import Min
 from django.db import transaction
 
-from .models import Contract, Farm, CropType, InventoryItem, MarketListing, Plot, create_farm_for_user, ensure_contracts_for_farm
-from .serializers import ContractSerializer, FarmSerializer, CropTypeSerializer, InventoryItemSerializer, MarketListingSerializer, PlotSerializer
+from .models import (
+    MAX_GRID_SIZE, Candle, Contract, Farm, InventoryItem, LedgerEntry, MarketListing, Plot, create_farm_for_user,
+    current_contracts_for_farm, ensure_contracts_for_farm, expansion_cost,
+)
+from .board import board_add, board_listings, board_sold
+from .catalog import get_catalog, get_crop_type_or_404
+from .events import MARKET_CHANNEL, farm_channel, format_event, get_broker, publish, publish_balances
+from .grid import grid_plots, update_grid
+from .history import log_trades
+from .inventory import add_harvest, settle_farm_inventory
+from .ledger import debit, record, settle_pending
+from .listings import listing_expiry
+from .metrics import registry as metrics_registry
+from .mutations import add_inventory, credit_balance, plant_plots, take_inventory
+from .pagination import paginate
+from .pricing import npc_sale_value, record_npc_sale, record_trades
+from .orderbook import Execution, InsufficientFunds, StaleOrderBook, get_order_book, listing_closed, listing_opened, persist_trades
+from .serializers import (
+    CandleRows, ContractRows, ContractSerializer, CropTypeSerializer, FarmSerializer, InventoryItemRows,
+    InventoryItemSerializer, MarketListingRows, MarketListingSerializer, PlotRows, PlotSerializer, requested_fields,
+)
+from .versions import changed, etag, farm_id_for_user, farm_version, market_version
 
 # Create your views here.
 
@@ -25,69 +60,340 @@ def logout_view(request):
     auth_logout(request)
     return redirect('login')
 
+def _farm_etag(request, *args, **kwargs):
+    """ETag for reads of the requesting player's own farm state."""
+    if request.method not in ('GET', 'HEAD') or not request.user.is_authenticated:
+        return None
+    farm_id = farm_id_for_user(request.user)
+    if farm_id is None:
+        return None
+    return etag(request, farm_id, farm_version(farm_id))
+
+def _market_etag(request, *args, **kwargs):
+    """
+    ETag for the player's market board, which shows other farms' listings for
+    the crops of the player's open contracts.
+    """
+    if request.method not in ('GET', 'HEAD') or not request.user.is_authenticated:
+        return None
+    farm_id = farm_id_for_user(request.user)
+    if farm_id is None:
+        return None
+    version = market_version()
+    contract_crop_ids = sorted(set(
+        Contract.objects.filter(farm_id=farm_id, completed_at__isnull=True).values_list('crop_type_id', flat=True)
+    ))
+    return etag(request, farm_id, version, *contract_crop_ids)
+
+# Polled endpoints: clients revalidate with If-None-Match every time and get
+# a 304 from the version counters while nothing has changed.
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_farm_etag)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def farm_me(request):
     farm = Farm.objects.get(user=request.user)
+    if settle_pending([farm.id]):
+        farm.refresh_from_db(fields=['balance'])
     serializer = FarmSerializer(farm)
     return Response(serializer.data) 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def farm_expand(request):
+    farm = Farm.objects.get(user=request.user)
+    if farm.grid_size >= MAX_GRID_SIZE:
+        return Response({'detail': 'Farm is already at the maximum size.'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        size = int(request.data.get('size', farm.grid_size + 1))
+    except (TypeError, ValueError):
+        return Response({'detail': 'size must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+    if not farm.grid_size < size <= MAX_GRID_SIZE:
+        return Response(
+            {'detail': f'size must be between {farm.grid_size + 1} and {MAX_GRID_SIZE}.'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    cost = expansion_cost(farm.grid_size, size)
+    with transaction.atomic():
+        # grow the grid, unless another request already changed its size
+        if not Farm.objects.filter(id=farm.id, grid_size=farm.grid_size).update(grid_size=size):
+            return Response({'detail': 'Farm size changed, try again.'}, status=status.HTTP_409_CONFLICT)
+        balance = debit(farm.id, cost)
+        if balance is None:
+            transaction.set_rollback(True)
+            return Response({'detail': 'Insufficient funds to expand the farm.'}, status=status.HTTP_400_BAD_REQUEST)
+        record([LedgerEntry(farm=farm, amount=-cost, reason=LedgerEntry.Reason.EXPANSION)])
+
+    farm.grid_size = size
+    farm.balance = balance
+    changed([farm.id])
+    publish_balances([farm.id])
+    return Response(FarmSerializer(farm).data)
+
 @api_view(['GET'])
 def crop_type_list(request):
-    crops = CropType.objects.all()
-    serializer = CropTypeSerializer(crops, many=True)
-    return Response(serializer.data)
-
+    etag, payload = crop_types_payload(get_catalog(), request.query_params)
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = HttpResponse(payload, content_type='application/json')
+    response['ETag'] = etag
+    return response
+
+def crop_types_payload(catalog, params):
+    """The ETag and JSON body for the crop types, with the ``?fields=`` asked for in ``params``."""
+    fields = requested_fields(params, CropTypeSerializer.Meta.fields)
+    if fields is None:
+        return catalog.etag, catalog.payload
+    # sparse copies are cheap to build from the serialized catalog
+    etag = '"%s-%s"' % (catalog.etag.strip('"'), '.'.join(fields))
+    payload = JSONRenderer().render([
+        {name: crop[name] for name in fields} for crop in catalog.serialized.values()
+    ])
+    return etag, payload
+
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_farm_etag)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def plot_list(request):
-    farm = Farm.objects.get(user=request.user)
-    plots = Plot.objects.filter(farm=farm).order_by('y', 'x')
-    serializer = PlotSerializer(plots, many=True)
-    return Response(serializer.data)
+    farm = Farm.objects.select_related('grid').get(user=request.user)
+    try:
+        region = _parse_region(request.query_params, farm.grid_size)
+    except ValueError:
+        return Response({'detail': 'x0, y0, x1 and y1 must be integers with x0 <= x1 and y0 <= y1.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    catalog = get_catalog()
+    page = paginate(grid_plots(farm, region=region, catalog=catalog), request.query_params, ('y', 'x'))
+    return Response(page.body(PlotRows(request, catalog).data_from_objects(page.rows)))
+
+def _parse_region(params, size, span=None):
+    """
+    Return the inclusive ``(x0, y0, x1, y1)`` rectangle in the ``x0``..``y1``
+    query parameters, clipped to a ``size`` grid. Missing lower bounds are 0;
+    missing upper bounds cover ``span`` cells, or the rest of the grid. Raises
+    ValueError for non-integers or a rectangle with no cells in the grid.
+    """
+    x0 = max(int(params.get('x0', 0)), 0)
+    y0 = max(int(params.get('y0', 0)), 0)
+    x1 = min(int(params.get('x1', x0 + span - 1 if span else size - 1)), size - 1)
+    y1 = min(int(params.get('y1', y0 + span - 1 if span else size - 1)), size - 1)
+    if x0 > x1 or y0 > y1:
+        raise ValueError
+    return x0, y0, x1, y1
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def plant(request, plot_id):
     farm = Farm.objects.get(user=request.user)
     plot = get_object_or_404(Plot, id=plot_id, farm=farm)
-    
-    if plot.crop_type is not None:
+    return _plant(request, farm, plot)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def plant_cell(request, x, y):
+    farm = Farm.objects.get(user=request.user)
+    if x >= farm.grid_size or y >= farm.grid_size:
+        return Response({'detail': 'Cell is outside the farm.'}, status=status.HTTP_404_NOT_FOUND)
+    # a cell that has never been planted gets its row once the plant is paid for
+    plot = Plot.objects.filter(farm=farm, x=x, y=y).first() or Plot(farm=farm, x=x, y=y)
+    return _plant(request, farm, plot)
+
+def _plant(request, farm, plot):
+    if plot.crop_type_id is not None:
         return Response({'detail': 'Plot is already planted.'}, status=status.HTTP_400_BAD_REQUEST)
     
     crop_type_id = request.data.get('crop_type_id')
     if crop_type_id is None:
         return Response({'detail': 'crop_type_id is required.'}, status=status.HTTP_400_BAD_REQUEST)
     
-    crop_type = get_object_or_404(CropType, id=crop_type_id)
+    crop_type = get_crop_type_or_404(crop_type_id)
 
     if farm.unlocked_crops.exists() and not farm.unlocked_crops.filter(id=crop_type.id).exists():
         return Response({'detail': 'Seed not unlocked'}, status=status.HTTP_403_FORBIDDEN)
 
-    if farm.balance < crop_type.seed_price:
-        return Response({'detail': 'Insufficient funds to plant this crop.'}, status=status.HTTP_400_BAD_REQUEST)
-    
-    # pay for seed
-    farm.balance -= crop_type.seed_price
-    farm.save()
-
-    # plant crop
     now = timezone.now()
-    plot.crop_type = crop_type
-    plot.planted_at = now
-    plot.harvest_ready_at = now + timedelta(seconds=crop_type.grow_time_seconds)
-    plot.save()
+    ready_at = now + timedelta(seconds=crop_type.grow_time_seconds)
+    with transaction.atomic():
+        # pay for seed
+        if debit(farm.id, crop_type.seed_price) is None:
+            return Response({'detail': 'Insufficient funds to plant this crop.'}, status=status.HTTP_400_BAD_REQUEST)
+        record([LedgerEntry(farm=farm, amount=-crop_type.seed_price, reason=LedgerEntry.Reason.SEEDS)])
+
+        if plot.pk is None:
+            plot.pk = Plot.objects.get_or_create(farm=farm, x=plot.x, y=plot.y)[0].pk
+
+        # plant crop, unless another request got there first
+        planted = Plot.objects.filter(id=plot.id, crop_type__isnull=True).update(
+            crop_type=crop_type, planted_at=now, harvest_ready_at=ready_at,
+        )
+        if not planted:
+            transaction.set_rollback(True)
+            return Response({'detail': 'Plot is already planted.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        plot.crop_type = crop_type
+        plot.planted_at = now
+        plot.harvest_ready_at = ready_at
+        update_grid(farm.id, [plot])
 
     serializer = PlotSerializer(plot)
+    changed([farm.id])
+    publish_balances([farm.id])
+    publish(farm_channel(farm.id), 'plots', [serializer.data])
     return Response(serializer.data, status=status.HTTP_200_OK)
 
+def _create_missing_plots(farm, limit):
+    """
+    Create rows for up to ``limit`` of the farm's cells that have none yet, in
+    row order, and return how many were attempted.
+    """
+    used = set(Plot.objects.filter(farm=farm).values_list('x', 'y'))
+    size = farm.grid_size
+    missing = list(islice(
+        (Plot(farm=farm, x=x, y=y) for y in range(size) for x in range(size) if (x, y) not in used), limit,
+    ))
+    # a concurrent request may create some of the same cells
+    Plot.objects.bulk_create(missing, ignore_conflicts=True)
+    return len(missing)
+
+def _parse_plot_ids(value):
+    """
+    Return the list of plot ids in ``value``, ``None`` for "all", or raise
+    ValueError if it is neither.
+    """
+    if value == 'all':
+        return None
+    if not isinstance(value, list) or not value:
+        raise ValueError
+    return [int(plot_id) for plot_id in value]
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def plant_many(request):
+    farm = Farm.objects.get(user=request.user)
+
+    crop_type_id = request.data.get('crop_type_id')
+    if crop_type_id is None:
+        return Response({'detail': 'crop_type_id is required.'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        plot_ids = _parse_plot_ids(request.data.get('plot_ids', 'all'))
+    except (TypeError, ValueError):
+        return Response({'detail': 'plot_ids must be a list of ids or "all".'}, status=status.HTTP_400_BAD_REQUEST)
+
+    crop_type = get_crop_type_or_404(crop_type_id)
+
+    if farm.unlocked_crops.exists() and not farm.unlocked_crops.filter(id=crop_type.id).exists():
+        return Response({'detail': 'Seed not unlocked'}, status=status.HTTP_403_FORBIDDEN)
+
+    settle_pending([farm.id])
+
+    # plant as many of the requested plots as the farm can pay for
+    balance = Farm.objects.values_list('balance', flat=True).get(id=farm.id)
+    affordable = balance // crop_type.seed_price if crop_type.seed_price else farm.grid_size ** 2
+
+    empty = Plot.objects.filter(farm=farm, crop_type__isnull=True).order_by('y', 'x')
+    if plot_ids is not None:
+        empty = empty.filter(id__in=plot_ids)
+    plots = list(empty)
+    # "all" includes cells that have never been planted and have no rows yet
+    if plot_ids is None and len(plots) < affordable and _create_missing_plots(farm, affordable - len(plots)):
+        plots = list(empty.all())
+    if not plots:
+        return Response({'detail': 'No empty plots to plant.'}, status=status.HTTP_400_BAD_REQUEST)
+    plots = plots[:affordable]
+    if not plots:
+        return Response({'detail': 'Insufficient funds to plant this crop.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    now = timezone.now()
+    ready_at = now + timedelta(seconds=crop_type.grow_time_seconds)
+    with transaction.atomic():
+        # plant crops, except on plots another request got to first
+        planted = set(plant_plots([plot.id for plot in plots], crop_type.id, now, ready_at))
+        plots = [plot for plot in plots if plot.id in planted]
+        if not plots:
+            return Response({'detail': 'No empty plots to plant.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # pay for seeds, unless a concurrent spend has left too little since the balance was read
+        cost = crop_type.seed_price * len(plots)
+        balance = debit(farm.id, cost)
+        if balance is None:
+            transaction.set_rollback(True)
+            return Response({'detail': 'Insufficient funds to plant this crop.'}, status=status.HTTP_400_BAD_REQUEST)
+        record([LedgerEntry(farm=farm, amount=-cost, reason=LedgerEntry.Reason.SEEDS)])
+
+        for plot in plots:
+            plot.crop_type = crop_type
+            plot.planted_at = now
+            plot.harvest_ready_at = ready_at
+        update_grid(farm.id, plots)
+
+    plot_data = PlotSerializer(plots, many=True).data
+    changed([farm.id])
+    publish_balances([farm.id])
+    publish(farm_channel(farm.id), 'plots', plot_data)
+    return Response({
+        'plots': plot_data,
+        'balance': balance,
+    })
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def harvest_many(request):
+    farm = Farm.objects.get(user=request.user)
+
+    try:
+        plot_ids = _parse_plot_ids(request.data.get('plot_ids', 'all'))
+    except (TypeError, ValueError):
+        return Response({'detail': 'plot_ids must be a list of ids or "all".'}, status=status.HTTP_400_BAD_REQUEST)
+
+    with transaction.atomic():
+        plots = Plot.objects.select_for_update().filter(
+            farm=farm,
+            crop_type__isnull=False,
+            harvest_ready_at__lte=timezone.now(),
+        )
+        if plot_ids is not None:
+            plots = plots.filter(id__in=plot_ids)
+        plots = list(plots.order_by('y', 'x'))
+        if not plots:
+            return Response({'detail': 'No crops are ready for harvest.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        harvested = {}
+        for plot in plots:
+            harvested[plot.crop_type_id] = harvested.get(plot.crop_type_id, 0) + 1
+
+        # add harvested crops to inventory, one increment per crop type
+        items = add_harvest(farm, harvested)
+
+        # clear plots
+        for plot in plots:
+            plot.crop_type = None
+            plot.planted_at = None
+            plot.harvest_ready_at = None
+        Plot.objects.bulk_update(plots, ['crop_type', 'planted_at', 'harvest_ready_at'])
+        update_grid(farm.id, plots)
+
+    plot_data = PlotSerializer(plots, many=True).data
+    item_data = InventoryItemSerializer(items, many=True).data
+    changed([farm.id])
+    publish(farm_channel(farm.id), 'plots', plot_data)
+    publish(farm_channel(farm.id), 'inventory', item_data)
+    return Response({
+        'plots': plot_data,
+        'inventory_items': item_data,
+    })
+
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_farm_etag)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def inventory_list(request):
     farm = Farm.objects.get(user=request.user)
-    items = farm.inventory.all()
-    serializer = InventoryItemSerializer(items, many=True)
-    return Response(serializer.data)
+    settle_farm_inventory(farm.id)
+    rows = InventoryItemRows(request)
+    page = paginate(rows.values(farm.inventory.all(), 'crop_type_id'), request.query_params, ('crop_type_id',))
+    return Response(page.body(rows.data(page.rows)))
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -98,22 +404,32 @@ def harvest(request, plot_id):
     if not plot.is_ready():
         return Response({'detail': 'Crop is not ready for harvest.'}, status=status.HTTP_400_BAD_REQUEST)
     
-    crop_type = plot.crop_type
-
-    # add 1 of crop to inventory
-    item, _ = InventoryItem.objects.get_or_create(farm=farm, crop_type=crop_type)
-    item.quantity += 1
-    item.save()
-
-    # clear plot
-    plot.crop_type = None
-    plot.planted_at = None
-    plot.harvest_ready_at = None
-    plot.save()
+    crop_type_id = plot.crop_type_id
 
+    with transaction.atomic():
+        # clear plot, unless another request already harvested it
+        cleared = Plot.objects.filter(id=plot.id, crop_type_id=crop_type_id, harvest_ready_at__lte=timezone.now()).update(
+            crop_type=None, planted_at=None, harvest_ready_at=None,
+        )
+        if not cleared:
+            return Response({'detail': 'Crop is not ready for harvest.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # add 1 of crop to inventory
+        item, = add_harvest(farm, {crop_type_id: 1})
+
+        plot.crop_type = None
+        plot.planted_at = None
+        plot.harvest_ready_at = None
+        update_grid(farm.id, [plot])
+
+    plot_data = PlotSerializer(plot).data
+    item_data = InventoryItemSerializer(item).data
+    changed([farm.id])
+    publish(farm_channel(farm.id), 'plots', [plot_data])
+    publish(farm_channel(farm.id), 'inventory', [item_data])
     return Response({
-        'plot': PlotSerializer(plot).data,
-        'inventory_item': InventoryItemSerializer(item).data,
+        'plot': plot_data,
+        'inventory_item': item_data,
     })
 
 @api_view(['POST'])
@@ -133,70 +449,124 @@ def sell_npc(request):
     if quantity <= 0:
         return Response({'detail': 'quantity must be positive'}, status=status.HTTP_400_BAD_REQUEST)
     
-    crop_type = get_object_or_404(CropType, id=crop_type_id)
-    item = get_object_or_404(InventoryItem, farm=farm, crop_type=crop_type)
-
-    if quantity > item.quantity:
-        return Response({'detail': 'Insufficient quantity in inventory'}, status=status.HTTP_400_BAD_REQUEST)
-    
-    # update inventory
-    item.quantity -= quantity
-    item.save()
-
-    # pay coins
-    coins = quantity * crop_type.base_price
-    farm.balance += coins
-    farm.save()
+    crop_type = get_crop_type_or_404(crop_type_id)
+    coins = npc_sale_value(crop_type, quantity)
+    settle_farm_inventory(farm.id)
 
+    with transaction.atomic():
+        # update inventory
+        taken = take_inventory(farm.id, crop_type.id, quantity)
+        if taken is None:
+            get_object_or_404(InventoryItem, farm=farm, crop_type=crop_type)
+            return Response({'detail': 'Insufficient quantity in inventory'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # pay coins
+        farm.balance = credit_balance(farm.id, coins)
+        record([LedgerEntry(farm=farm, amount=coins, reason=LedgerEntry.Reason.NPC_SALE)])
+        transaction.on_commit(lambda: record_npc_sale(crop_type.id, quantity))
+
+    item = InventoryItem(id=taken[0], farm=farm, crop_type=crop_type, quantity=taken[1])
+
+    item_data = InventoryItemSerializer(item).data
+    changed([farm.id])
+    publish_balances([farm.id])
+    publish(farm_channel(farm.id), 'inventory', [item_data])
     return Response({
         'earned_coins': coins,
         'balance': farm.balance,
-        'inventory_item': InventoryItemSerializer(item).data,
+        'inventory_item': item_data,
     })
 
-GRID_SIZE = 5
-
-@login_required
-def home(request):
+# Side of the part of the grid the home page renders at once; larger farms pan.
+HOME_VIEWPORT = 12
+
+# Upper bound on queries for a steady-state home page load (session and user
+# lookups included, and the catalog-version and market-epoch reads, which are
+# queries on the default database cache). game.tests.HomeQueryBudgetTests fails
+# if it is exceeded.
+HOME_QUERY_BUDGET = 10
+
+def contracts_for_farm(farm, catalog=None):
+    """
+    The farm's current contracts. With the contract scheduler running this is
+    a pure read; otherwise expired contracts are rotated here, on request.
+    """
+    if settings.GAME_CONTRACT_SCHEDULER:
+        return current_contracts_for_farm(farm, catalog=catalog)
+    return ensure_contracts_for_farm(farm, catalog=catalog)
+
+def _get_home_farm(user):
+    farms = Farm.objects.select_related('grid').prefetch_related('unlocked_crops')
     try:
-        farm = Farm.objects.get(user=request.user)
+        return farms.get(user=user)
     except Farm.DoesNotExist:
-        farm = create_farm_for_user(request.user)
-    plots = farm.plots.all().order_by('y', 'x')
-    inventory = farm.inventory.select_related('crop_type')
-    crop_types = list(farm.unlocked_crops.all() or CropType.objects.all())
-    contracts = ensure_contracts_for_farm(farm)
-
+        create_farm_for_user(user)
+        return farms.get(user=user)
+
+def build_home_context(farm, region=None):
+    """
+    Load everything the home page renders for ``farm`` with a fixed number of
+    queries: plots come from the farm's packed grid, inventory comes with its
+    crop types joined in, contracts take their crop types from the catalog,
+    and market listings for the open contracts come from the shared board.
+
+    Only the ``region`` of the grid in view is decoded, by default the
+    top-left ``HOME_VIEWPORT`` square.
+    """
+    x0, y0, x1, y1 = region or _parse_region({}, farm.grid_size, HOME_VIEWPORT)
+    # one read of the catalog version for the whole page
+    catalog = get_catalog()
+    plots = grid_plots(farm, region=(x0, y0, x1, y1), catalog=catalog)
+    inventory = list(farm.inventory.select_related('crop_type'))
+    # copies, since the catalog's instances are shared and we annotate these
+    crop_types = list(farm.unlocked_crops.all()) or [copy.copy(crop) for crop in catalog.crop_types]
+    contracts = contracts_for_farm(farm, catalog)
+
+    # cells that have never been planted have no row; show them as empty plots
     plot_map = {(plot.x, plot.y): plot for plot in plots}
     grid = []
-    for y in range(GRID_SIZE):
+    for y in range(y0, y1 + 1):
         row = []
-        for x in range(GRID_SIZE):
-            row.append(plot_map.get((x, y)))
+        for x in range(x0, x1 + 1):
+            row.append(plot_map.get((x, y)) or Plot(farm=farm, x=x, y=y))
         grid.append(row)
 
-    contract_crop_ids = list(
-        Contract.objects.filter(farm=farm, completed_at__isnull=True)
-        .values_list('crop_type_id', flat=True)
-        .distinct()
-    )
+    # query strings for the neighbouring viewports, if there are any
+    width, height = x1 - x0 + 1, y1 - y0 + 1
+    pan = {
+        'left': f'?x0={max(x0 - width, 0)}&y0={y0}' if x0 else None,
+        'right': f'?x0={x0 + width}&y0={y0}' if x1 < farm.grid_size - 1 else None,
+        'up': f'?x0={x0}&y0={max(y0 - height, 0)}' if y0 else None,
+        'down': f'?x0={x0}&y0={y0 + height}' if y1 < farm.grid_size - 1 else None,
+    }
+    expansion = None
+    if farm.grid_size < MAX_GRID_SIZE:
+        expansion = {'size': farm.grid_size + 1, 'cost': expansion_cost(farm.grid_size, farm.grid_size + 1)}
+
+    # the open contracts are all in the current batch
+    contract_crop_ids = list(dict.fromkeys(
+        contract.crop_type_id for contract in contracts if contract.completed_at is None
+    ))
     inventory_map = {item.crop_type_id: item.quantity for item in inventory}
     for crop in crop_types:
         crop.available_quantity = inventory_map.get(crop.id, 0)
 
-    market_listings = MarketListing.objects.filter(
-        active=True,
-        quantity__gt=0,
-        crop_type_id__in=contract_crop_ids,
-    ).exclude(seller=farm).select_related('crop_type', 'seller').annotate(
-        total_price=F('quantity') * F('unit_price')
-    ).order_by('unit_price')
+    market_listings = []
+    for row in board_listings(contract_crop_ids, exclude_seller=farm.id):
+        listing = MarketListing(
+            id=row['id'], seller_id=row['seller_id'], crop_type=catalog.by_id.get(row['crop_type_id']),
+            quantity=row['quantity'], unit_price=row['unit_price'], active=True, created_at=row['created_at'],
+        )
+        listing.total_price = listing.quantity * listing.unit_price
+        market_listings.append(listing)
 
-    context = {
+    return {
         'farm': farm,
-        'user': request.user,
         'grid': grid,
-        'grid_size': GRID_SIZE,
+        'grid_size': farm.grid_size,
+        'grid_columns': width,
+        'pan': pan,
+        'expansion': expansion,
         'inventory': inventory,
         'crop_types': crop_types,
         'contracts': contracts,
@@ -204,15 +574,28 @@ def home(request):
         'contract_crop_ids': contract_crop_ids,
         'inventory_map': inventory_map,
     }
+
+@login_required
+def home(request):
+    farm = _get_home_farm(request.user)
+    if settle_pending([farm.id]):
+        farm.refresh_from_db(fields=['balance'])
+    settle_farm_inventory(farm.id)
+    try:
+        region = _parse_region(request.GET, farm.grid_size, HOME_VIEWPORT)
+    except ValueError:
+        region = None
+    context = build_home_context(farm, region)
+    context['user'] = request.user
     return render(request, 'game/home.html', context)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def contract_list(request):
     farm = Farm.objects.get(user=request.user)
-    contracts = ensure_contracts_for_farm(farm)
-    serializer = ContractSerializer(contracts, many=True)
-    return Response(serializer.data)
+    catalog = get_catalog()
+    contracts = contracts_for_farm(farm, catalog)
+    return Response(ContractRows(request, catalog).data_from_objects(contracts))
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -226,28 +609,36 @@ def complete_contract(request, contract_id):
     if contract.is_expired:
         return Response({'detail': 'Contract has expired.'}, status=status.HTTP_400_BAD_REQUEST)
 
-    # check inventory
-    item = InventoryItem.objects.filter(farm=farm, crop_type=contract.crop_type).first()
+    now = timezone.now()
+    settle_farm_inventory(farm.id)
+    with transaction.atomic():
+        # mark completed, unless another request already did
+        completed = Contract.objects.filter(id=contract.id, completed_at__isnull=True, expires_at__gt=now).update(
+            completed_at=now,
+        )
+        if not completed:
+            return Response({'detail': 'Contract is already completed.'}, status=status.HTTP_400_BAD_REQUEST)
 
-    if item is None or item.quantity < contract.quantity_required:
-        return Response({'detail': 'Insufficient crops in inventory to complete contract.'}, status=status.HTTP_400_BAD_REQUEST)
-    
-    # consume crops
-    item.quantity -= contract.quantity_required
-    item.save()
+        # consume crops
+        taken = take_inventory(farm.id, contract.crop_type_id, contract.quantity_required)
+        if taken is None:
+            transaction.set_rollback(True)
+            return Response({'detail': 'Insufficient crops in inventory to complete contract.'}, status=status.HTTP_400_BAD_REQUEST)
 
-    # reward coins
-    farm.balance += contract.reward_coins
-    farm.save()
+        # reward coins
+        farm.balance = credit_balance(farm.id, contract.reward_coins)
+        record([LedgerEntry(farm=farm, amount=contract.reward_coins, reason=LedgerEntry.Reason.CONTRACT)])
 
-    # unlock crop if applicable
-    if contract.unlocks_crop and not farm.unlocked_crops.filter(id=contract.unlocks_crop.id).exists():
-        farm.unlocked_crops.add(contract.unlocks_crop)
+        # unlock crop if applicable
+        if contract.unlocks_crop_id is not None:
+            farm.unlocked_crops.add(contract.unlocks_crop_id)
 
-    # mark completed
-    contract.completed_at = timezone.now()
-    contract.save()
+    contract.completed_at = now
+    item = InventoryItem(id=taken[0], farm=farm, crop_type_id=contract.crop_type_id, quantity=taken[1])
 
+    changed([farm.id])
+    publish_balances([farm.id])
+    publish(farm_channel(farm.id), 'inventory', [InventoryItemSerializer(item).data])
     return Response({
         'farm': FarmSerializer(farm).data,
         'contract': ContractSerializer(contract).data,
@@ -271,6 +662,8 @@ def signup(request):
         form = SignUpForm()
     return render(request, 'registration/signup.html', {'form': form})
 
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_market_etag)
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
 def market_create_listing(request):
@@ -282,13 +675,9 @@ def market_create_listing(request):
             .values_list('crop_type_id', flat=True)
             .distinct()
         )
-        listings = MarketListing.objects.filter(
-            active=True,
-            quantity__gt=0,
-            crop_type_id__in=contract_crop_ids,
-        ).exclude(seller=farm).select_related('crop_type', 'seller').order_by('unit_price')
-        serializer = MarketListingSerializer(listings, many=True)
-        return Response(serializer.data)
+        listings = board_listings(contract_crop_ids, exclude_seller=farm.id)
+        page = paginate(listings, request.query_params, ('unit_price', 'id'))
+        return Response(page.body(MarketListingRows(request).data(page.rows)))
 
     crop_type_id = request.data.get('crop_type_id')
     quantity = request.data.get('quantity')
@@ -315,7 +704,8 @@ def market_create_listing(request):
             status=status.HTTP_400_BAD_REQUEST,
         )
 
-    crop_type = get_object_or_404(CropType, id=crop_type_id)
+    crop_type = get_crop_type_or_404(crop_type_id)
+    settle_farm_inventory(farm.id)
 
     with transaction.atomic():
         item = InventoryItem.objects.select_for_update().filter(farm=farm, crop_type=crop_type).first()
@@ -336,8 +726,14 @@ def market_create_listing(request):
             quantity=quantity,
             unit_price=unit_price,
             active=True,
+            expires_at=listing_expiry(),
         )
+        transaction.on_commit(lambda: listing_opened(listing))
+        transaction.on_commit(lambda: board_add(listing))
 
+    changed([farm.id], market=True)
+    publish(farm_channel(farm.id), 'inventory', [InventoryItemSerializer(item).data])
+    publish(MARKET_CHANNEL, 'market', {'crop_type_id': crop_type.id})
     return Response(MarketListingSerializer(listing).data, status=status.HTTP_201_CREATED)
 
 @api_view(['POST'])
@@ -346,7 +742,8 @@ def market_buy(request, listing_id):
     buyer_farm = Farm.objects.get(user=request.user)
 
     with transaction.atomic():
-        listing = MarketListing.objects.select_for_update().select_related('seller', 'crop_type').filter(
+        # lock the listing only: joining its seller or crop type would lock those rows too
+        listing = MarketListing.objects.select_for_update(of=('self',)).filter(
             id=listing_id,
             active=True,
         ).first()
@@ -364,33 +761,245 @@ def market_buy(request, listing_id):
         quantity = listing.quantity
         total_price = quantity * listing.unit_price
 
-        buyer_farm = Farm.objects.select_for_update().get(id=buyer_farm.id)
-
-        if buyer_farm.balance < total_price:
+        balance = debit(buyer_farm.id, total_price)
+        if balance is None:
             return Response({'detail': 'Not enough coins'},
                             status=status.HTTP_400_BAD_REQUEST)
+        buyer_farm.balance = balance
 
-        buyer_farm.balance -= total_price
-        buyer_farm.save()
+        # the seller is paid through the ledger, without touching their Farm row
+        record([
+            LedgerEntry(farm=buyer_farm, amount=-total_price, reason=LedgerEntry.Reason.MARKET_PURCHASE),
+            LedgerEntry(farm_id=listing.seller_id, amount=total_price, reason=LedgerEntry.Reason.MARKET_SALE,
+                        settled=False),
+        ])
 
-        seller_farm = Farm.objects.select_for_update().get(id=listing.seller_id)
-        seller_farm.balance += total_price
-        seller_farm.save()
-
-        item, _ = InventoryItem.objects.select_for_update().get_or_create(
-            farm=buyer_farm,
-            crop_type=listing.crop_type,
-            defaults={'quantity': 0},
-        )
-        item.quantity += quantity
-        item.save()
+        item_id, item_quantity = add_inventory(buyer_farm.id, listing.crop_type_id, quantity)
+        log_trades([Execution(buyer_farm.id, listing.crop_type_id, listing.id, listing.seller_id, quantity,
+                          listing.unit_price)])
+        item = InventoryItem(id=item_id, farm=buyer_farm, crop_type_id=listing.crop_type_id, quantity=item_quantity)
 
         listing.quantity = 0
         listing.active = False
         listing.save()
-
+        transaction.on_commit(lambda: listing_closed(listing.crop_type_id, listing.id))
+        transaction.on_commit(lambda: board_sold(listing.crop_type_id, listing.id, quantity))
+        transaction.on_commit(lambda: record_trades([(listing.crop_type_id, quantity, listing.unit_price)]))
+
+    item_data = InventoryItemSerializer(item).data
+    # for the listing's seller_name, read without a lock
+    listing.seller = Farm.objects.only('id', 'name').get(id=listing.seller_id)
+    changed([buyer_farm.id, listing.seller_id], market=True)
+    publish_balances([buyer_farm.id])
+    publish(farm_channel(buyer_farm.id), 'inventory', [item_data])
+    publish(MARKET_CHANNEL, 'market', {'crop_type_id': listing.crop_type_id})
     return Response({
         'listing': MarketListingSerializer(listing).data,
         'buyer_farm': FarmSerializer(buyer_farm).data,
-        'seller_farm': FarmSerializer(seller_farm).data,
+        'inventory_item': item_data,
+    })
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def market_order(request):
+    """
+    Buy ``quantity`` units of a crop at the best prices on the market,
+    optionally capped at ``limit_price`` per unit. Whatever cannot be filled
+    immediately is cancelled.
+    """
+    farm = Farm.objects.get(user=request.user)
+    crop_type_id = request.data.get('crop_type_id')
+    quantity = request.data.get('quantity')
+    limit_price = request.data.get('limit_price')
+
+    if crop_type_id is None or quantity is None:
+        return Response({'detail': 'crop_type_id and quantity are required'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        quantity = int(quantity)
+        limit_price = int(limit_price) if limit_price is not None else None
+    except ValueError:
+        return Response({'detail': 'quantity and limit_price must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    if quantity <= 0 or (limit_price is not None and limit_price <= 0):
+        return Response({'detail': 'quantity and limit_price must be positive'}, status=status.HTTP_400_BAD_REQUEST)
+
+    crop_type = get_crop_type_or_404(crop_type_id)
+    book = get_order_book(crop_type.id)
+    if settle_pending([farm.id]):
+        farm.refresh_from_db(fields=['balance'])
+
+    for attempt in range(2):
+        fills = book.match(quantity, limit_price=limit_price, budget=farm.balance, exclude_seller=farm.id)
+        if not fills:
+            return Response({'detail': 'No listings match this order'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            persist_trades([Execution(farm.id, crop_type.id, *fill) for fill in fills])
+            break
+        except StaleOrderBook:
+            # another process traded against these listings; resync and retry
+            book.load()
+        except InsufficientFunds:
+            book.restore(fills)
+            return Response({'detail': 'Not enough coins'}, status=status.HTTP_400_BAD_REQUEST)
+        farm.refresh_from_db(fields=['balance'])
+    else:
+        return Response({'detail': 'Market changed, please retry'}, status=status.HTTP_409_CONFLICT)
+
+    for fill in fills:
+        board_sold(crop_type.id, fill.listing_id, fill.quantity)
+    farm.refresh_from_db(fields=['balance'])
+    item = InventoryItem.objects.select_related('crop_type').get(farm=farm, crop_type=crop_type)
+    item_data = InventoryItemSerializer(item).data
+    changed([farm.id, *(fill.seller_id for fill in fills)], market=True)
+    publish_balances([farm.id])
+    publish(farm_channel(farm.id), 'inventory', [item_data])
+    publish(MARKET_CHANNEL, 'market', {'crop_type_id': crop_type.id})
+    return Response({
+        'fills': [
+            {'listing_id': fill.listing_id, 'quantity': fill.quantity, 'unit_price': fill.unit_price}
+            for fill in fills
+        ],
+        'quantity': sum(fill.quantity for fill in fills),
+        'total_price': sum(fill.quantity * fill.unit_price for fill in fills),
+        'buyer_farm': FarmSerializer(farm).data,
+        'inventory_item': item_data,
     })
+
+HISTORY_DEFAULT_CANDLES = 200
+HISTORY_MAX_CANDLES = 1000
+
+def _parse_time(params, name):
+    """The ISO 8601 datetime in query parameter ``name``, or ``None``; naive ones are UTC. Raises ValueError."""
+    value = params.get(name)
+    if value is None:
+        return None
+    when = parse_datetime(value)
+    if when is None:
+        raise ValueError(value)
+    return when if timezone.is_aware(when) else timezone.make_aware(when, dt_timezone.utc)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def market_history(request, crop_type_id):
+    """
+    OHLC candles of a crop's market trades, oldest first, read from the
+    rollups in game.history. ``interval`` is 1m, 1h (the default) or 1d; the
+    latest ``limit`` candles starting at or after ``since`` and before
+    ``until`` are returned. The current minute appears once it is rolled up.
+    """
+    crop_type = get_crop_type_or_404(crop_type_id)
+    params = request.query_params
+    interval = params.get('interval', Candle.Interval.HOUR)
+    if interval not in Candle.Interval.values:
+        return Response({'detail': f'interval must be one of {", ".join(Candle.Interval.values)}.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = min(int(params.get('limit', HISTORY_DEFAULT_CANDLES)), HISTORY_MAX_CANDLES)
+        since = _parse_time(params, 'since')
+        until = _parse_time(params, 'until')
+    except ValueError:
+        return Response({'detail': 'limit must be an integer and since and until ISO 8601 datetimes.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if limit <= 0:
+        return Response({'detail': 'limit must be positive'}, status=status.HTTP_400_BAD_REQUEST)
+
+    candles = Candle.objects.filter(crop_type_id=crop_type.id, interval=interval)
+    if since is not None:
+        candles = candles.filter(starts_at__gte=since)
+    if until is not None:
+        candles = candles.filter(starts_at__lt=until)
+    rows = CandleRows(request)
+    latest = list(rows.values(candles.order_by('-starts_at'))[:limit])
+    return Response(rows.data(reversed(latest)))
+
+EVENT_STREAM_MAX_SECONDS = 300
+EVENT_STREAM_KEEPALIVE_SECONDS = 15
+
+async def event_stream(request):
+    """
+    Server-Sent Events stream of live updates for the signed-in farm: balance,
+    inventory and plot changes, market activity, plot readiness and contract
+    rotation. Only served under ASGI, where an idle stream holds no thread;
+    the client falls back to polling otherwise.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse('Live updates require an ASGI server.', status=status.HTTP_501_NOT_IMPLEMENTED)
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+    farm = await Farm.objects.select_related('grid').aget(user=user)
+
+    response = StreamingHttpResponse(_farm_events(farm), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def _rotate_contracts(farm):
+    contracts = contracts_for_farm(farm)
+    expires_at = min((contract.expires_at for contract in contracts), default=None)
+    return ContractSerializer(contracts, many=True).data, expires_at
+
+async def _farm_events(farm):
+    subscription = get_broker().subscribe([farm_channel(farm.id), MARKET_CHANNEL])
+    try:
+        now = timezone.now()
+        deadline = now + timedelta(seconds=EVENT_STREAM_MAX_SECONDS)
+        ready = [
+            (plot.harvest_ready_at, plot.id) for plot in await sync_to_async(grid_plots)(farm, now)
+            if plot.harvest_ready_at is not None and not plot.ready
+        ]
+        heapq.heapify(ready)
+        contracts_expire_at = (
+            await Contract.objects.filter(farm=farm, expires_at__gt=now).aaggregate(next=Min('expires_at'))
+        )['next']
+
+        # ask the browser to reconnect quickly when the stream is recycled
+        yield 'retry: 3000\n\n'
+        while True:
+            now = timezone.now()
+            if now >= deadline:
+                break
+
+            while ready and ready[0][0] <= now:
+                _, plot_id = heapq.heappop(ready)
+                yield format_event('plot_ready', {'plot_id': plot_id})
+
+            if contracts_expire_at is not None and contracts_expire_at <= now:
+                contracts, contracts_expire_at = await sync_to_async(_rotate_contracts)(farm)
+                yield format_event('contracts', contracts)
+
+            wake_at = min(filter(None, [
+                deadline,
+                now + timedelta(seconds=EVENT_STREAM_KEEPALIVE_SECONDS),
+                ready[0][0] if ready else None,
+                contracts_expire_at,
+            ]))
+            message = await subscription.get((wake_at - now).total_seconds())
+            if message is None:
+                yield ': keepalive\n\n'
+                continue
+
+            event, data = message
+            if event == 'plots':
+                for plot in data:
+                    if plot['harvest_ready_at']:
+                        heapq.heappush(ready, (parse_datetime(plot['harvest_ready_at']), plot['id']))
+            yield format_event(event, data)
+    finally:
+        subscription.close()
+
+def metrics(request):
+    """
+    Request metrics of this process in the Prometheus text format, for staff
+    users or a scraper sending ``Authorization: Bearer <GAME_METRICS_TOKEN>``.
+    """
+    if not settings.GAME_REQUEST_METRICS:
+        raise Http404
+    token = settings.GAME_METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    if not (
+        request.user.is_staff
+        or token and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode())
+    ):
+        raise PermissionDenied
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')